@@ -0,0 +1,25 @@
+# Réponses du modèle enregistrées : le benchmark tourne hors ligne, sans clé d'API
+
+CANNED_RESPONSES = {
+    'colonne': "Je calcule le chiffre d'affaires TTC de chaque ligne dans une nouvelle colonne.\n"
+               "[CODE]\n"
+               "def process_data(df):\n"
+               "    df['total_ttc'] = (df['total'] * 1.2).round(2)\n"
+               "    return df\n"
+               "[/CODE]",
+    'filtre': "Je garde uniquement les commandes actives de plus de 50 unités.\n"
+              "[CODE]\n"
+              "def process_data(df):\n"
+              "    return df[(df['quantité'] > 50) & (df['actif'])]\n"
+              "[/CODE]",
+    'tri': "Je trie le tableau par total décroissant.\n"
+           "[CODE]\n"
+           "def process_data(df):\n"
+           "    return df.sort_values('total', ascending=False).reset_index(drop=True)\n"
+           "[/CODE]",
+    'agregat': "Je calcule le total des ventes par catégorie.\n"
+               "[CODE]\n"
+               "def process_data(df):\n"
+               "    return df.groupby('catégorie', as_index=False)['total'].sum()\n"
+               "[/CODE]",
+}
@@ -0,0 +1,213 @@
+"""
+Benchmark du parcours complet : chargement -> question -> exécution -> enregistrement.
+
+    python -m bench.run                       # 1k, 10k, 100k et 1M cellules
+    python -m bench.run --sizes 1000 10000 --save-baseline
+    python -m bench.run --compare             # échoue si une étape régresse
+
+Le modèle est remplacé par des réponses enregistrées (bench/responses.py) et Qt tourne
+sans affichage : le benchmark s'exécute hors ligne, sur une machine sans écran.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtWidgets import QApplication
+from bench.workbooks import workbook_for
+from bench.responses import CANNED_RESPONSES
+from src.tablewin import EnhancedTable
+from src.dfagent import DataFrameAgent
+from src.interpreter import PythonInterpreter
+from src.utis import wrap_code, withoutconnect
+
+SIZES = [1000, 10000, 100000, 1000000]
+STAGES = ['load_excel', 'df_agent_load', 'wrap_execute', 'insert_result', 'excel_update', 'save']
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+OUTPUT_FILE = os.path.join(os.path.dirname(BENCH_DIR), 'bench_output.txt')
+
+
+def resident_memory():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class PeakMemory(object):
+    """
+    Pic de mémoire pendant une étape, au-dessus du niveau de départ.
+    La mémoire résidente est échantillonnée (elle voit aussi les objets Qt et numpy) ;
+    sans /proc, on se rabat sur tracemalloc, qui ne voit que les allocations Python.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._sampled = resident_memory() is not None
+
+    def _sample(self, start):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, resident_memory() - start)
+
+    def __enter__(self):
+        if self._sampled:
+            start = resident_memory()
+            self._thread = threading.Thread(target=self._sample, args=(start,), daemon=True)
+            self._thread.start()
+            self._start = start
+        else:
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._sampled:
+            self._stop.set()
+            self._thread.join()
+            self.peak = max(self.peak, resident_memory() - self._start)
+        else:
+            _, self.peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        return False
+
+
+def measure(function):
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        value = function()
+        elapsed = time.perf_counter() - start
+    return value, {'seconds': elapsed, 'peak_bytes': memory.peak}
+
+
+def run_size(table, interpreter, cells, workbook_dir, output_dir, response):
+    stages = {}
+    path = workbook_for(cells, workbook_dir)
+
+    # Comme open_excel : les signaux de la table sont coupés pendant le chargement
+    load_excel = withoutconnect(EnhancedTable.load_excel)
+
+    def load():
+        ok = load_excel(table, path)
+        # Gros fichier lu en flux : on mesure jusqu'à ce que le DataFrame soit prêt
+        while table.is_streaming():
+            table.read_stream_chunk()
+        return ok
+
+    ok, stages['load_excel'] = measure(load)
+    if not ok:
+        raise RuntimeError("Chargement impossible : {}".format(path))
+    agent = DataFrameAgent()
+    _, stages['df_agent_load'] = measure(lambda: agent.load(path, header=table.header_row_idx - 1))
+
+    output, stages['wrap_execute'] = measure(lambda: interpreter.run(wrap_code(response, table.dataframe)))
+    if not output.has_result:
+        raise RuntimeError("Le code enregistré a échoué :\n{}".format(output.stderr))
+
+    # insert_result notifie aussi l'ExcelAgent : il est mesuré à part pour isoler les deux étapes
+    table.detach(table.excel_agent)
+    try:
+        _, stages['insert_result'] = measure(lambda: table.insert_result(res=(output.result, '')))
+    finally:
+        table.attach(table.excel_agent)
+    _, stages['excel_update'] = measure(lambda: table.excel_agent._update(table))
+
+    target = os.path.join(output_dir, 'resultat_{}.xlsx'.format(cells))
+    _, stages['save'] = measure(lambda: table.excel_agent.save(target))
+    return stages
+
+
+def run(sizes, response_name='colonne', workbook_dir=None):
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    workbook_dir = workbook_dir or os.path.join(tempfile.gettempdir(), 'excelchat-bench')
+    output_dir = tempfile.mkdtemp()
+    interpreter = PythonInterpreter()
+    interpreter.start_subprocess()
+    # Les imports du worker ne doivent pas être comptés dans la première taille
+    interpreter.run('pass')
+    # Une seule table, comme dans l'application qui recharge les fichiers dans la même vue
+    table = EnhancedTable(output_dir)
+    results = {}
+    try:
+        for cells in sorted(sizes):
+            results[str(cells)] = run_size(table, interpreter, cells, workbook_dir, output_dir,
+                                           CANNED_RESPONSES[response_name])
+            app.processEvents()
+    finally:
+        interpreter.stop()
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'response': response_name, 'results': results}
+
+
+def compare(report, baseline, tolerance):
+    """Étapes plus lentes (ou plus gourmandes) que la référence au-delà de la tolérance."""
+    regressions = []
+    for size, stages in report['results'].items():
+        reference = baseline.get('results', {}).get(size, {})
+        for stage, values in stages.items():
+            if stage not in reference:
+                continue
+            for metric in ('seconds', 'peak_bytes'):
+                before, after = reference[stage][metric], values[metric]
+                # Les très petites valeurs sont trop bruitées pour être comparées
+                floor = 0.05 if metric == 'seconds' else 8 * 1024 ** 2
+                if max(before, after) >= floor and after > before * (1 + tolerance):
+                    regressions.append((size, stage, metric, before, after))
+    return regressions
+
+
+def format_report(report, baseline=None):
+    lines = ["Python {} - {} - réponse '{}'".format(report['python'], report['platform'], report['response']),
+             "{:>9} {:<14} {:>10} {:>12} {:>10}".format('cellules', 'étape', 'temps (s)', 'pic (Mo)', 'vs réf.')]
+    for size, stages in report['results'].items():
+        for stage in STAGES:
+            values = stages[stage]
+            delta = ''
+            reference = (baseline or {}).get('results', {}).get(size, {}).get(stage)
+            if reference and reference['seconds'] > 0:
+                delta = '{:+.0%}'.format(values['seconds'] / reference['seconds'] - 1)
+            lines.append("{:>9} {:<14} {:>10.3f} {:>12.1f} {:>10}".format(
+                size, stage, values['seconds'], values['peak_bytes'] / 1024 ** 2, delta))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark chargement -> question -> exécution -> enregistrement")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="Nombre de cellules par classeur")
+    parser.add_argument('--response', choices=sorted(CANNED_RESPONSES), default='colonne')
+    parser.add_argument('--workbooks', default=None, help="Dossier des classeurs générés (réutilisés)")
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE, default=None)
+    parser.add_argument('--compare', nargs='?', const=DEFAULT_BASELINE, default=None)
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Régression tolérée (0.25 = +25 %%)")
+    args = parser.parse_args(argv)
+
+    report = run(args.sizes, args.response, args.workbooks)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    text = format_report(report, baseline)
+    regressions = compare(report, baseline, args.tolerance) if baseline else []
+    for size, stage, metric, before, after in regressions:
+        text += "\nRÉGRESSION {} cellules, {} ({}) : {:.3f} -> {:.3f}".format(size, stage, metric, before, after)
+    print(text)
+    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
+        f.write(text + '\n')
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+import os
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment
+
+# Classeurs synthétiques : préambule stylé, bandeau d'en-têtes fusionnés, types mélangés
+COLUMNS = ['id', 'nom', 'catégorie', 'quantité', 'prix', 'total', 'date', 'actif', 'note', 'commentaire']
+GROUPS = [('Identité', 1, 3), ('Ventes', 4, 6), ('Suivi', 7, 10)]
+CATEGORIES = ['Alimentation', 'Bureau', 'Informatique', 'Mobilier', 'Textile']
+PREAMBLE_ROWS = 3
+
+
+def build_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    quantity = rng.integers(1, 100, rows)
+    price = np.round(rng.uniform(0.5, 500, rows), 2)
+    note = np.round(rng.uniform(0, 20, rows), 1)
+    # Des trous dans certaines colonnes, mais jamais sur les premières lignes (détection de l'en-tête)
+    note[np.arange(rows) % 7 == 6] = np.nan
+    comments = np.where(np.arange(rows) % 5 == 4, None,
+                        pd.Series(rng.integers(0, 1000, rows)).map('Commande n°{}'.format).values)
+    return pd.DataFrame({
+        'id': np.arange(1, rows + 1),
+        'nom': pd.Series(rng.integers(0, 5000, rows)).map('Client {}'.format).values,
+        'catégorie': np.array(CATEGORIES)[rng.integers(0, len(CATEGORIES), rows)],
+        'quantité': quantity,
+        'prix': price,
+        'total': np.round(quantity * price, 2),
+        'date': pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 730, rows), unit='D'),
+        'actif': rng.random(rows) < 0.8,
+        'note': note,
+        'commentaire': comments,
+    })
+
+
+def styled(ws, value, **styles):
+    cell = WriteOnlyCell(ws, value=value)
+    for name, style in styles.items():
+        setattr(cell, name, style)
+    return cell
+
+
+def generate_workbook(path, cells, seed=0):
+    rows = max(1, cells // len(COLUMNS))
+    df = build_frame(rows, seed)
+    # write_only : même un million de cellules se génère sans tout garder en mémoire
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Données')
+    last = chr(ord('A') + len(COLUMNS) - 1)
+
+    ws.merged_cells.add('A1:{}1'.format(last))
+    ws.append([styled(ws, 'Rapport de ventes synthétique', font=Font(name='Calibri', bold=True, size=14, color='FFFFFFFF'),
+                      fill=PatternFill('solid', fgColor='FF1F4E78'), alignment=Alignment(horizontal='center'))])
+    ws.merged_cells.add('A2:E2')
+    ws.append([styled(ws, '{} lignes x {} colonnes'.format(rows, len(COLUMNS)), font=Font(name='Calibri', italic=True, size=9))])
+    group_row = []
+    for name, first, end in GROUPS:
+        ws.merged_cells.add('{}3:{}3'.format(chr(ord('A') + first - 1), chr(ord('A') + end - 1)))
+        group_row.append(styled(ws, name, font=Font(name='Calibri', bold=True, size=11),
+                                fill=PatternFill('solid', fgColor='FFBDD7EE')))
+        group_row.extend([None] * (end - first))
+    ws.append(group_row)
+    ws.append([styled(ws, name, font=Font(name='Calibri', bold=True, size=11), fill=PatternFill('solid', fgColor='FFDDEBF7'))
+               for name in COLUMNS])
+
+    for values in df.itertuples(index=False, name=None):
+        ws.append([None if isinstance(value, float) and np.isnan(value) else value for value in values])
+    wb.save(path)
+    return path
+
+
+def workbook_for(cells, directory, seed=0):
+    # Les classeurs sont gardés entre deux passes : seule la première paie la génération
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, 'synthetic_{}_{}.xlsx'.format(cells, seed))
+    if not os.path.exists(path):
+        generate_workbook(path, cells, seed)
+    return path
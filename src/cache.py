@@ -0,0 +1,219 @@
+import ast
+import hashlib
+import io
+import os
+import pickle
+import re
+import tempfile
+import threading
+import pandas as pd
+from src.logger import logger
+
+
+def cache_root():
+    base = os.getenv('LOCALAPPDATA') or os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'excelchat')
+
+
+class DiskCache(object):
+    """Cache clé -> octets sur disque, éviction LRU (date d'accès = mtime) au-delà de max_bytes."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Marque l'entrée comme récemment utilisée
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path(key))
+        except OSError as e:
+            logger.debug(f"Écriture du cache impossible : {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self.evict()
+
+    def remove(self, key):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if entry.name.startswith('.tmp') or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+            entries.sort()
+            for mtime, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+
+# Code dont le résultat dépend d'autre chose que du DataFrame : jamais mis en cache
+NON_DETERMINISTIC = re.compile(r"random|now\(|today\(|time\.|uuid|input\(|open\(|read_|sheet\(")
+# Code qui écrit un fichier ou trace une figure : le relire du cache sauterait cet effet
+SIDE_EFFECTS = re.compile(r"savefig\(|to_excel\(|to_csv\(|to_parquet\(|to_json\(|to_pickle\(|plt\.|\.write\(")
+
+
+def normalize_code(code):
+    # ast.dump ignore commentaires, espaces et mise en forme
+    try:
+        return ast.dump(ast.parse(code))
+    except SyntaxError:
+        return code.strip()
+
+
+def column_digest(series):
+    digest = hashlib.sha256()
+    digest.update(str(series.dtype).encode())
+    digest.update(pd.util.hash_pandas_object(series, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def frame_fingerprint(df, column_digests=None):
+    """Empreinte du DataFrame ; column_digests permet de réutiliser les colonnes déjà hachées."""
+    if df is None:
+        return 'none'
+    digest = hashlib.sha256()
+    digest.update(repr(list(df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df.index).values.tobytes())
+    for j in range(df.shape[1]):
+        if column_digests is not None and j in column_digests:
+            value = column_digests[j]
+        else:
+            value = column_digest(df.iloc[:, j])
+            if column_digests is not None:
+                column_digests[j] = value
+        digest.update(value.encode())
+    return digest.hexdigest()
+
+
+class ResultCache(DiskCache):
+    def __init__(self, directory=None, max_bytes=512 * 1024 ** 2):
+        super(ResultCache, self).__init__(directory or os.path.join(cache_root(), 'results'), max_bytes)
+
+    def key(self, code, fingerprint):
+        if fingerprint is None or NON_DETERMINISTIC.search(code) or SIDE_EFFECTS.search(code):
+            return None
+        digest = hashlib.sha256()
+        digest.update(normalize_code(code).encode())
+        digest.update(fingerprint.encode())
+        return digest.hexdigest()
+
+    def load(self, key):
+        data = self.get(key)
+        if data is None:
+            return None
+        try:
+            return pickle.loads(data)
+        except Exception:
+            self.remove(key)
+            return None
+
+    def store(self, key, result):
+        try:
+            data = pickle.dumps(result, protocol=5)
+        except Exception as e:
+            logger.debug(f"Résultat non mis en cache : {e}")
+            return
+        self.put(key, data)
+
+
+def file_digest(filename, chunk_bytes=1024 ** 2):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_bytes), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class WorkbookCache(DiskCache):
+    """
+    Classeurs déjà analysés, pour rouvrir un fichier inchangé sans relire l'Excel.
+    Deux entrées par classeur : le DataFrame (Feather si pyarrow est installé, sinon pickle)
+    et un fichier annexe (valeurs affichées, numéros de style, fusions, ligne d'en-tête).
+    """
+
+    def __init__(self, directory=None, max_bytes=1024 ** 3):
+        super(WorkbookCache, self).__init__(directory or os.path.join(cache_root(), 'workbooks'), max_bytes)
+
+    def key(self, filename, sheet=None):
+        # sheet=None : feuille active du classeur
+        try:
+            stat = os.stat(filename)
+            content = file_digest(filename)
+        except OSError:
+            return None
+        digest = hashlib.sha256()
+        digest.update(os.path.abspath(filename).encode())
+        digest.update(repr(sheet).encode())
+        digest.update('{}:{}:{}'.format(stat.st_mtime_ns, stat.st_size, content).encode())
+        return digest.hexdigest()
+
+    def load(self, key):
+        """(DataFrame, annexe) ou None ; une entrée incomplète ou illisible est supprimée."""
+        frame_data = self.get(key + '.frame')
+        sidecar_data = self.get(key + '.meta')
+        if frame_data is None or sidecar_data is None:
+            return None
+        try:
+            sidecar = pickle.loads(sidecar_data)
+            if sidecar.get('format') == 'feather':
+                frame = pd.read_feather(io.BytesIO(frame_data))
+            else:
+                frame = pickle.loads(frame_data)
+        except Exception as e:
+            logger.debug(f"Entrée du cache des classeurs illisible : {e}")
+            self.remove(key + '.frame')
+            self.remove(key + '.meta')
+            return None
+        return frame, sidecar
+
+    def store(self, key, frame, sidecar):
+        try:
+            buffer = io.BytesIO()
+            # Feather n'accepte que des noms de colonnes textuels et des colonnes d'un seul type
+            frame.to_feather(buffer)
+            frame_data, sidecar['format'] = buffer.getvalue(), 'feather'
+        except Exception:
+            frame_data, sidecar['format'] = None, 'pickle'
+        try:
+            if frame_data is None:
+                frame_data = pickle.dumps(frame, protocol=5)
+            sidecar_data = pickle.dumps(sidecar, protocol=5)
+        except Exception as e:
+            logger.debug(f"Classeur non mis en cache : {e}")
+            return
+        self.put(key + '.frame', frame_data)
+        self.put(key + '.meta', sidecar_data)
@@ -1,3 +1,4 @@
+import threading
 import openai
 
 
@@ -9,15 +10,19 @@ class ChatBot(object):
         openai.api_base = self.api_base
         openai.api_key = None
         self.history = []
+        # Un seul échange à la fois modifie l'historique : une auto-correction lancée pendant la fin
+        # d'une réponse diffusée attend que cette réponse y soit ajoutée, avant sa propre question
+        self._lock = threading.Lock()
 
     def set_api_key(self, api_key):
         self.api_key = api_key
         openai.api_key = api_key
 
     def clear_history(self):
-        self.history = []
+        with self._lock:
+            self.history = []
 
-    def get_response(self, content, system_prompt=None):
+    def prepare(self, content, system_prompt=None):
         # Mettre à jour ou ajouter le prompt système (contexte du DataFrame)
         if system_prompt:
             # Si le premier message est un système, on le met à jour, sinon on l'insère
@@ -28,6 +33,13 @@ class ChatBot(object):
 
         self.history.append({'role': 'user', 'content': content})
 
+    def get_response(self, content, system_prompt=None):
+        with self._lock:
+            return self._get_response(content, system_prompt)
+
+    def _get_response(self, content, system_prompt=None):
+        self.prepare(content, system_prompt)
+
         if self.api_key is not None:
             openai.api_base = self.api_base
             openai.api_key = self.api_key
@@ -44,3 +56,50 @@ class ChatBot(object):
             return message, int(token_count)
         else:
             return '', 0
+
+    def stream_response(self, content, system_prompt=None, on_text=None):
+        """
+        Comme get_response, mais on_text reçoit chaque morceau de la réponse dès son arrivée.
+        Le nombre de tokens est estimé si le serveur ne le donne pas avec le dernier morceau.
+        """
+        with self._lock:
+            return self._stream_response(content, system_prompt, on_text)
+
+    def _stream_response(self, content, system_prompt=None, on_text=None):
+        self.prepare(content, system_prompt)
+
+        if self.api_key is None:
+            return '', 0
+        openai.api_base = self.api_base
+        openai.api_key = self.api_key
+        response = openai.ChatCompletion.create(
+            model=self.model,
+            messages=self.history,
+            temperature=0.3,
+            stream=True)
+
+        parts = []
+        token_count = None
+        for chunk in response:
+            usage = chunk.get('usage')
+            if usage:
+                token_count = usage['total_tokens']
+            if not chunk['choices']:
+                continue
+            text = chunk['choices'][0]['delta'].get('content')
+            if text:
+                parts.append(text)
+                if on_text is not None:
+                    on_text(text)
+        message = ''.join(parts)
+        if token_count is None:
+            token_count = estimate_tokens(self.history) + estimate_tokens([{'content': message}])
+
+        self.history.append({'role': 'assistant', 'content': message})
+
+        return message, int(token_count)
+
+
+def estimate_tokens(messages):
+    # Environ 4 caractères par token pour les langues latines
+    return sum(len(message['content'] or '') for message in messages) // 4
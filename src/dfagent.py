@@ -1,33 +1,52 @@
 from src.memo import TableMemo, Modification, TableSnapShot, ModificationType, build_item_info
 from src.observer import Observer
+from src.flatfile import is_flat_file, read_flat
 import pandas as pd
 
 
+def repair_merged_headers(columns):
+    """
+    Une colonne "Unnamed: ..." vient d'un en-tête fusionné : elle reprend le nom de la colonne à sa gauche.
+    Les noms repris sont suffixés (.1, .2...) pour rester uniques dans le DataFrame envoyé à l'interpréteur.
+    """
+    new_columns = []
+    last_valid_name = None
+    for col in columns:
+        col_str = str(col)
+        if "Unnamed" in col_str:
+            if last_valid_name is not None:
+                new_columns.append(last_valid_name)
+            else:
+                new_columns.append(col_str)
+        else:
+            new_columns.append(col_str)
+            last_valid_name = col_str
+
+    seen = {}
+    unique_columns = []
+    for name in new_columns:
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        unique_columns.append(name if count == 0 else "{}.{}".format(name, count))
+    return unique_columns
+
+
 class DataFrameAgent(Observer):
     def __init__(self):
         self.df = None
 
     def load(self, excel_file, header=0):
-        # On lit le DataFrame
-        df = pd.read_excel(excel_file, header=header)
+        # On lit le DataFrame ; CSV et Parquet sont lus directement par pandas/pyarrow
+        if is_flat_file(excel_file):
+            self.set_frame(read_flat(excel_file))
+            return
+        self.set_frame(pd.read_excel(excel_file, header=header))
 
+    def set_frame(self, df):
         # --- RÉPARATION DES EN-TÊTES FUSIONNÉS POUR L'IA ---
-        # Si une colonne s'appelle "Unnamed: ...", on récupère le nom de la colonne à sa gauche
-        new_columns = []
-        last_valid_name = None
-        for col in df.columns:
-            col_str = str(col)
-            if "Unnamed" in col_str:
-                if last_valid_name is not None:
-                    new_columns.append(last_valid_name)
-                else:
-                    new_columns.append(col_str)
-            else:
-                new_columns.append(col_str)
-                last_valid_name = col_str
-
-        df.columns = new_columns
+        df.columns = repair_merged_headers(df.columns)
         self.df = df
+        return df
 
     def _update(self, subject):
         modifications = subject.modification
@@ -1,19 +1,285 @@
 import fontTools.misc.cython
 from openpyxl import load_workbook, workbook
-from openpyxl.cell.cell import MergedCell
-from src.observer import Observer
+from openpyxl.cell.cell import MergedCell, TYPE_ERROR, TYPE_NUMERIC, TYPE_FORMULA
+from src.observer import Observer, TableEvent
 from src.memo import ModificationType
+from src.frameops import coerce_value, set_cell, apply_op
+from src import profiler
 from openpyxl.styles import PatternFill, Border, Side, Alignment, Protection, Font
+from openpyxl.styles.cell_style import StyleArray
 from openpyxl.drawing.image import Image
+from openpyxl.worksheet.cell_range import CellRange
 import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+import numpy as np
 import pandas as pd
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
 from copy import copy
+from contextlib import nullcontext
+from bisect import bisect_left, bisect_right
+
+
+def convert_cell(cell):
+    # Mêmes conversions que le lecteur openpyxl de pd.read_excel
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        if value == cell.value:
+            return value
+        return float(cell.value)
+    return cell.value
+
+
+def sheet_values(ws, filename=None):
+    """
+    Valeurs de la feuille telles que pd.read_excel les lirait, à partir de la feuille déjà chargée.
+    Les formules n'ont pas de valeur dans un classeur ouvert sans data_only : leurs valeurs
+    en cache sont relues (lecture seule) uniquement si la feuille en contient.
+    """
+    data = []
+    formulas = []
+    last_row_with_data = -1
+    for row_number, row in enumerate(ws.iter_rows()):
+        values = []
+        for cell in row:
+            if cell.data_type == TYPE_FORMULA:
+                formulas.append((row_number, len(values)))
+            values.append(convert_cell(cell))
+        while values and values[-1] == "":
+            values.pop()
+        if values:
+            last_row_with_data = row_number
+        data.append(values)
+    data = data[:last_row_with_data + 1]
+
+    if formulas and filename is not None:
+        cached = load_workbook(filename=filename, read_only=True, data_only=True)
+        try:
+            rows = list(cached[ws.title].iter_rows())
+            for row_number, column in formulas:
+                if row_number < len(data):
+                    cell = rows[row_number][column] if column < len(rows[row_number]) else None
+                    data[row_number][column] = convert_cell(cell) if cell is not None else ""
+        finally:
+            cached.close()
+
+    return pad_values(data)
+
+
+def row_values(row):
+    values = [convert_cell(cell) for cell in row]
+    while values and values[-1] == "":
+        values.pop()
+    return values
+
+
+def pad_values(data):
+    # Toutes les lignes à la même largeur, sans les lignes vides de fin
+    while data and not data[-1]:
+        data.pop()
+    if data:
+        width = max(len(values) for values in data)
+        data = [values + [""] * (width - len(values)) for values in data]
+    return data
+
+
+def frame_from_values(data, header=0):
+    # TextParser est ce que pd.read_excel utilise après avoir lu les cellules
+    try:
+        return TextParser(data, header=header, skip_blank_lines=False).read()
+    except EmptyDataError:
+        return pd.DataFrame()
+
+
+def changed_rows(old, new):
+    """Positions où deux colonnes de même longueur diffèrent (deux valeurs manquantes sont égales)."""
+    a = old.to_numpy()
+    b = new.to_numpy()
+    try:
+        same = np.asarray(a == b, dtype=bool)
+        if same.shape != a.shape:
+            raise ValueError
+    except (TypeError, ValueError):
+        return np.arange(len(a))
+    same |= pd.isna(old).to_numpy() & pd.isna(new).to_numpy()
+    return np.flatnonzero(~same)
+
+
+def common_ends(old, new):
+    # Nombre de lignes identiques au début et à la fin (empreintes de lignes, sans Python par ligne)
+    size = min(len(old), len(new))
+    equal = old[:size] == new[:size]
+    prefix = size if equal.all() else int(np.argmin(equal))
+    equal = old[len(old) - size:][::-1] == new[len(new) - size:][::-1]
+    suffix = size if equal.all() else int(np.argmin(equal))
+    return prefix, min(suffix, size - prefix)
+
+
+def inserted_positions(short, long):
+    """Positions (dans long) des éléments ajoutés, si short est long privé de quelques éléments ; sinon None."""
+    positions = []
+    i = 0
+    for j, name in enumerate(long):
+        if i < len(short) and short[i] == name:
+            i += 1
+        else:
+            positions.append(j)
+    return positions if i == len(short) else None
+
+
+def delete_sheet_rows(ws, rows):
+    """Supprime des lignes quelconques (1-based, triées) en un seul parcours des cellules."""
+    removed = set(rows)
+    cells = {}
+    for (row, column), cell in ws._cells.items():
+        if row in removed:
+            continue
+        shift = bisect_left(rows, row)
+        if shift:
+            cell.row = row - shift
+        cells[(row - shift, column)] = cell
+    ws._cells = cells
+    ws._current_row = ws.max_row if cells else 0
+
+
+def insert_sheet_rows(ws, rows):
+    """Insère des lignes vides aux positions finales rows (1-based, triées), en un seul parcours des cellules."""
+    # Une ligne existante descend d'autant de lignes que de seuils rows[i] - i qu'elle atteint
+    thresholds = [row - i for i, row in enumerate(rows)]
+    cells = {}
+    for (row, column), cell in ws._cells.items():
+        shift = bisect_right(thresholds, row)
+        if shift:
+            cell.row = row + shift
+        cells[(row + shift, column)] = cell
+    ws._cells = cells
+    ws._current_row = ws.max_row if cells else 0
+
+
+def insert_images(wb, fig_dir):
+    imgnames = os.listdir(fig_dir)
+    if len(imgnames) == 0:
+        return
+    for i, imgname in enumerate(imgnames):
+        plot_ws = wb.create_sheet("graphique{}".format(i+1))
+        imgname = os.path.join(fig_dir, imgname)
+        img = Image(imgname)
+        plot_ws.add_image(img, 'A{}'.format(i + 1))
+
+
+def export_frame(df, filename, fig_dir=None, progress=None, chunk_rows=5000):
+    """
+    Enregistrement rapide d'un tableau sans classeur d'origine (résultat IA, nouvelle feuille) :
+    il n'y a pas de styles à préserver, le mode write_only écrit les lignes au fil de l'eau.
+    """
+    wb = workbook.Workbook(write_only=True)
+    ws = wb.create_sheet("Feuille1")
+    ws.append([str(name) for name in df.columns])
+    total = len(df)
+    for start in range(0, total, chunk_rows):
+        for row in df.iloc[start:start + chunk_rows].itertuples(index=False, name=None):
+            ws.append([None if pd.isna(value) else value for value in row])
+        if progress is not None:
+            progress(min(start + chunk_rows, total), total)
+    if fig_dir is not None:
+        insert_images(wb, fig_dir)
+    wb.save(filename)
+
+
+class CellStyle(object):
+    """Police et remplissage d'un style du classeur, avec la même interface qu'une cellule openpyxl."""
+
+    def __init__(self, font, fill):
+        self.font = font
+        self.fill = fill
+
+
+class StyleTable(object):
+    # Les cellules ne gardent que leur numéro de style : les objets sont résolus à l'affichage
+    def __init__(self, wb, styles=None, lock=None):
+        # styles : styles déjà résolus (cache des classeurs), le classeur peut alors être None
+        self.wb = wb
+        self._styles = dict(styles or {})
+        # Verrou de l'ExcelAgent : le thread des observateurs ajoute des styles au classeur
+        self._lock = lock
+
+    def resolve(self, style_id):
+        style = self._styles.get(style_id)
+        if style is None:
+            if self.wb is None:
+                return None
+            with self._lock or nullcontext():
+                if style_id >= len(self.wb._cell_styles):
+                    return None
+                array = self.wb._cell_styles[style_id]
+                style = CellStyle(self.wb._fonts[array.fontId], self.wb._fills[array.fillId])
+            self._styles[style_id] = style
+        return style
+
+
+class StyleCache(object):
+    """
+    Styles déjà enregistrés dans le classeur : chaque combinaison (police, remplissage, bordure,
+    alignement, format) correspond à un StyleArray, c'est-à-dire aux numéros des objets partagés
+    du classeur. Une cellule stylée ne reçoit qu'une copie de ce tableau d'entiers.
+    """
+
+    def __init__(self, wb):
+        self.wb = wb
+        self._arrays = {}
+
+    def style_array(self, style, base=None):
+        # style : (police, taille, couleur du texte, couleur de fond) comme renvoyé par translate_style
+        key = (style, tuple(base) if base is not None else None)
+        array = self._arrays.get(key)
+        if array is None:
+            font_name, font_size, font_color, bg_color = style
+            array = copy(base) if base is not None else StyleArray()
+            array.fontId = self.wb._fonts.add(Font(name=font_name, size=font_size, color=font_color))
+            array.fillId = self.wb._fills.add(PatternFill(fill_type=None, start_color='FFFFFFFF', end_color=bg_color))
+            self._arrays[key] = array
+        return array
+
+    def copy_row(self, ws, source_row, first_row, last_row, width):
+        """Donne aux lignes first_row..last_row le style des cellules de source_row."""
+        # openpyxl modifie le StyleArray d'une cellule sur place : chaque cellule reçoit sa copie
+        arrays = [cell._style if cell.has_style else None
+                  for cell in next(ws.iter_rows(min_row=source_row, max_row=source_row, max_col=width))]
+        for row in ws.iter_rows(min_row=first_row, max_row=last_row, max_col=width):
+            for cell, array in zip(row, arrays):
+                if array is not None:
+                    cell._style = copy(array)
 
 
 class ExcelAgent(Observer):
+    # Écriture dans le classeur hors du thread de l'interface (voir ObserverBus)
+    background = True
+
     def __init__(self):
         self.wb = None
         self.ws = None
+        self.filename = None
+        # Mode gros fichier : feuille en lecture seule, éditions rejouées sur le classeur complet à l'enregistrement
+        self.streaming = False
+        self.pending = []
+        # Enregistrement en cours dans un thread : éditions reçues entre-temps.
+        # Le verrou sépare le thread des observateurs (écritures), celui de l'enregistrement (rejeu)
+        # et le thread GUI (début et fin d'enregistrement, choix de la feuille)
+        self.saving = False
+        self.deferred = []
+        self._lock = threading.RLock()
+        # Feuille visée par les éditions ; le classeur peut en contenir plusieurs
+        self.sheet = None
+        self.sheets = []
+        # Par feuille, dernier DataFrame écrit (et sa copie) : seules les différences sont réécrites
+        self._tracked = {}
+        self._styles = None
         self.answer_ws = None
         self.plot_ws = None
         self.num_rows = 0
@@ -23,16 +289,139 @@ class ExcelAgent(Observer):
         wb = load_workbook(filename=filename)
         if self.is_valid(wb):
             self.wb = wb
-            self.ws = wb.active
-            self.num_rows = self.ws.max_row
-            self.num_cols = self.ws.max_column
+            self.filename = filename
+            self.streaming = False
+            self.pending = []
+            self._tracked = {}
+            self.sheets = wb.sheetnames
+            self.select(wb.active.title)
             # Suppression de la création de la feuille "Réponse IA" ici
             return True
         return False
 
-    def save(self, filename, fig_dir=None):
+    def load_streaming(self, filename):
+        """
+        Ouvre le classeur en lecture seule (lecture en flux, valeurs calculées des formules).
+        Le classeur complet n'est chargé qu'à l'enregistrement, pour y rejouer les éditions.
+        """
+        wb = load_workbook(filename=filename, read_only=True, data_only=True)
+        if not self.is_valid(wb):
+            wb.close()
+            return False
+        self.wb = wb
+        self.filename = filename
+        self.streaming = True
+        self.pending = []
+        self._tracked = {}
+        self.sheets = wb.sheetnames
+        self.select(wb.active.title)
+        return True
+
+    def load_deferred(self, filename, num_rows, num_cols, sheet, sheets):
+        # Classeur retrouvé dans le cache : rien n'est lu, les éditions attendent l'enregistrement
+        self.wb = None
+        self.ws = None
+        self.filename = filename
+        self.streaming = True
+        self.pending = []
+        self._tracked = {}
+        self.sheets = list(sheets)
+        self.sheet = sheet
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        return True
+
+    @property
+    def lock(self):
+        # Pour les lectures du classeur faites hors de l'agent (thread GUI)
+        return self._lock
+
+    def style_table(self):
+        return StyleTable(self.wb, lock=self._lock)
+
+    def worksheet(self, name):
+        with self._lock:
+            if self.wb is None and self.streaming:
+                # Classeur différé (cache) ou archive déjà refermée : réouverture en lecture seule
+                self.wb = load_workbook(filename=self.filename, read_only=True, data_only=True)
+            return self.wb[name]
+
+    def select(self, name):
+        """Dirige les éditions vers la feuille name (chargée à la demande en lecture seule)."""
+        # Un autre onglet peut changer de feuille pendant que l'enregistrement rejoue les éditions
+        with self._lock:
+            self.sheet = name
+            if self.wb is None and self.streaming:
+                # Rien à lire tant que personne n'a besoin des cellules
+                return
+            self.ws = self.worksheet(name)
+            self.num_rows = self.ws.max_row or 0
+            self.num_cols = self.ws.max_column or 0
+
+    def close_archive(self):
+        # Lecture seule terminée : les styles restent en mémoire, le fichier est libéré
+        if self.streaming and self.wb is not None:
+            self.wb.close()
+            self.wb = None
+            self.ws = None
+
+    def close(self):
+        # Fichier plat ouvert à la place du classeur : plus rien à reporter ni à enregistrer dans l'Excel
+        if self.streaming and self.wb is not None:
+            self.wb.close()
+        self.wb = None
+        self.ws = None
+        self.filename = None
+        self.streaming = False
+        self.pending = []
+        self._tracked = {}
+        self._styles = None
+        self.sheet = None
+        self.sheets = []
+        self.num_rows = 0
+        self.num_cols = 0
+
+    def merged_ranges(self, ws=None):
+        # La lecture seule ignore les fusions : elles sont relues dans le XML de la feuille, sans le charger
+        ws = ws or self.ws
+        if not self.streaming:
+            return list(ws.merged_cells.ranges)
+        ranges = []
+        source = ws._get_source()
+        try:
+            for _, element in ET.iterparse(source):
+                if element.tag.endswith('}mergeCell'):
+                    ranges.append(CellRange(element.get('ref')))
+                element.clear()
+        finally:
+            source.close()
+        return ranges
+
+    def materialize(self):
+        # Premier enregistrement d'un gros fichier : chargement complet puis rejeu des éditions.
+        # Sous verrou : les onglets qui choisissent leur feuille attendent la fin du rejeu
+        with self._lock:
+            if self.wb is not None:
+                self.wb.close()
+            wb = load_workbook(filename=self.filename)
+            self.wb = wb
+            self.streaming = False
+            current = self.sheet or wb.active.title
+            pending, self.pending = self.pending, []
+            for modification, header_offset, sheet in pending:
+                self.select(sheet)
+                self.apply_modification(modification, header_offset)
+            self.select(current)
+
+    def save(self, filename, fig_dir=None, progress=None):
         if not self.is_opened():
             return
+        # openpyxl n'expose pas l'avancement de l'écriture : la progression est donnée par étape
+        progress = progress or (lambda done, total: None)
+        progress(0, 3)
+        if self.streaming:
+            self.materialize()
+        progress(1, 3)
         if fig_dir is not None:
             self.insert_image(fig_dir)
 
@@ -41,61 +430,269 @@ class ExcelAgent(Observer):
             std = self.wb["Réponse IA"]
             self.wb.remove(std)
 
+        progress(2, 3)
         self.wb.save(filename)
+        progress(3, 3)
+
+    def begin_save(self):
+        # Enregistrement dans un thread : le classeur reste tel qu'au moment de la demande,
+        # les éditions suivantes sont mises de côté
+        with self._lock:
+            self.saving = True
+
+    def end_save(self):
+        with self._lock:
+            self.saving = False
+            deferred, self.deferred = self.deferred, []
+            for modification, header_offset, sheet in deferred:
+                self.receive(modification, header_offset, sheet)
+
+    def read_frame(self, header=0, ws=None):
+        # Le DataFrame est construit depuis la feuille déjà chargée : le fichier n'est pas relu
+        if not self.is_opened():
+            return None
+        return frame_from_values(sheet_values(ws or self.ws, self.filename), header=header)
+
+    @property
+    def frame(self):
+        return self._tracked.get(self.sheet, (None, None))[0]
+
+    @property
+    def written(self):
+        return self._tracked.get(self.sheet, (None, None))[1]
+
+    @written.setter
+    def written(self, df):
+        self._tracked[self.sheet] = (self.frame, df)
+
+    def track(self, df, sheet=None):
+        # DataFrame correspondant au contenu actuel de la feuille (sous l'en-tête)
+        sheet = self.sheet if sheet is None else sheet
+        if df is None:
+            self._tracked.pop(sheet, None)
+        else:
+            self._tracked[sheet] = (df, df.copy())
+
+    def track_cell(self, row, column, value):
+        written = self.written
+        if written is not None and 0 <= row < len(written) and 0 <= column < len(written.columns):
+            set_cell(written, row, column, value)
+
+    def write_cell(self, row, column, value):
+        cell = self.ws.cell(row=row, column=column)
+        # Les cellules fusionnées (hors coin supérieur gauche) sont en lecture seule
+        if not isinstance(cell, MergedCell):
+            cell.value = None if pd.isna(value) else value
+        return cell
+
+    def write_frame(self, modification, header_offset):
+        """
+        Réécrit la feuille pour qu'elle corresponde à modification.df, en ne touchant qu'aux cellules
+        qui ont changé depuis la dernière écriture. Les lignes et colonnes insérées ou supprimées
+        sont reportées par insert_rows/delete_rows/insert_cols/delete_cols, ce qui décale
+        aussi les styles et le contenu situé sous le tableau.
+        """
+        df = modification.df
+        if self.written is None:
+            self.write_all(df, header_offset)
+        else:
+            ops = getattr(modification, 'ops', None)
+            if ops and getattr(modification, 'previous', None) is self.frame:
+                self.replay_structure(ops, header_offset)
+            else:
+                self.align_structure(df, header_offset)
+            self.write_diff(df, header_offset)
+        self.track(df)
+
+    def write_all(self, df, header_offset):
+        # Rien n'a encore été écrit : toute la zone du tableau est réécrite
+        old_max_row = self.ws.max_row
+
+        # On ne touche aux en-têtes que s'ils sont valides (pas Unnamed)
+        for j, col_name in enumerate(df.columns):
+            if "Unnamed" not in str(col_name):
+                self.write_cell(header_offset, j + 1, col_name)
+
+        # Réécrire les données en conservant le style et sans tronquer le reste du fichier
+        self.write_rows(df, 0, header_offset, old_max_row)
+
+        # Ajuster la taille du fichier physique si nécessaire (Suppression des lignes en trop)
+        new_max_row = len(df) + header_offset
+        if old_max_row > new_max_row:
+            # On supprime les lignes à partir de la fin pour ne pas décaler les index
+            self.ws.delete_rows(new_max_row + 1, old_max_row - new_max_row)
+
+    def write_rows(self, df, first, header_offset, old_max_row):
+        for i, row in enumerate(df.iloc[first:].values, first):
+            current_row = i + header_offset + 1
+            for j, value in enumerate(row):
+                self.write_cell(current_row, j + 1, value)
+
+        # Les lignes ajoutées reprennent le style de la dernière ligne existante, en un seul passage
+        first_new = max(old_max_row, header_offset + 1, first + header_offset) + 1
+        last_row = len(df) + header_offset
+        if len(df.columns) and first_new <= last_row:
+            self.styles.copy_row(self.ws, first_new - 1, first_new, last_row, len(df.columns))
+
+    def replay_structure(self, ops, header_offset):
+        # L'édition est connue exactement (table) : elle est rejouée telle quelle sur la feuille
+        for op in ops:
+            kind = op[0]
+            written = self.written
+            if kind in ('set', 'set_block', 'set_values', 'dtypes'):
+                # Valeurs : écrites ensuite par write_diff
+                continue
+            if kind == 'insert_row':
+                position = min(max(op[1], 0), len(written))
+                self.ws.insert_rows(header_offset + 1 + position)
+            elif kind == 'insert_rows':
+                position = min(max(op[1], 0), len(written))
+                self.ws.insert_rows(header_offset + 1 + position, op[2])
+            elif kind == 'delete_rows':
+                positions = sorted(set(p for p in op[1] if 0 <= p < len(written)))
+                self.delete_row_runs(positions, header_offset)
+            elif kind == 'restore_rows':
+                # Lignes remises en place vides : write_diff y écrit ensuite leurs valeurs
+                rows = [header_offset + 1 + position for position in op[1]]
+                if rows and rows[-1] - rows[0] + 1 == len(rows):
+                    self.ws.insert_rows(rows[0], len(rows))
+                elif rows:
+                    insert_sheet_rows(self.ws, rows)
+                blank = pd.DataFrame([[None] * len(written.columns)] * len(rows), columns=written.columns)
+                op = ('restore_rows', op[1], blank)
+            elif kind == 'restore_columns':
+                for position, name, _ in op[1]:
+                    self.ws.insert_cols(position + 1)
+                    if "Unnamed" not in str(name):
+                        self.write_cell(header_offset, position + 1, name)
+                op = ('restore_columns', [(position, name, [None] * len(written)) for position, name, _ in op[1]])
+            elif kind == 'insert_column':
+                self.ws.insert_cols(max(op[1], 0) + 1)
+            elif kind == 'delete_columns':
+                for position in sorted((written.columns.get_loc(name) for name in set(op[1])
+                                        if name in written.columns), reverse=True):
+                    self.ws.delete_cols(position + 1)
+            self.written = apply_op(written, op)
+
+    def delete_row_runs(self, positions, header_offset):
+        rows = [header_offset + 1 + position for position in positions]
+        if not rows:
+            return
+        if rows[-1] - rows[0] + 1 == len(rows):
+            # Un seul bloc de lignes consécutives
+            self.ws.delete_rows(rows[0], len(rows))
+            return
+        # Lignes éparses : un delete_rows par bloc redéplacerait toute la feuille à chaque fois
+        delete_sheet_rows(self.ws, rows)
+
+    def align_structure(self, df, header_offset):
+        # Sans description de l'édition, les décalages sont déduits des noms de colonnes et des lignes
+        written = self.written
+        old_columns, new_columns = list(written.columns), list(df.columns)
+        if old_columns != new_columns:
+            added = inserted_positions(old_columns, new_columns)
+            removed = inserted_positions(new_columns, old_columns) if added is None else None
+            if added:
+                for position in added:
+                    self.ws.insert_cols(position + 1)
+                    written.insert(position, new_columns[position], None, allow_duplicates=True)
+            elif removed:
+                for position in reversed(removed):
+                    self.ws.delete_cols(position + 1)
+                written = written.drop(columns=[old_columns[p] for p in removed])
+            self.written = written
+
+        if len(written) == len(df) or list(written.columns) != new_columns:
+            return
+        try:
+            old_hashes = pd.util.hash_pandas_object(written, index=False).to_numpy()
+            new_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        except TypeError:
+            return
+        prefix, suffix = common_ends(old_hashes, new_hashes)
+        shift = len(df) - len(written)
+        if shift > 0 and prefix < len(written) and prefix + suffix >= len(written):
+            self.ws.insert_rows(header_offset + 1 + prefix, shift)
+            blank = pd.DataFrame([[None] * len(new_columns)] * shift, columns=written.columns)
+            self.written = pd.concat([written.iloc[:prefix], blank, written.iloc[prefix:]]).reset_index(drop=True)
+        elif shift < 0 and prefix < len(df) and prefix + suffix >= len(df):
+            self.ws.delete_rows(header_offset + 1 + prefix, -shift)
+            self.written = written.drop(written.index[prefix:prefix - shift]).reset_index(drop=True)
+
+    def write_diff(self, df, header_offset):
+        written = self.written
+        old_max_row = self.ws.max_row
+        for j, col_name in enumerate(df.columns):
+            if j >= len(written.columns) or written.columns[j] != col_name:
+                if "Unnamed" not in str(col_name):
+                    self.write_cell(header_offset, j + 1, col_name)
+
+        # Partie commune : comparaison vectorisée colonne par colonne, seules les cellules modifiées sont écrites
+        rows = min(len(df), len(written))
+        width = min(len(df.columns), len(written.columns))
+        for j in range(width):
+            column = df.iloc[:rows, j]
+            for i in changed_rows(written.iloc[:rows, j], column):
+                self.write_cell(header_offset + 1 + int(i), j + 1, column.iat[i])
+        for j in range(width, len(df.columns)):
+            column = df.iloc[:rows, j]
+            for i in range(rows):
+                self.write_cell(header_offset + 1 + i, j + 1, column.iat[i])
+        for j in range(len(df.columns), len(written.columns)):
+            self.write_cell(header_offset, j + 1, None)
+            for i in range(rows):
+                self.write_cell(header_offset + 1 + i, j + 1, None)
+
+        # Lignes ajoutées à la fin, ou lignes du tableau devenues superflues
+        if len(df) > rows:
+            self.write_rows(df, rows, header_offset, old_max_row)
+        elif len(written) > rows:
+            self.ws.delete_rows(header_offset + 1 + rows, len(written) - rows)
 
     def is_valid(self, wb):
         # On autorise désormais les cellules fusionnées pour gérer les fichiers complexes
         return True
 
     def is_opened(self):
+        if self.streaming:
+            return self.filename is not None
         return self.wb is not None and self.ws is not None
 
     def _update(self, subject):
         if not self.is_opened():
             return
-        modifications = subject.modification
-        mtype = modifications.mtype
-        item_infos = modifications.item_infos
-
         # Récupération de l'offset de l'en-tête depuis le sujet (EnhancedTable)
         header_offset = getattr(subject, 'header_row_idx', 1)
+        sheet = getattr(subject, 'sheet_name', None) or self.sheet
+        # Événement du bus : le tour mesuré est celui de la modification, pas celui en cours
+        trace = subject.trace if isinstance(subject, TableEvent) else profiler.current()
+        with self._lock:
+            if self.saving:
+                self.deferred.append((subject.modification, header_offset, sheet))
+                return
+            self.receive(subject.modification, header_offset, sheet, trace)
+
+    def receive(self, modification, header_offset, sheet, trace=None):
+        if self.streaming:
+            # Feuille en lecture seule : l'édition sera appliquée à l'enregistrement
+            self.pending.append((modification, header_offset, sheet))
+            return
+        if sheet != self.sheet:
+            self.select(sheet)
+        start = time.perf_counter()
+        self.apply_modification(modification, header_offset)
+        if trace is not None:
+            trace.add('excel_writeback', start, time.perf_counter(), parent='notify')
+
+    def apply_modification(self, modifications, header_offset):
+        mtype = modifications.mtype
+        item_infos = modifications.item_infos
 
         if mtype == ModificationType.NEW_TABLE:
             # Traiter la mise à jour globale même si item_infos est vide
             df = modifications.df
             if df is None: return
-            old_max_row = self.ws.max_row
-
-            # On ne touche aux en-têtes que s'ils sont valides (pas Unnamed)
-            for j, col_name in enumerate(df.columns):
-                if "Unnamed" not in str(col_name):
-                    self.ws.cell(row=header_offset, column=j+1, value=col_name)
-
-            # Réécrire les données en conservant le style et sans tronquer le reste du fichier
-            for i, row in enumerate(df.values):
-                current_row = i + header_offset + 1
-                for j, value in enumerate(row):
-                    val_to_write = None if pd.isna(value) else value
-                    cell = self.ws.cell(row=current_row, column=j+1)
-
-                    # (Gestion du style déjà implémentée précédemment)
-                    if current_row > old_max_row and current_row > header_offset + 1:
-                        prev_cell = self.ws.cell(row=current_row - 1, column=j+1)
-                        if prev_cell.has_style:
-                            cell.font = copy(prev_cell.font)
-                            cell.border = copy(prev_cell.border)
-                            cell.fill = copy(prev_cell.fill)
-                            cell.number_format = copy(prev_cell.number_format)
-                            cell.alignment = copy(prev_cell.alignment)
-
-                    cell.value = val_to_write
-
-            # Ajuster la taille du fichier physique si nécessaire (Suppression des lignes en trop)
-            new_max_row = len(df) + header_offset
-            if old_max_row > new_max_row:
-                # On supprime les lignes à partir de la fin pour ne pas décaler les index
-                self.ws.delete_rows(new_max_row + 1, old_max_row - new_max_row)
-
+            self.write_frame(modifications, header_offset)
             self.num_rows = self.ws.max_row
             self.num_cols = self.ws.max_column
             return
@@ -105,14 +702,12 @@ class ExcelAgent(Observer):
                 index = item_info.index
                 text = item_info.text
                 dtype = item_info.dtype
-                try:
-                    data = dtype(text)
-                except:
-                    data = float(text)
+                data = coerce_value(text, dtype)
                 # L'index est désormais absolu (0-based pour la feuille)
                 # donc on utilise row_bias=0
                 excel_cell_index = self.index_to_excel_index(*index, row_bias=0)
                 self.ws[excel_cell_index] = data
+                self.track_cell(index[0] - header_offset, index[1], data)
                 style = self.translate_style(item_info)
                 self.apply_style(self.ws, excel_cell_index, style)
             return
@@ -214,21 +809,16 @@ class ExcelAgent(Observer):
         font_name = font.family()
         return font_name, font_size, 'FF' + font_color[1:], 'FF' + bg_color[1:]
 
+    @property
+    def styles(self):
+        # Le cache suit le classeur : il est recréé après un chargement ou une matérialisation
+        if self._styles is None or self._styles.wb is not self.wb:
+            self._styles = StyleCache(self.wb)
+        return self._styles
+
     def apply_style(self, sheet, index, style):
-        font_name, font_size, font_color, bg_color = style
-        font = Font(name=font_name,
-                    size=font_size,
-                    color=font_color)
-        fill = PatternFill(fill_type=None, start_color='FFFFFFFF', end_color=bg_color)
-        sheet[index].font = font
-        sheet[index].fill = fill
+        cell = sheet[index]
+        cell._style = copy(self.styles.style_array(style, cell._style))
 
     def insert_image(self, fig_dir):
-        imgnames = os.listdir(fig_dir)
-        if len(imgnames) == 0:
-            return
-        for i, imgname in enumerate(imgnames):
-            plot_ws = self.wb.create_sheet("graphique{}".format(i+1))
-            imgname = os.path.join(fig_dir, imgname)
-            img = Image(imgname)
-            plot_ws.add_image(img, 'A{}'.format(i + 1))
+        insert_images(self.wb, fig_dir)
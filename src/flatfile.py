@@ -0,0 +1,120 @@
+"""
+Fichiers plats (.csv, .parquet) : lus et écrits directement par pandas/pyarrow, sans passer par openpyxl.
+pyarrow est facultatif : sans lui, le Parquet passe par pd.read_parquet/to_parquet (fastparquet) ou est refusé.
+"""
+import codecs
+import csv
+import os
+import pandas as pd
+from pandas.api.types import infer_dtype
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = pq = None
+
+CSV_EXTENSIONS = ('.csv', '.tsv', '.txt')
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+# Lignes lues ou écrites par bloc : assez pour que pandas reste vectorisé, assez peu pour la progression
+FLAT_CHUNK_ROWS = 100000
+SNIFF_BYTES = 64 * 1024
+
+
+def is_csv(filename):
+    return os.path.splitext(filename)[1].lower() in CSV_EXTENSIONS
+
+
+def is_parquet(filename):
+    return os.path.splitext(filename)[1].lower() in PARQUET_EXTENSIONS
+
+
+def is_flat_file(filename):
+    return is_csv(filename) or is_parquet(filename)
+
+
+def sniff_csv(filename):
+    """Séparateur et encodage d'un CSV, devinés sur son début (les exports Excel français utilisent ; et cp1252)."""
+    with open(filename, 'rb') as f:
+        sample = f.read(SNIFF_BYTES)
+    try:
+        # Décodeur incrémental : un caractère coupé à la fin de l'échantillon n'est pas une erreur
+        text = codecs.getincrementaldecoder('utf-8-sig')().decode(sample)
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        text = sample.decode('cp1252', errors='replace')
+        encoding = 'cp1252'
+    # Dernière ligne de l'échantillon probablement incomplète
+    lines = text[:text.rfind('\n') + 1] or text
+    try:
+        sep = csv.Sniffer().sniff(lines, delimiters=',;\t|').delimiter
+    except csv.Error:
+        sep = '\t' if filename.lower().endswith('.tsv') else ','
+    return sep, encoding
+
+
+def read_flat_chunks(filename, chunk_rows=None):
+    """Blocs de DataFrame et nombre de lignes annoncé (0 si inconnu avant la fin de la lecture)."""
+    chunk_rows = chunk_rows or FLAT_CHUNK_ROWS
+    if is_parquet(filename):
+        if pq is None:
+            # Sans pyarrow, pandas essaie fastparquet : lecture en un seul bloc
+            return iter([pd.read_parquet(filename)]), 0
+        parquet = pq.ParquetFile(filename)
+        batches = parquet.iter_batches(batch_size=chunk_rows)
+        return (batch.to_pandas() for batch in batches), parquet.metadata.num_rows
+    sep, encoding = sniff_csv(filename)
+    reader = pd.read_csv(filename, sep=sep, encoding=encoding, encoding_errors='replace',
+                         chunksize=chunk_rows)
+    return iter(reader), 0
+
+
+def concat_chunks(chunks):
+    if not chunks:
+        return pd.DataFrame()
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def read_flat(filename):
+    chunks, _ = read_flat_chunks(filename)
+    return concat_chunks(list(chunks))
+
+
+def parquet_frame(df):
+    # Parquet veut des noms de colonnes textuels et un type par colonne :
+    # une colonne mélangée (saisie texte dans une colonne numérique) est écrite en texte
+    df = df.set_axis([str(name) for name in df.columns], axis=1)
+    for name in df.columns:
+        column = df[name]
+        if column.dtype == object and infer_dtype(column, skipna=True).startswith('mixed'):
+            df[name] = column.where(column.isna(), column.astype(str))
+    return df
+
+
+def export_flat(df, filename, progress=None, chunk_rows=None):
+    """Écrit le DataFrame en CSV ou Parquet par blocs, sans styles ni images."""
+    chunk_rows = chunk_rows or FLAT_CHUNK_ROWS
+    total = len(df)
+    if is_parquet(filename):
+        df = parquet_frame(df)
+        if pq is None:
+            df.to_parquet(filename, index=False)
+            if progress is not None:
+                progress(total, total)
+            return
+        schema = pyarrow.Schema.from_pandas(df, preserve_index=False)
+        with pq.ParquetWriter(filename, schema) as writer:
+            for start in range(0, max(total, 1), chunk_rows):
+                chunk = df.iloc[start:start + chunk_rows]
+                writer.write_table(pyarrow.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                if progress is not None:
+                    progress(min(start + chunk_rows, total), total)
+        return
+    # utf-8-sig : Excel reconnaît l'encodage à l'ouverture du CSV
+    with open(filename, 'w', encoding='utf-8-sig', newline='') as f:
+        for start in range(0, max(total, 1), chunk_rows):
+            df.iloc[start:start + chunk_rows].to_csv(f, header=start == 0, index=False)
+            if progress is not None:
+                progress(min(start + chunk_rows, total), total)
@@ -0,0 +1,225 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype, is_bool_dtype, infer_dtype
+
+# Opérations élémentaires sur le DataFrame de la feuille.
+# Elles sont partagées par la table et par le worker, qui rejoue les mêmes éditions
+# sur sa copie résidente : les deux côtés obtiennent exactement le même résultat.
+
+
+def coerce_value(text, dtype):
+    if text == '':
+        return None
+    try:
+        return dtype(text)
+    except Exception:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def set_cell(df, row, column, value):
+    try:
+        df.iat[row, column] = value
+    except (TypeError, ValueError):
+        # Type incompatible avec la colonne (ex : texte dans une colonne d'entiers)
+        name = df.columns[column]
+        df[name] = df[name].astype(object)
+        df.iat[row, column] = value
+
+
+def insert_empty_row(df, position):
+    new_row = pd.Series([None] * len(df.columns), index=df.columns)
+    if position <= 0:
+        return pd.concat([pd.DataFrame([new_row]), df]).reset_index(drop=True)
+    if position >= len(df):
+        df.loc[len(df)] = None
+        return df
+    return pd.concat([df.iloc[:position], pd.DataFrame([new_row]), df.iloc[position:]]).reset_index(drop=True)
+
+
+def insert_empty_rows(df, position, count):
+    if count == 1:
+        return insert_empty_row(df, position)
+    position = min(max(position, 0), len(df))
+    blank = pd.DataFrame([[None] * len(df.columns)] * count, columns=df.columns)
+    return pd.concat([df.iloc[:position], blank, df.iloc[position:]]).reset_index(drop=True)
+
+
+def delete_rows(df, positions):
+    positions = [p for p in positions if 0 <= p < len(df)]
+    if not positions:
+        return df
+    return df.drop(df.index[positions]).reset_index(drop=True)
+
+
+def insert_empty_column(df, position, name):
+    df.insert(max(0, position), name, None)
+    return df
+
+
+def delete_columns(df, names):
+    names = [name for name in names if name in df.columns]
+    if not names:
+        return df
+    return df.drop(columns=names)
+
+
+NUMERIC_KINDS = ('integer', 'floating', 'mixed-integer-float', 'decimal')
+
+
+def set_block(df, row, column, texts):
+    """Plage collée : lignes de textes à partir de (row, column), convertis et écrits colonne par colonne."""
+    height = max(0, min(len(texts), len(df) - row))
+    width = max((len(line) for line in texts), default=0)
+    for j in range(column, min(column + width, len(df.columns))):
+        series = df.iloc[:, j]
+        # Même conversion qu'une saisie : nombre dans une colonne numérique, texte sinon
+        # (une colonne object qui ne contient que des nombres et des vides compte comme numérique)
+        numeric = is_numeric_dtype(series) and not is_bool_dtype(series) or \
+            series.dtype == object and infer_dtype(series, skipna=True) in NUMERIC_KINDS
+        dtype = float if numeric else str
+        values = [coerce_value(line[j - column], dtype) if j - column < len(line) else None
+                  for line in texts[:height]]
+        try:
+            df.iloc[row:row + height, j] = values
+        except (TypeError, ValueError):
+            name = df.columns[j]
+            df[name] = df[name].astype(object)
+            df.iloc[row:row + height, j] = values
+    return df
+
+
+def set_values(df, row, column, values):
+    """Remet des valeurs déjà converties (annulation d'un collage)."""
+    height = len(values)
+    for k, j in enumerate(range(column, min(column + (len(values[0]) if values else 0), len(df.columns)))):
+        column_values = [line[k] for line in values]
+        name = df.columns[j]
+        try:
+            df.iloc[row:row + height, j] = column_values
+        except (TypeError, ValueError):
+            df[name] = df[name].astype(object)
+            df.iloc[row:row + height, j] = column_values
+    return df
+
+
+def restore_dtypes(df, dtypes):
+    # Types des colonnes d'avant une édition (les lignes vides insérées passent les colonnes en object)
+    if len(dtypes) != len(df.columns):
+        return df
+    for j, dtype in enumerate(dtypes):
+        if df.dtypes.iloc[j] != dtype:
+            try:
+                df.isetitem(j, df.iloc[:, j].astype(dtype))
+            except (TypeError, ValueError):
+                pass
+    return df
+
+
+def restore_rows(df, positions, rows):
+    """Remet des lignes supprimées (DataFrame rows) aux positions qu'elles avaient, triées."""
+    total = len(df) + len(rows)
+    restored = np.zeros(total, dtype=bool)
+    restored[positions] = True
+    order = np.empty(total, dtype=np.intp)
+    order[~restored] = np.arange(len(df))
+    order[restored] = len(df) + np.arange(len(rows))
+    rows = rows.set_axis(df.columns, axis=1)
+    return pd.concat([df, rows], ignore_index=True).take(order).reset_index(drop=True)
+
+
+def restore_columns(df, columns):
+    # columns : (position, nom, valeurs) par position croissante
+    for position, name, values in columns:
+        df.insert(min(position, len(df.columns)), name, pd.Series(values).to_numpy(), allow_duplicates=True)
+    return df
+
+
+def inverse_op(df, op):
+    """Opération qui défait op, relevée sur df juste avant que op ne lui soit appliquée."""
+    kind = op[0]
+    if kind == 'set':
+        return ('set', op[1], op[2], df.iat[op[1], op[2]])
+    if kind == 'set_block':
+        row, column, texts = op[1], op[2], op[3]
+        height = max(0, min(len(texts), len(df) - row))
+        width = max(0, min(max((len(line) for line in texts), default=0), len(df.columns) - column))
+        block = df.iloc[row:row + height, column:column + width]
+        return ('set_values', row, column, block.values.tolist())
+    if kind in ('insert_row', 'insert_rows'):
+        count = op[2] if kind == 'insert_rows' else 1
+        position = min(max(op[1], 0), len(df))
+        return ('delete_rows', list(range(position, position + count)))
+    if kind == 'delete_rows':
+        positions = sorted(set(p for p in op[1] if 0 <= p < len(df)))
+        return ('restore_rows', positions, df.iloc[positions].reset_index(drop=True))
+    if kind == 'insert_column':
+        return ('delete_columns', [op[2]])
+    if kind == 'delete_columns':
+        return ('restore_columns', [(j, name, df.iloc[:, j].copy()) for j, name in enumerate(df.columns)
+                                    if name in op[1]])
+    raise ValueError("Opération sans inverse : {}".format(kind))
+
+
+def original_positions(deleted, positions):
+    # Positions relevées après la suppression de deleted, ramenées aux positions d'avant
+    deleted = sorted(set(deleted))
+    result = []
+    k = 0
+    for position in sorted(set(positions)):
+        target = position + k
+        while k < len(deleted) and deleted[k] <= target:
+            k += 1
+            target = position + k
+        result.append(target)
+    return result
+
+
+def coalesce_ops(ops):
+    """Regroupe les suppressions et insertions qui se suivent : une seule opération par bloc d'édition."""
+    merged = []
+    for op in ops:
+        last = merged[-1] if merged else None
+        kind = op[0]
+        if kind == 'insert_row':
+            op, kind = ('insert_rows', op[1], 1), 'insert_rows'
+        if last is not None and last[0] == kind == 'delete_rows':
+            merged[-1] = ('delete_rows', sorted(set(last[1]) | set(original_positions(last[1], op[1]))))
+        elif last is not None and last[0] == kind == 'delete_columns':
+            merged[-1] = ('delete_columns', last[1] + [name for name in op[1] if name not in last[1]])
+        elif last is not None and last[0] == kind == 'insert_rows' and last[1] <= op[1] <= last[1] + last[2]:
+            merged[-1] = ('insert_rows', last[1], last[2] + op[2])
+        else:
+            merged.append(op)
+    return merged
+
+
+def apply_op(df, op):
+    kind = op[0]
+    if kind == 'set':
+        set_cell(df, op[1], op[2], op[3])
+        return df
+    if kind == 'set_block':
+        return set_block(df, op[1], op[2], op[3])
+    if kind == 'set_values':
+        return set_values(df, op[1], op[2], op[3])
+    if kind == 'dtypes':
+        return restore_dtypes(df, op[1])
+    if kind == 'insert_row':
+        return insert_empty_row(df, op[1])
+    if kind == 'restore_rows':
+        return restore_rows(df, op[1], op[2])
+    if kind == 'restore_columns':
+        return restore_columns(df, op[1])
+    if kind == 'insert_rows':
+        return insert_empty_rows(df, op[1], op[2])
+    if kind == 'delete_rows':
+        return delete_rows(df, op[1])
+    if kind == 'insert_column':
+        return insert_empty_column(df, op[1], op[2])
+    if kind == 'delete_columns':
+        return delete_columns(df, op[1])
+    raise ValueError("Opération inconnue : {}".format(kind))
@@ -1,7 +1,21 @@
 import subprocess
+import threading
 import sys
+import os
 import ast
+import pickle
+import time
 import astunparse
+from contextlib import contextmanager
+from enum import Enum
+from pathlib import Path
+from src.worker import read_message, write_message, read_buffers
+from src.transport import release_frames, release_frame
+from src.partition import is_partition_safe, split_frame, combine_results, SAMPLE_ROWS
+from src.utis import build_script
+from concurrent.futures import ThreadPoolExecutor
+
+project_path = str(Path(__file__).parent.parent)
 
 
 def wrap_in_try_except(code):
@@ -32,27 +46,361 @@ def wrap_in_try_except(code):
     return astunparse.unparse(parsed_code)
 
 
+class ExecutionStatus(Enum):
+    OK = 1
+    TIMEOUT = 2
+    MEMORY = 3
+    CANCELLED = 4
+    CRASHED = 5
+
+
+class ExecutionResult(object):
+    def __init__(self, stdout='', stderr='', result=None, has_result=False, status=ExecutionStatus.OK):
+        self.stdout = stdout
+        self.stderr = stderr
+        self.result = result
+        self.has_result = has_result
+        self.status = status
+        self.cached = False
+        # Durées des étapes (nom, secondes), dans l'ordre où elles se sont déroulées
+        self.timings = []
+        # Le worker qui a produit le résultat le garde : la table peut l'adopter sans le renvoyer
+        self.in_worker = True
+
+    @property
+    def budget_exceeded(self):
+        return self.status in (ExecutionStatus.TIMEOUT, ExecutionStatus.MEMORY)
+
+
 class PythonInterpreter(object):
-    def __init__(self):
-        # On retire le mode interactif '-i' qui cause des erreurs de syntaxe sur les blocs
-        self.start_cmd = [sys.executable, '-q', '-u']
+    def __init__(self, max_jobs=50, timeout=120, memory_limit=4 * 1024 ** 3):
+        # Worker persistant : pandas/numpy/matplotlib ne sont importés qu'une fois
+        self.start_cmd = [sys.executable, '-q', '-u', '-m', 'src.worker']
         self.process = None
+        self.max_jobs = max_jobs
+        self.jobs_done = 0
+        # Budgets par exécution : durée (s) surveillée ici, mémoire (octets) plafonnée dans le worker
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self._interrupt = None
+        # Versions des feuilles résidentes dans ce worker, par identifiant de session
+        self.sessions = {}
 
     def start_subprocess(self):
-        # recreate new subprocess for each call
         if self.process is not None:
-            self.process.kill()
+            self.stop()
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [project_path, env.get('PYTHONPATH')]))
         self.process = subprocess.Popen(self.start_cmd,
                                         stdin=subprocess.PIPE,
                                         stdout=subprocess.PIPE,
-                                        stderr=subprocess.PIPE,
-                                        text=True,
-                                        bufsize=0,
-                                        encoding='utf-8')
+                                        env=env)
+        self.jobs_done = 0
+        self.sessions = {}
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def exhausted(self):
+        return self.jobs_done >= self.max_jobs
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process.wait()
+        finally:
+            for stream in (self.process.stdin, self.process.stdout):
+                try:
+                    stream.close()
+                except Exception:
+                    pass
+            self.process = None
+
+    def execute(self, code):
+        result = self.run(code)
+        return result.stdout, result.stderr
+
+    def _kill(self, status):
+        # Appelé depuis le watchdog ou le thread GUI : la lecture bloquée reçoit EOF
+        self._interrupt = status
+        process = self.process
+        if process is not None and process.poll() is None:
+            process.kill()
+
+    def cancel(self):
+        self._kill(ExecutionStatus.CANCELLED)
+
+    def _exchange(self, code, sync, full):
+        request = {'op': 'exec', 'code': code, 'memory_limit': self.memory_limit, 'sent': time.time()}
+        if sync is not None:
+            request['session'] = sync.request(self.sessions.pop(sync.session_id, None), full)
+        buffers = []
+        try:
+            write_message(self.process.stdin, request)
+            response = read_message(self.process.stdout)
+            if response is not None and not response.get('stale'):
+                buffers = read_buffers(self.process.stdout, response['buffers'])
+                if buffers is None:
+                    response = None
+        except (OSError, ValueError):
+            response = None
+        finally:
+            if sync is not None and sync.handle is not None:
+                release_frame(sync.handle)
+                sync.handle = None
+        return response, buffers
+
+    def run(self, code, sync=None):
+        timings = []
+        if not self.is_alive() or self.exhausted():
+            start = time.perf_counter()
+            self.start_subprocess()
+            timings.append(('spawn', time.perf_counter() - start))
+        self._interrupt = None
+        watchdog = None
+        if self.timeout:
+            watchdog = threading.Timer(self.timeout, self._kill, args=(ExecutionStatus.TIMEOUT,))
+            watchdog.daemon = True
+            watchdog.start()
+        start = time.perf_counter()
+        try:
+            response, buffers = self._exchange(code, sync, full=False)
+            if response is not None and response.get('stale'):
+                # Le worker n'a pas la version de base de la session : on renvoie la feuille entière
+                response, buffers = self._exchange(code, sync, full=True)
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+            # Les DataFrames publiés pour ce code ne servent plus une fois la tâche terminée
+            release_frames(code)
+        round_trip = time.perf_counter() - start
+
+        if response is None:
+            # Le worker a été tué (budget, annulation) ou est mort en cours de route : on le recycle
+            try:
+                returncode = self.process.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                returncode = None
+            self.stop()
+            status = self._interrupt or ExecutionStatus.CRASHED
+            return ExecutionResult('', self.status_message(status, returncode), status=status)
+        self.jobs_done += 1
+        if sync is not None:
+            self.sessions[sync.session_id] = sync.version
+        timings.extend(self.worker_timings(response.get('timings', {}), round_trip))
+        if response['status'] == 'memory':
+            # Le tas du worker est probablement fragmenté : il sera remplacé
+            self.jobs_done = self.max_jobs
+            response = ExecutionResult(response['stdout'],
+                                       response['stderr'] + self.status_message(ExecutionStatus.MEMORY),
+                                       status=ExecutionStatus.MEMORY)
+        elif response['result'] is None:
+            response = ExecutionResult(response['stdout'], response['stderr'])
+        else:
+            start = time.perf_counter()
+            result = pickle.loads(response['result'], buffers=buffers)
+            timings.append(('decode_result', time.perf_counter() - start))
+            response = ExecutionResult(response['stdout'], response['stderr'], result, True)
+        response.timings = timings
+        return response
+
+    @staticmethod
+    def worker_timings(measured, round_trip):
+        # Étapes mesurées dans le worker ; le reste de l'aller-retour est du transfert
+        stages = [(name, measured[name]) for name in ('imports', 'apply_edits', 'load_frame', 'user_code',
+                                                      'encode_result') if name in measured]
+        stages.append(('transfer', max(0.0, round_trip - sum(seconds for _, seconds in stages))))
+        return stages
+
+    def status_message(self, status, returncode=None):
+        if status == ExecutionStatus.TIMEOUT:
+            return "Budget dépassé : l'exécution a duré plus de {} s et a été interrompue.\n".format(self.timeout)
+        if status == ExecutionStatus.MEMORY:
+            return "Budget dépassé : l'exécution a demandé plus de {} Mo de mémoire.\n".format(
+                self.memory_limit // 1024 ** 2)
+        if status == ExecutionStatus.CANCELLED:
+            return "Exécution annulée.\n"
+        return "Le processus d'exécution s'est arrêté de manière inattendue " \
+               "(code de sortie {}).\n".format(returncode)
+
+
+class JobControl(object):
+    """Regroupe les workers d'une même exécution pour pouvoir tout annuler d'un coup."""
+
+    def __init__(self):
+        self.cancelled = False
+        self._interpreters = set()
+        self._lock = threading.Lock()
+
+    def attach(self, interpreter):
+        with self._lock:
+            if self.cancelled:
+                return False
+            self._interpreters.add(interpreter)
+            return True
+
+    def detach(self, interpreter):
+        with self._lock:
+            self._interpreters.discard(interpreter)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            for interpreter in self._interpreters:
+                interpreter.cancel()
+
+
+class InterpreterPool(object):
+    def __init__(self, size=2, max_jobs=50, timeout=120, memory_limit=4 * 1024 ** 3, max_size=None):
+        # size workers restent préchauffés ; jusqu'à max_size pour les exécutions réparties
+        self.size = size
+        self.max_size = max(size, max_size or os.cpu_count() or size)
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self._idle = []
+        self._busy = set()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def _new_interpreter(self):
+        interpreter = PythonInterpreter(max_jobs=self.max_jobs, timeout=self.timeout,
+                                        memory_limit=self.memory_limit)
+        interpreter.start_subprocess()
+        return interpreter
+
+    def warm(self):
+        # Démarre les workers à l'avance : les imports se font pendant que l'utilisateur tape
+        with self._cond:
+            while not self._closed and len(self._idle) + len(self._busy) < self.size:
+                self._idle.append(self._new_interpreter())
+
+    def checkout(self, affinity=None, overflow=False):
+        limit = self.max_size if overflow else self.size
+        with self._cond:
+            while not self._idle and len(self._busy) >= limit and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                raise RuntimeError("Le pool d'interpréteurs est fermé")
+            interpreter = None
+            if affinity is not None:
+                # On privilégie le worker qui a déjà la feuille de cette session en mémoire
+                for candidate in self._idle:
+                    if affinity in candidate.sessions:
+                        interpreter = candidate
+                        break
+            if interpreter is not None:
+                self._idle.remove(interpreter)
+            else:
+                interpreter = self._idle.pop() if self._idle else self._new_interpreter()
+            self._busy.add(interpreter)
+            return interpreter
+
+    def checkin(self, interpreter):
+        with self._cond:
+            self._busy.discard(interpreter)
+            surplus = len(self._idle) + len(self._busy) >= self.size and not interpreter.sessions
+            if self._closed or surplus:
+                # Les workers ajoutés pour une exécution répartie ne sont pas conservés
+                interpreter.stop()
+            else:
+                # Recyclage après N tâches ou après un crash : on repart d'un worker neuf, déjà préchauffé
+                if not interpreter.is_alive() or interpreter.exhausted():
+                    interpreter.start_subprocess()
+                self._idle.append(interpreter)
+            self._cond.notify()
+
+    @contextmanager
+    def worker(self, affinity=None, overflow=False):
+        interpreter = self.checkout(affinity, overflow)
+        try:
+            yield interpreter
+        finally:
+            self.checkin(interpreter)
 
     def execute(self, code):
-        self.start_subprocess()
-        self.process.stdin.write(code)
-        self.process.stdin.close()  # Important: close stdin to signal that no more input will be sent
-        stdout, stderr = self.process.communicate()
-        return stdout, stderr
+        with self.worker() as interpreter:
+            return interpreter.execute(code)
+
+    def run(self, code, sync=None, control=None, overflow=False):
+        affinity = sync.session_id if sync is not None else None
+        start = time.perf_counter()
+        with self.worker(affinity, overflow) as interpreter:
+            queued = time.perf_counter() - start
+            if control is not None and not control.attach(interpreter):
+                release_frames(code)
+                return ExecutionResult('', interpreter.status_message(ExecutionStatus.CANCELLED),
+                                       status=ExecutionStatus.CANCELLED)
+            try:
+                response = interpreter.run(code, sync)
+                response.timings.insert(0, ('queue', queued))
+                return response
+            finally:
+                if control is not None:
+                    control.detach(interpreter)
+
+    def _map(self, code, function_name, frames, control):
+        scripts = [build_script(code, function_name, frame) for frame in frames]
+        try:
+            with ThreadPoolExecutor(max_workers=len(scripts)) as executor:
+                results = list(executor.map(lambda script: self.run(script, control=control, overflow=True),
+                                            scripts))
+        finally:
+            for script in scripts:
+                release_frames(script)
+        if any(not r.has_result or r.status != ExecutionStatus.OK or 'Traceback' in r.stderr for r in results):
+            return None
+        return results
+
+    def run_partitioned(self, code, function_name, df, parts=None, control=None):
+        """
+        Répartit une fonction ligne à ligne sur plusieurs workers et recolle les morceaux.
+        Renvoie None dès que le découpage n'est pas sûr : l'appelant exécute alors normalement.
+        """
+        parts = min(parts or self.max_size, len(df))
+        if parts < 2 or not is_partition_safe(code, function_name):
+            return None
+        # Vérification empirique sur un échantillon : découpé ou non, le résultat doit être identique
+        sample = df.iloc[:SAMPLE_ROWS]
+        checks = self._map(code, function_name, [sample] + split_frame(sample, 2), control)
+        if checks is None:
+            return None
+        whole = checks[0].result
+        pieces = combine_results([check.result for check in checks[1:]])
+        if pieces is None or not isinstance(whole, type(pieces)) or not whole.equals(pieces):
+            return None
+
+        results = self._map(code, function_name, split_frame(df, parts), control)
+        if results is None:
+            return None
+        combined = combine_results([r.result for r in results])
+        if combined is None:
+            return None
+        response = ExecutionResult(''.join(r.stdout for r in results), ''.join(r.stderr for r in results),
+                                   combined, True)
+        # Le résultat recollé n'existe dans aucun worker
+        response.in_worker = False
+        return response
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for interpreter in idle:
+            interpreter.stop()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool():
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None or _default_pool._closed:
+            _default_pool = InterpreterPool()
+        return _default_pool
@@ -1,25 +1,34 @@
 from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, \
     QHBoxLayout, QTextEdit, QShortcut, QMenuBar, \
     QMenu, QAction, QScrollArea, QLabel, QTabWidget, \
-    QComboBox, QInputDialog, QMessageBox, QPushButton, QFileDialog
-from PyQt5.QtGui import QKeySequence, QIcon
-from PyQt5.QtCore import Qt, QTimer, QThread, pyqtSignal
+    QComboBox, QInputDialog, QMessageBox, QPushButton, QFileDialog, QProgressBar
+from PyQt5.QtGui import QKeySequence, QIcon, QTextCursor
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 import sys
+import html
 import pandas as pd
 from src.richtext_display import CodeEditor
 from src.plotwin import PlotWidget
 from src.memo import TableMemo
-from src.utis import wrap_code, decodestdoutput, extract_func_info, resource_path, translate_to_conversational
-from src.interpreter import PythonInterpreter
+from src.utis import wrap_code, extract_code, extract_func_info, resource_path, translate_to_conversational, \
+    withoutconnect, is_code_answer, conversation_end, CODE_END
+from src.interpreter import get_default_pool, ExecutionStatus, JobControl
+from src.partition import is_partition_safe, PARTITION_MIN_ROWS
+from src.session import FrameSession
+from src.transport import publish_frame, release_frames
+from src.cache import ResultCache, WorkbookCache
+from src import profiler
+from src.profiler import TurnTrace, TraceLog
 from src.chatgpt import ChatBot
-from src.prompt_template import prompt, chart_prompt, prompt_en, chart_prompt_en, prompt_fr, chart_prompt_fr
+from src.prompt_template import prompt, chart_prompt, prompt_en, chart_prompt_en, prompt_fr, chart_prompt_fr, \
+    sheets_prompt, sheets_prompt_en
 from openai.error import APIError, AuthenticationError
 from enum import Enum
 from pathlib import Path
 import os
 from configparser import ConfigParser
 from src.logger import logger
-from src.tablewin import EnhancedTable, ResultTable
+from src.tablewin import EnhancedTable, ResultTable, MAX_RESIDENT_SHEETS
 from functools import partial
 import tempfile
 import shutil
@@ -28,15 +37,20 @@ project_path = Path(__file__).parent.parent
 
 
 class QChatBot(QThread):
+    # Morceaux de la réponse au fil de leur arrivée, puis réponse complète et nombre de tokens
+    text_signal = pyqtSignal(str)
     res_signal = pyqtSignal(tuple)
 
-    def __init__(self, bot, task, system_prompt, default_answer, exception_answer):
+    def __init__(self, bot, task, system_prompt, default_answer, exception_answer, stream=True):
         super(QChatBot, self).__init__()
         self.task = task
         self.system_prompt = system_prompt
         self.bot = bot
         self.default_answer = default_answer
         self.exception_answer = exception_answer
+        self.stream = stream
+        # Étape 'llm' close dès le code reçu : le nombre de tokens y est ajouté à la fin de la réponse
+        self.llm_span = None
 
     def run(self):
         if self.task == '':
@@ -44,7 +58,11 @@ class QChatBot(QThread):
             token_count = 0
         else:
             try:
-                answer, token_count = self.bot.get_response(self.task, self.system_prompt)
+                if self.stream:
+                    answer, token_count = self.bot.stream_response(self.task, self.system_prompt,
+                                                                   self.text_signal.emit)
+                else:
+                    answer, token_count = self.bot.get_response(self.task, self.system_prompt)
                 # On ne rajoute plus le préfixe technique #A: ici pour garder la conversation pure
                 answer = answer + '\n\n'
             except APIError:
@@ -55,17 +73,42 @@ class QChatBot(QThread):
 
 
 class QInterpreter(QThread):
-    res_signal = pyqtSignal(tuple)
+    res_signal = pyqtSignal(object)
 
-    def __init__(self, code):
+    def __init__(self, code, pool=None, sync=None, cache=None, cache_key=None, partition=None):
         super(QInterpreter, self).__init__()
         self.code = code
-        self.interpreter = PythonInterpreter()
+        self.pool = pool if pool is not None else get_default_pool()
+        self.sync = sync
+        self.cache = cache
+        self.cache_key = cache_key
+        # (source, nom de la fonction, df) : tentative d'exécution répartie avant l'exécution normale
+        self.partition = partition
+        self.control = JobControl()
 
     def run(self):
-        response = self.interpreter.execute(self.code)
+        response = None
+        if self.partition is not None:
+            source, function_name, df = self.partition
+            try:
+                response = self.pool.run_partitioned(source, function_name, df, control=self.control)
+            except Exception as e:
+                logger.debug(f"Exécution répartie abandonnée : {e}")
+        if response is None:
+            response = self.pool.run(self.code, self.sync, self.control)
+        else:
+            # Le script normal n'a pas été envoyé : ses DataFrames publiés sont libérés ici.
+            # La synchronisation préparée n'est pas envoyée non plus ; au tour suivant, le worker
+            # n'a pas la version de base attendue et reçoit la feuille entière.
+            release_frames(self.code)
+        if self.cache is not None and self.cache_key is not None and response.has_result \
+                and response.status == ExecutionStatus.OK and 'Traceback' not in response.stderr:
+            self.cache.store(self.cache_key, response)
         self.res_signal.emit(response)
 
+    def cancel(self):
+        self.control.cancel()
+
 
 class ChatWidget(QWidget):
     def __init__(self, main_win):
@@ -106,8 +149,13 @@ class ChatWidget(QWidget):
         self.reset_button.clicked.connect(main_win.reset_chat)
         self.reset_button.setStyleSheet("QPushButton { background-color: #f44336; color: white; border-radius: 5px; }")
 
+        self.cancel_button = QPushButton("Annuler l'exécution")
+        self.cancel_button.clicked.connect(main_win.cancel_execution)
+        self.cancel_button.setEnabled(False)
+
         hbox_btns = QHBoxLayout()
         hbox_btns.addWidget(self.send_button, 3)
+        hbox_btns.addWidget(self.cancel_button, 1)
         hbox_btns.addWidget(self.reset_button, 1)
         self.vbox.addLayout(hbox_btns)
 
@@ -135,7 +183,11 @@ class MainWin(QWidget):
         self.collapsed = False
         self.chat_widgets = None
         self.hbox = self.vbox = None
-        self.table_widget = None
+        self.book_table = None
+        # Table de la question en cours : le résultat y revient même si l'onglet a changé
+        self.turn_table = None
+        # Feuilles chargées, de la moins récemment affichée à la plus récente
+        self.resident_sheets = []
         self.code = None
         self.chat_thread = None
         self.interpreter_thread = None
@@ -148,6 +200,11 @@ class MainWin(QWidget):
         self.default_answer = None
         self.exception_answer = None
         self.fig_dir = tempfile.mkdtemp()
+        self.interpreter_pool = get_default_pool()
+        self.interpreter_pool.warm()
+        self.result_cache = ResultCache()
+        self.workbook_cache = WorkbookCache()
+        self.trace_log = TraceLog()
         self.recoder = TableMemo(self)
         self.load_tips_info(self.current_language)
         self.init_ui()
@@ -172,19 +229,29 @@ class MainWin(QWidget):
         self.hbox = hbox
         self.vbox = vbox
         # container to display excel data
-        self.table_widget = EnhancedTable(self.fig_dir)
+        self.frame_session = FrameSession()
+        # Première feuille : elle porte le classeur, les autres onglets partagent son ExcelAgent
+        self.book_table = self.create_sheet_table()
         self.sheet_tabs = QTabWidget()
         # self.result_table = ResultTable(self) # Supprimé pour l'environnement complet
         # self.table_widget.attach(self.result_table)
         self.sheet_tabs.setTabPosition(QTabWidget.South)
-        self.sheet_tabs.addTab(self.table_widget, 'Votre Feuille')
+        self.sheet_tabs.addTab(self.book_table, 'Votre Feuille')
+        self.sheet_tabs.currentChanged.connect(self.activate_sheet)
         # self.sheet_tabs.addTab(self.result_table, 'Réponse IA') # Supprimé
-        hbox.addWidget(self.sheet_tabs, 3)
+        # Progression de la lecture en flux des gros fichiers
+        self.load_progress = QProgressBar()
+        self.load_progress.setVisible(False)
+        sheet_box = QVBoxLayout()
+        sheet_box.addWidget(self.sheet_tabs)
+        sheet_box.addWidget(self.load_progress)
+        hbox.addLayout(sheet_box, 3)
 
         self.tabs = QTabWidget()
         self.tabs.setTabPosition(QTabWidget.West)
 
         self.chat_widget = ChatWidget(self)
+        self.chat_widget.chat_history.anchor_clicked.connect(self.toggle_trace)
         self.plot_widget = PlotWidget()
         self.tabs.addTab(self.chat_widget, "chat")
         self.tabs.addTab(self.plot_widget, 'graphique')
@@ -203,24 +270,30 @@ class MainWin(QWidget):
 
         openAct = QAction('Ouvrir', self)
         self.language_configs[openAct] = {'en': "&open", 'zh': "&Ouvrir", 'fr': "&Ouvrir"}
-        openAct.triggered.connect(self.table_widget.open_excel)
+        openAct.triggered.connect(self.open_excel)
         fileMenu.addAction(openAct)
         saveAct = QAction('Enregistrer', self)
         self.language_configs[saveAct] = {'en': "&save", 'zh': "&Enregistrer", 'fr': "&Enregistrer"}
-        saveAct.triggered.connect(self.table_widget.file_save)
+        saveAct.triggered.connect(self.book_table.file_save)
         fileMenu.addAction(saveAct)
 
         exportAct = QAction('Exporter les résultats IA', self)
         exportAct.triggered.connect(self.export_results)
         fileMenu.addAction(exportAct)
 
+        traceAct = QAction('Exporter la trace des temps', self)
+        self.language_configs[traceAct] = {'en': "&Export timing trace", 'zh': "&Exporter la trace des temps",
+                                           'fr': "&Exporter la trace des temps"}
+        traceAct.triggered.connect(self.export_trace)
+        fileMenu.addAction(traceAct)
+
         menubar.addMenu(fileMenu)
         # Creating menus using a title
         editMenu = menubar.addMenu("&Édition")
         self.language_configs[editMenu] = {'en': "&Edit", 'zh': "&Édition", 'fr': "&Édition"}
         undoAct = QAction('Annuler', self)
         self.language_configs[undoAct] = {'en': "&undo", 'zh': "&Annuler", 'fr': "&Annuler"}
-        undoAct.triggered.connect(self.table_widget.undo_modification)
+        undoAct.triggered.connect(lambda: self.table_widget.undo_modification())
         editMenu.addAction(undoAct)
 
         modelMenu = menubar.addMenu("&Modèle")
@@ -244,11 +317,83 @@ class MainWin(QWidget):
         hbox.setMenuBar(menubar)
 
         self.setLayout(hbox)
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.type_one_by_one)
-        self.current_index = 0
+        # Réponse en cours de réception : texte reçu, longueur déjà affichée, code déjà lancé
+        self.answer = None
+        self.shown = 0
+        self.code_sent = False
         self.load_tips_info()
 
+    @property
+    def table_widget(self):
+        # Feuille de l'onglet affiché
+        return self.sheet_tabs.currentWidget()
+
+    def create_sheet_table(self, sheet_name=None):
+        excel_agent = self.book_table.excel_agent if self.book_table is not None else None
+        table = EnhancedTable(self.fig_dir, self.workbook_cache, excel_agent, sheet_name)
+        table.attach(self.frame_session)
+        table.loading_progress.connect(self.show_load_progress)
+        table.loading_finished.connect(self.hide_load_progress)
+        table.saving_progress.connect(self.show_save_progress)
+        table.saving_finished.connect(self.finish_save)
+        return table
+
+    def open_excel(self):
+        if self.book_table.open_excel():
+            self.show_sheet_tabs()
+
+    def show_sheet_tabs(self):
+        # Un onglet par feuille, dans l'ordre du classeur ; seule la feuille active a été lue
+        book = self.book_table
+        self.sheet_tabs.blockSignals(True)
+        try:
+            for index in reversed(range(self.sheet_tabs.count())):
+                table = self.sheet_tabs.widget(index)
+                self.sheet_tabs.removeTab(index)
+                if table is not book:
+                    table.deleteLater()
+            for name in book.excel_agent.sheets or [book.sheet_name]:
+                table = book if name == book.sheet_name else self.create_sheet_table(name)
+                self.sheet_tabs.addTab(table, name)
+            self.sheet_tabs.setCurrentWidget(book)
+        finally:
+            self.sheet_tabs.blockSignals(False)
+        self.resident_sheets = [book]
+
+    def activate_sheet(self, index):
+        table = self.sheet_tabs.widget(index)
+        if table is None:
+            return
+        if not table.loaded and not table.is_streaming() and table.sheet_name is not None:
+            withoutconnect(EnhancedTable.load_sheet)(table)
+        if table in self.resident_sheets:
+            self.resident_sheets.remove(table)
+        self.resident_sheets.append(table)
+        # Au-delà du nombre de feuilles résidentes, la moins récemment affichée est libérée ;
+        # une feuille modifiée n'est plus relisible depuis le fichier et reste en mémoire
+        for old in list(self.resident_sheets[:-1]):
+            if len(self.resident_sheets) <= MAX_RESIDENT_SHEETS:
+                break
+            if old.dirty or old.is_streaming() or old.is_saving():
+                continue
+            old.unload()
+            self.resident_sheets.remove(old)
+
+    def sheet_sources(self, table):
+        """Autres feuilles accessibles au code généré par sheet(nom)."""
+        sources = {}
+        for index in range(self.sheet_tabs.count()):
+            other = self.sheet_tabs.widget(index)
+            if other is table or other.sheet_name is None:
+                continue
+            if other.dirty and other.dataframe is not None:
+                # Modifiée dans l'application : le fichier n'est plus à jour, le DataFrame est publié
+                sources[other.sheet_name] = publish_frame(other.dataframe)
+            elif other.excel_agent.filename:
+                header = other.header_row_idx - 1 if other.loaded else 0
+                sources[other.sheet_name] = (other.excel_agent.filename, header)
+        return sources
+
     def load_tips_info(self, language=None):
         lan = self.current_language if language is None else language
         if os.path.exists(resource_path(os.path.join('src', 'tips_info.ini'))):
@@ -295,82 +440,161 @@ class MainWin(QWidget):
             self.chat_widget.setVisible(True)
             self.collapsed = False
 
-    def type_one_by_one(self):
-        def is_python_source_code(s):
-            # Détection plus stricte : contient [CODE] ou des mots clés Python typiques du projet
-            return "[CODE]" in s or ("def process_data" in s) or ("df[" in s and "=" in s)
-
-        if not self.answer:
+    def ask(self, task, system_prompt, **args):
+        self.answer = ''
+        self.shown = 0
+        self.code_sent = False
+        self.chat_widget.switch_mode_box.setEnabled(False)
+        self.chat_thread = QChatBot(self.bot, task, system_prompt, self.default_answer, self.exception_answer)
+        self.chat_thread.text_signal.connect(self.receive_text)
+        self.chat_thread.res_signal.connect(self.receive_answer)
+        profiler.begin('llm', **args)
+        self.chat_thread.start()
+
+    def receive_text(self, text):
+        # Les morceaux d'une question abandonnée (auto-correction relancée entre-temps) sont ignorés
+        if self.sender() is not self.chat_thread or self.answer is None:
             return
+        self.add_text(text)
 
-        # Si c'est du code (avec ou sans conversation), on traite le bloc
-        if self.current_index == 0 and is_python_source_code(self.answer):
-            self.code = self.answer
-            # On utilise notre utilitaire pour séparer proprement conversation et code
-            conversation, formula = translate_to_conversational(self.code)
-
-            # On n'affiche QUE la conversation de manière élégante
-            display_text = f"<br>🤖 {conversation}<br>"
-            if formula:
-                display_text += f"<small>📂 Logique appliquée : <code>{formula}</code></small><br>"
-
-            self.chat_widget.chat_history.append(display_text)
-            self.timer.stop()
-            self.answer = None
-            self.execute()
-            self.chat_widget.switch_mode_box.setEnabled(True)
+    def add_text(self, text):
+        if not text:
             return
-
-        # Comportement pour les messages purement textuels
-        if self.current_index < len(self.answer):
-            next_char = self.answer[self.current_index]
-            self.chat_widget.chat_history.insertPlainText(next_char)
-            self.current_index += 1
-        else:
-            self.code = self.answer
-            self.timer.stop()
-            self.answer = None
-            self.chat_widget.switch_mode_box.setEnabled(True)
+        if not self.answer:
+            profiler.begin('display')
+            self.chat_widget.chat_history.append("<br>🤖 ")
+        self.answer += text
+        self.show_answer()
+
+    def insert_answer_text(self, text):
+        history = self.chat_widget.chat_history
+        history.moveCursor(QTextCursor.End)
+        history.insertPlainText(text)
+
+    def show_answer(self, final=False):
+        """Affiche la conversation reçue jusqu'ici ; le code est lancé dès que son bloc est complet."""
+        if self.code_sent:
+            return
+        end = conversation_end(self.answer, final)
+        if end > self.shown:
+            text = self.answer[self.shown:end]
+            if not self.answer[:self.shown].strip():
+                text = text.lstrip()
+            self.insert_answer_text(text)
+            self.shown = end
+        if CODE_END in self.answer or (final and is_code_answer(self.answer)):
+            self.run_answer_code()
+
+    def run_answer_code(self):
+        # La suite de l'explication n'est pas attendue : seule la conversation avant le code est affichée
+        self.code_sent = True
+        self.code = self.answer
+        conversation, formula = translate_to_conversational(self.code)
+        if not self.answer[:self.shown].strip():
+            self.insert_answer_text(conversation)
+        if formula:
+            self.chat_widget.chat_history.append(f"<small>📂 Logique appliquée : <code>{formula}</code></small><br>")
+        self.chat_thread.llm_span = profiler.end('llm', streamed=True)
+        profiler.end('display')
+        self.execute()
 
     def execute(self):
+        table = self.turn_table or self.table_widget
+        table.flush()
         if self.mode == Mode.CHAT_MODE:
-            code = wrap_code(self.code, self.table_widget.dataframe)
-            self.interpreter_thread = QInterpreter(code)
+            df = table.dataframe
+            # Même code sur les mêmes données : le résultat est relu sur disque, sans exécution
+            profiler.begin('cache_lookup')
+            source, _ = extract_code(self.code)
+            cache_key = self.result_cache.key(source, self.frame_session.fingerprint(df)) if source else None
+            cached = self.result_cache.load(cache_key) if cache_key else None
+            profiler.end('cache_lookup', hit=cached is not None)
+            if cached is not None:
+                logger.debug(f"Résultat trouvé dans le cache ({cache_key[:12]})")
+                cached.cached = True
+                cached.in_worker = False
+                cached.timings = []
+                self.receive_output(cached)
+                return
+
+            # La feuille reste en mémoire dans le worker : seules les éditions depuis la dernière question voyagent
+            profiler.begin('wrap_code')
+            sync = self.frame_session.prepare(df)
+            code = wrap_code(self.code, self.frame_session.handle, self.sheet_sources(table))
+            partition = None
+            if df is not None and len(df) >= PARTITION_MIN_ROWS and source:
+                # Grande feuille et fonction ligne à ligne : répartie sur plusieurs workers
+                _, function_name = extract_code(self.code)
+                if is_partition_safe(source, function_name):
+                    partition = (source, function_name, df)
+            profiler.end('wrap_code', partitioned=partition is not None)
+            self.interpreter_thread = QInterpreter(code, self.interpreter_pool, sync,
+                                                   self.result_cache, cache_key, partition)
             self.interpreter_thread.res_signal.connect(self.receive_output)
+            self.chat_widget.cancel_button.setEnabled(True)
+            profiler.begin('execution')
             self.interpreter_thread.start()
         elif self.mode == Mode.PLOT_MODE:
-            df = self.table_widget.dataframe
+            df = table.dataframe
+            profiler.begin('plot')
             func_names, func_args, func_kwargs = extract_func_info(self.code, df)
             self.plot_widget.new_axes()
             self.plot_widget.call_func(func_names, func_args, func_kwargs)
             self.plot_widget.add_figure()
             self.plot_widget.save_fig(self.fig_dir)
             self.tabs.setCurrentIndex(1)
+            profiler.end('plot')
+            self.finish_trace()
+
+    def cancel_execution(self):
+        if self.interpreter_thread is not None and self.interpreter_thread.isRunning():
+            self.interpreter_thread.cancel()
 
     def receive_output(self, output):
-        stdout, stderror = output
-        try:
-            stdout = decodestdoutput(stdout)
-        except Exception:
-            # Si le décodage échoue, on affiche l'erreur brute pour diagnostiquer
-            if stderror:
-                self.chat_widget.chat_history.append(f"<font color='red'>Erreur système : {stderror}</font>")
+        trace = profiler.current()
+        if trace is not None:
+            execution = trace.end('execution')
+            if execution is not None:
+                # Étapes mesurées par le worker et le thread d'exécution, replacées dans le tour
+                trace.add_sequence(execution.start, output.timings, parent='execution')
+        with profiler.span('receive_output'):
+            retrying = self.show_output(output)
+        if not retrying:
+            self.finish_trace()
+
+    def show_output(self, output):
+        """Affiche le résultat ; True si une nouvelle tentative a été demandée au modèle."""
+        self.chat_widget.cancel_button.setEnabled(False)
+        # Le résultat arrive déjà désérialisé par le canal binaire du worker
+        stdout, stderror = output.result, output.stderr
+        # Un résultat venu du cache ou recollé depuis plusieurs workers n'existe dans aucun worker
+        self.frame_session.receive_result(output.result if output.in_worker else None)
+        if output.status == ExecutionStatus.CANCELLED:
+            self.chat_widget.chat_history.append(f"<i>{stderror}</i>")
             return
+        if output.budget_exceeded:
+            self.chat_widget.chat_history.append(f"<font color='red'>{stderror}</font>")
+            # Le modèle est relancé avec une consigne explicite : produire une version moins coûteuse
+            error_msg = f"Le code précédent a dépassé son budget d'exécution :\n{stderror}\n" \
+                        "Proposez une version beaucoup moins coûteuse (opérations vectorisées pandas/numpy, " \
+                        "sans iterrows ni apply imbriqués) et fournissez uniquement la nouvelle fonction process_data(df)."
+            return self.retry_with(error_msg)
+        if output.stdout.strip():
+            # Les print() de process_data restent séparés du résultat
+            self.chat_widget.chat_history.append(f"<pre>{html.escape(output.stdout.strip())}</pre>")
         self.stdout = stdout
         self.stderro = stderror
         if 'Traceback' in stderror:
             self.chat_widget.chat_history.append(f"<font color='red'>{self.execution_error}\nDétails : {stderror}</font>")
 
             # BOUCLE DE RÉTROACTION (Auto-correction)
-            if self.retry_count < self.max_retries:
-                self.retry_count += 1
-                error_msg = f"Le code précédent a généré une erreur :\n{stderror}\nVeuillez corriger le code et fournir uniquement la nouvelle fonction process_data(df)."
-                self.chat_widget.chat_history.append(f"<i>Tentative d'auto-correction {self.retry_count}/{self.max_retries}...</i>")
-
-                system_prompt = self.format_prompt("")
-                self.chat_thread = QChatBot(self.bot, error_msg, system_prompt, self.default_answer, self.exception_answer)
-                self.chat_thread.res_signal.connect(self.receive_answer)
-                self.chat_thread.start()
+            error_msg = f"Le code précédent a généré une erreur :\n{stderror}\nVeuillez corriger le code et fournir uniquement la nouvelle fonction process_data(df)."
+            return self.retry_with(error_msg)
+
+        if not output.has_result:
+            # Pas de résultat ni de trace : on affiche l'erreur brute pour diagnostiquer
+            if stderror:
+                self.chat_widget.chat_history.append(f"<font color='red'>Erreur système : {stderror}</font>")
             return
 
         # Si c'est un résultat simple (pas un tableau), on l'affiche dans le chat
@@ -378,12 +602,26 @@ class MainWin(QWidget):
             self.chat_widget.chat_history.append(f"\n<b>Résultat :</b> {stdout}\n")
 
         # display the output and handle the error
-        res = self.table_widget.insert_result(res=[stdout, stderror])
+        with profiler.span('insert_result', parent='receive_output'):
+            res = (self.turn_table or self.table_widget).insert_result(res=[stdout, stderror])
         # On ne change plus d'onglet automatiquement pour rester dans l'environnement Excel original
         # if res:
         #     self.sheet_tabs.setCurrentIndex(1)
 
+    def retry_with(self, error_msg):
+        if self.retry_count >= self.max_retries:
+            return False
+        self.retry_count += 1
+        self.chat_widget.chat_history.append(f"<i>Tentative d'auto-correction {self.retry_count}/{self.max_retries}...</i>")
+
+        system_prompt = self.format_prompt("")
+        self.ask(error_msg, system_prompt, retry=self.retry_count)
+        return True
+
     def chat(self):
+        if self.table_widget.is_streaming():
+            # Le DataFrame n'existe pas encore : la question attendra la fin du chargement
+            return
         if self.api_key is None:
             text, ok = QInputDialog.getText(self, self.api_win_title, self.input_tip)
             if ok:
@@ -403,17 +641,19 @@ class MainWin(QWidget):
             display_user_msg = f"<br>👤 <b>Vous :</b><br>{message}<br>"
             self.chat_widget.chat_history.append(display_user_msg)
             self.chat_widget.user_input.clear()
-            if self.table_widget.df_agent.df is not None:
+            # Chaque question ouvre un tour mesuré, clos à l'affichage du résultat
+            profiler.activate(TurnTrace(message))
+            self.turn_table = self.table_widget
+            # Le prompt décrit le DataFrame tel que l'utilisateur le voit, éditions récentes comprises
+            self.turn_table.flush()
+            if self.turn_table.df_agent.df is not None:
                 system_prompt = self.format_prompt("") # On passe une tâche vide pour avoir juste le template avec les infos du DF
             else:
                 system_prompt = ''
 
             # get response from llm
-            # using QThread to avoid GUI freeze
-            self.chat_widget.switch_mode_box.setEnabled(False)
-            self.chat_thread = QChatBot(self.bot, task, system_prompt, self.default_answer, self.exception_answer)
-            self.chat_thread.res_signal.connect(self.receive_answer)
-            self.chat_thread.start()
+            # using QThread to avoid GUI freeze ; la réponse s'affiche au fil de sa réception
+            self.ask(task, system_prompt)
 
         return
 
@@ -426,14 +666,21 @@ class MainWin(QWidget):
 
         # On remplace l'ancien formattage qui incluait la question directe.
         # Maintenant le template sert de System Prompt contenant les infos du DF.
-        if self.table_widget.dataframe is None:
+        table = self.turn_table or self.table_widget
+        if table.dataframe is None:
             return ""
 
         # On extrait la partie du template avant la question pour le prompt système
         # Note: on adapte le template pour qu'il ne demande pas la question à la fin
-        system_prompt = template_prompt.format(self.table_widget.df_agent.shape,
-                                            self.table_widget.df_agent.head(3),
-                                            self.table_widget.df_agent.dtypes, "{}")
+        system_prompt = template_prompt.format(table.df_agent.shape,
+                                            table.df_agent.head(3),
+                                            table.df_agent.dtypes, "{}")
+        others = [name for name in table.excel_agent.sheets if name != table.sheet_name]
+        if self.mode == Mode.CHAT_MODE and others:
+            # Les autres feuilles ne sont décrites que par leur nom : elles sont lues à la demande
+            sheets_template = sheets_prompt_en if self.current_language == 'en' else sheets_prompt
+            names = ", ".join(repr(name) for name in others).replace('{', '{{').replace('}', '}}')
+            system_prompt = sheets_template.format(names) + system_prompt
 
         # Si une tâche est fournie (cas de l'auto-correction), on l'injecte, sinon on laisse le placeholder
         if task:
@@ -442,11 +689,85 @@ class MainWin(QWidget):
 
     def receive_answer(self, res):
         answer, token_count = res
-        self.answer = answer
         self.token_count += token_count
         self.chat_widget.set_token_usage(self.token_count)
-        self.current_index = 0
-        self.timer.start(30)
+        thread = self.sender()
+        if getattr(thread, 'llm_span', None) is not None:
+            thread.llm_span.args['tokens'] = token_count
+        if thread is not self.chat_thread or self.answer is None:
+            return
+        profiler.end('llm', tokens=token_count)
+        if answer.startswith(self.answer):
+            # Réponse non diffusée (message par défaut) ou fin de la réponse diffusée
+            self.add_text(answer[len(self.answer):])
+            self.show_answer(final=True)
+        elif not self.code_sent:
+            # Réponse interrompue : le message d'erreur remplace la suite, rien n'est exécuté
+            self.insert_answer_text('\n' + answer)
+            self.answer = answer
+            self.shown = len(answer)
+        self.chat_widget.switch_mode_box.setEnabled(True)
+        if not self.code_sent:
+            # Réponse purement textuelle : le tour se termine avec son affichage
+            self.code = self.answer
+            profiler.end('display')
+            self.finish_trace()
+        self.answer = None
+
+    def show_load_progress(self, rows, total):
+        # La feuille reste consultable ; les questions attendent que le DataFrame soit construit
+        self.chat_widget.send_button.setEnabled(False)
+        self.load_progress.setVisible(True)
+        self.load_progress.setMaximum(max(total, rows) if total else 0)
+        self.load_progress.setValue(rows)
+        self.load_progress.setFormat("Chargement : %v lignes")
+
+    def hide_load_progress(self):
+        self.load_progress.setVisible(False)
+        self.chat_widget.send_button.setEnabled(True)
+
+    def show_save_progress(self, done, total):
+        # L'enregistrement tourne dans un thread : la table et le chat restent utilisables
+        self.load_progress.setVisible(True)
+        self.load_progress.setMaximum(total)
+        self.load_progress.setValue(done)
+        self.load_progress.setFormat("Enregistrement : %p %")
+
+    def finish_save(self, path, error):
+        self.load_progress.setVisible(False)
+        if error:
+            msg = f"<i>Système : échec de l'enregistrement de {path} : {error}</i>"
+        else:
+            msg = f"<i>Système : fichier enregistré : {path}</i>"
+        self.chat_widget.chat_history.append(f"<br>{msg}<br>")
+
+    def finish_trace(self):
+        trace = profiler.current()
+        if trace is None:
+            return
+        profiler.activate(None)
+        self.trace_log.record(trace)
+        # Panneau repliable sous la réponse : un clic affiche le détail des étapes
+        self.chat_widget.chat_history.append(trace.summary_html())
+
+    def toggle_trace(self, anchor, position):
+        if not anchor.startswith('trace:'):
+            return
+        trace = self.trace_log.find(int(anchor.split(':', 1)[1]))
+        if trace is None:
+            return
+        trace.expanded = not trace.expanded
+        cursor = QTextCursor(self.chat_widget.chat_history.document())
+        cursor.setPosition(position)
+        cursor.movePosition(QTextCursor.StartOfBlock)
+        cursor.movePosition(QTextCursor.EndOfBlock, QTextCursor.KeepAnchor)
+        cursor.insertHtml(trace.summary_html(trace.expanded))
+
+    def export_trace(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Exporter la trace des temps", "trace.json", "*.json")
+        if path:
+            # Lisible dans chrome://tracing ou Perfetto
+            self.trace_log.export_chrome(path)
 
     def switch_mode(self, index):
         self.mode = Mode.PLOT_MODE if self.chat_widget.switch_mode_box.currentText() == "Graphique" else Mode.CHAT_MODE
@@ -456,8 +777,11 @@ class MainWin(QWidget):
             f.write(self.api_key)
 
     def export_results(self):
-        # Désormais, l'exportation sauvegarde le fichier Excel complet avec styles et fusions
-        self.table_widget.file_save()
+        # Valeurs de la feuille affichée : CSV et Parquet sont écrits par pandas/pyarrow, sans openpyxl
+        path, _ = QFileDialog.getSaveFileName(self, "Exporter les résultats", "",
+                                              "*.csv;;*.parquet;;*.xlsx;;All Files(*)")
+        if path:
+            self.table_widget.save_to(path)
 
     def new_sheet(self):
         # Créer un DataFrame vide avec des colonnes par défaut
@@ -479,6 +803,10 @@ class MainWin(QWidget):
         self.chat_widget.set_token_usage(0)
 
     def closeEvent(self, event):
+        # Un enregistrement en cours est terminé avant de quitter
+        self.book_table.flush()
+        self.book_table.wait_for_save()
+        self.interpreter_pool.shutdown()
         try:
             shutil.rmtree(self.fig_dir)
         except:
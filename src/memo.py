@@ -1,5 +1,20 @@
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from enum import Enum
+import pickle
+import sys
+import zlib
+import pandas as pd
+from src.logger import logger
+
+# Mémoire maximale de l'historique d'annulation, par table
+UNDO_MAX_BYTES = 128 * 1024 ** 2
+# Estimation de la place d'un TableItemInfo (police et couleurs comprises)
+CELL_INFO_BYTES = 512
+# Compression des tableaux gardés par l'historique, hors du thread de l'interface
+_compressor = ThreadPoolExecutor(max_workers=1)
 
 
 class ModificationType(Enum):
@@ -14,6 +29,8 @@ class ModificationType(Enum):
 
 
 class TableItemInfo(object):
+    __slots__ = ('index', 'dtype', 'text', 'column_name', 'font', 'font_size', 'font_color', 'bg_color')
+
     def __init__(self,
                  index,
                  dtype,
@@ -33,10 +50,11 @@ class TableItemInfo(object):
         self.bg_color = bg_color
 
 
-def build_item_info(item, index, column_name):
-    def clone(obj):
-        return type(obj)(obj)
+def clone(obj):
+    return type(obj)(obj)
 
+
+def build_item_info(item, index, column_name):
     font = clone(item.font())
     dtype = item.custom_dtype
     font_size = font.pointSize()
@@ -46,16 +64,80 @@ def build_item_info(item, index, column_name):
     return info
 
 
+class SnapShotColumn(object):
+    """Une colonne du TableSnapShot : tableaux indexés par ligne, -1 en style pour une cellule absente."""
+    __slots__ = ('texts', 'dtypes', 'style_ids')
+
+    def __init__(self):
+        self.texts = []
+        self.dtypes = array('H')
+        self.style_ids = array('i')
+
+    def grow(self, rows):
+        missing = rows - len(self.texts)
+        if missing > 0:
+            self.texts.extend([None] * missing)
+            self.dtypes.extend(array('H', [0]) * missing)
+            self.style_ids.extend(array('i', [-1]) * missing)
+
+
 class TableSnapShot(object):
+    """
+    État d'avant modification des cellules, rangé par colonne en tableaux : texte, numéro de type
+    et numéro de style par ligne (environ 14 octets par cellule plus le texte).
+    Police et couleurs sont partagées entre cellules de même style ; le TableItemInfo n'est construit
+    qu'à la demande, avec ses propres copies.
+    """
+
     def __init__(self):
-        self.memo = {}
+        self.columns = {}
+        self.column_names = {}
+        self._styles = []
+        self._style_ids = {}
+        self._dtypes = []
+        self._dtype_ids = {}
+        self._count = 0
+
+    def style_id(self, font, font_color, bg_color):
+        key = (font.toString(), font_color.rgba(), font_color.isValid(), bg_color.rgba(), bg_color.isValid())
+        style_id = self._style_ids.get(key)
+        if style_id is None:
+            style_id = self._style_ids[key] = len(self._styles)
+            self._styles.append((clone(font), clone(font_color), clone(bg_color)))
+        return style_id
+
+    def dtype_id(self, dtype):
+        dtype_id = self._dtype_ids.get(dtype)
+        if dtype_id is None:
+            dtype_id = self._dtype_ids[dtype] = len(self._dtypes)
+            self._dtypes.append(dtype)
+        return dtype_id
 
     def set(self, item, index, column_name):
-        info = build_item_info(item, index, column_name)
-        self.memo[index] = info
+        row, column = index
+        style_id = self.style_id(item.font(), item.foreground().color(), item.background().color())
+        snap = self.columns.get(column)
+        if snap is None:
+            snap = self.columns[column] = SnapShotColumn()
+        snap.grow(row + 1)
+        if snap.style_ids[row] < 0:
+            self._count += 1
+        snap.texts[row] = item.text()
+        snap.dtypes[row] = self.dtype_id(item.custom_dtype)
+        snap.style_ids[row] = style_id
+        self.column_names[column] = column_name
 
     def get(self, index):
-        return self.memo.get(index)
+        row, column = index
+        snap = self.columns.get(column)
+        if snap is None or not 0 <= row < len(snap.texts) or snap.style_ids[row] < 0:
+            return None
+        font, font_color, bg_color = self._styles[snap.style_ids[row]]
+        return TableItemInfo(index, self._dtypes[snap.dtypes[row]], snap.texts[row], self.column_names[column],
+                             clone(font), font.pointSize(), clone(font_color), clone(bg_color))
+
+    def __len__(self):
+        return self._count
 
 
 class Modification(object):
@@ -64,19 +146,150 @@ class Modification(object):
         self.item_infos = item_infos
 
 
+def payload_size(obj):
+    # Taille approximative des données gardées par une entrée de l'historique
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=False, deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=False, deep=True))
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(payload_size(value) for value in obj)
+    return sys.getsizeof(obj)
+
+
+def compress_columns(df):
+    return [zlib.compress(pickle.dumps(df.iloc[:, j].reset_index(drop=True), pickle.HIGHEST_PROTOCOL), 1)
+            for j in range(df.shape[1])]
+
+
+class FrameChunks(object):
+    """DataFrame gardé compressé, une colonne par bloc : l'historique ne garde pas les tableaux en clair."""
+    __slots__ = ('columns', 'rows', '_chunks', '_estimate')
+
+    def __init__(self, df, copy=True):
+        self.columns = list(df.columns)
+        self.rows = len(df)
+        self._estimate = int(df.memory_usage(index=False).sum())
+        # Compressé hors du thread GUI. Un DataFrame encore modifié par la table est d'abord copié ;
+        # copy=False pour un DataFrame que plus rien ne modifie (tableau remplacé)
+        self._chunks = _compressor.submit(compress_columns, df.copy() if copy else df)
+
+    @property
+    def chunks(self):
+        return self._chunks.result()
+
+    @property
+    def size(self):
+        if self._chunks.done():
+            return sum(len(chunk) for chunk in self.chunks)
+        return self._estimate
+
+    def frame(self):
+        columns = [pickle.loads(zlib.decompress(chunk)) for chunk in self.chunks]
+        df = pd.DataFrame(dict(enumerate(columns)), index=pd.RangeIndex(self.rows))
+        df.columns = self.columns
+        return df
+
+
+class CellCommand(object):
+    """Saisie ou mise en forme de cellules : état d'avant et d'après de chacune."""
+    __slots__ = ('before', 'after', 'size')
+
+    def __init__(self, before, after):
+        self.before = before
+        self.after = after
+        self.size = CELL_INFO_BYTES * (len(before) + len(after))
+
+    def undo(self, handle):
+        handle.restore_cells(self.before)
+
+    def redo(self, handle):
+        handle.restore_cells(self.after)
+
+
+class FrameCommand(object):
+    """Édition de structure ou collage : opérations de frameops pour refaire (forward) et défaire (backward)."""
+    __slots__ = ('forward', 'backward', 'size')
+
+    def __init__(self, forward, backward):
+        self.forward = forward
+        self.backward = backward
+        self.size = payload_size(forward) + payload_size(backward)
+
+    def undo(self, handle):
+        handle.replay_ops(self.backward)
+
+    def redo(self, handle):
+        handle.replay_ops(self.forward)
+
+
+class ResultCommand(object):
+    """Remplacement du tableau par un résultat de l'IA : les deux versions sont gardées compressées."""
+    __slots__ = ('before', 'after')
+
+    def __init__(self, before, after):
+        # before, after : (FrameChunks ou None, état de la vue)
+        self.before = before
+        self.after = after
+
+    @property
+    def size(self):
+        # Taille réelle une fois la compression terminée
+        return sum(state[0].size for state in (self.before, self.after) if state[0] is not None)
+
+    def undo(self, handle):
+        handle.replace_frame(*self.before)
+
+    def redo(self, handle):
+        handle.replace_frame(*self.after)
+
+
 class TableMemo(object):
-    def __init__(self, handle):
-        self._memos = []
+    """
+    Historique d'annulation et de rétablissement : une commande par édition. Au-delà de max_bytes,
+    les entrées les plus anciennes sont oubliées.
+    """
+
+    def __init__(self, handle, max_bytes=None):
+        self._undo = deque()
+        self._redo = []
         self.handle = handle
+        self.max_bytes = max_bytes or UNDO_MAX_BYTES
+
+    @property
+    def size(self):
+        return sum(entry.size for entry in self._undo) + sum(entry.size for entry in self._redo)
 
-    def backup(self):
-        self._memos.append(self.handle.save())
+    def record(self, command):
+        # Une nouvelle édition rend les rétablissements impossibles
+        self._redo = []
+        self._undo.append(command)
+        size = self.size
+        while self._undo and size > self.max_bytes:
+            size -= self._undo.popleft().size
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
 
     def undo(self):
-        if not len(self._memos):
+        if not self._undo:
+            return
+        command = self._undo.pop()
+        try:
+            command.undo(self.handle)
+        except Exception as e:
+            logger.info(f"Annulation impossible : {e}")
+        self._redo.append(command)
+
+    def redo(self):
+        if not self._redo:
             return
-        data = self._memos.pop()
+        command = self._redo.pop()
         try:
-            self.handle.restore(data)
-        except Exception:
-            pass
+            command.redo(self.handle)
+        except Exception as e:
+            logger.info(f"Rétablissement impossible : {e}")
+        self._undo.append(command)
@@ -1,7 +1,177 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import time
+import weakref
+from PyQt5.QtCore import QTimer
+from src.memo import Modification, ModificationType
+from src.logger import logger
+from src import profiler
+
+# Attente après la dernière modification avant de prévenir les agents, et attente maximale
+DEBOUNCE_MS = 80
+MAX_DELAY_MS = 500
+# Un seul thread pour toutes les tables : les onglets d'un classeur partagent son ExcelAgent
+_dispatcher = ThreadPoolExecutor(max_workers=1)
+_buses = weakref.WeakSet()
 
 
 class Observer(ABC):
+    # Vrai : prévenu sur le thread des observateurs, avec un TableEvent plutôt que la table
+    background = False
+
     @abstractmethod
     def _update(self, subject):
-        pass
\ No newline at end of file
+        pass
+
+
+class TableEvent(object):
+    """
+    Ce que les observateurs lisent de la table, figé au moment de la modification.
+    dataframe reste le DataFrame de la table, pour la comparaison des événements ;
+    le contenu à écrire est dans modification (textes des cellules, copie du tableau).
+    trace : tour de chat mesuré au moment de la modification, pas à celui de l'envoi.
+    """
+    __slots__ = ('modification', 'header_row_idx', 'sheet_name', 'dataframe', 'trace')
+
+    def __init__(self, modification, header_row_idx, sheet_name, dataframe, trace=None):
+        self.modification = modification
+        self.header_row_idx = header_row_idx
+        self.sheet_name = sheet_name
+        self.dataframe = dataframe
+        self.trace = trace
+
+    @classmethod
+    def capture(cls, table):
+        return cls(table.modification, table.header_row_idx, table.sheet_name, table.dataframe,
+                   profiler.current())
+
+
+def coalesce_events(last, event):
+    """
+    Événement équivalent à last suivi de event, ou None s'ils doivent rester séparés.
+    Saisies successives : une seule écriture par cellule. Éditions de structure successives :
+    leurs opérations sont enchaînées. Tableaux remplacés en entier : seul le dernier compte.
+    """
+    if (last.header_row_idx, last.sheet_name) != (event.header_row_idx, event.sheet_name):
+        return None
+    before, after = last.modification, event.modification
+    if before is None or after is None or before.mtype != after.mtype:
+        return None
+    if after.mtype == ModificationType.UPDATE_INPLACE:
+        if last.dataframe is not event.dataframe:
+            return None
+        infos = {info.index: info for info in before.item_infos if info is not None}
+        for info in after.item_infos:
+            if info is not None:
+                infos.pop(info.index, None)
+                infos[info.index] = info
+        modification = Modification(ModificationType.UPDATE_INPLACE, list(infos.values()))
+        return TableEvent(modification, event.header_row_idx, event.sheet_name, event.dataframe, event.trace)
+    if after.mtype == ModificationType.NEW_TABLE:
+        before_ops, after_ops = getattr(before, 'ops', None), getattr(after, 'ops', None)
+        if before_ops is None and after_ops is None:
+            return event
+        if before_ops is None or after_ops is None or getattr(after, 'previous', None) is not before.df:
+            return None
+        modification = Modification(ModificationType.NEW_TABLE, [])
+        modification.df = after.df
+        modification.previous = before.previous
+        modification.ops = list(before_ops) + list(after_ops)
+        return TableEvent(modification, event.header_row_idx, event.sheet_name, event.dataframe, event.trace)
+    return None
+
+
+def dispatch(batch):
+    for event, observers in batch:
+        for observer in observers:
+            try:
+                observer._update(event)
+            except Exception as e:
+                logger.info(f"Échec de la mise à jour de {type(observer).__name__} : {e}")
+
+
+class ObserverBus(object):
+    """
+    Observateurs d'une table. Les agents coûteux (background = True) ne sont pas prévenus
+    pendant la saisie : les modifications sont mises en file, fusionnées, puis transmises
+    sur un thread à part quand l'utilisateur marque une pause. flush() attend qu'elles soient
+    toutes appliquées, avant de lire ou d'enregistrer l'état des agents.
+    """
+
+    def __init__(self, parent=None, delay=DEBOUNCE_MS, max_delay=MAX_DELAY_MS):
+        self.observers = []
+        self._queue = []
+        # Dernier DataFrame de la table envoyé aux agents, et la copie qu'ils ont reçue à sa place
+        self._live = None
+        self._snapshot = None
+        self._since = None
+        self.max_delay = max_delay
+        self._timer = QTimer(parent)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay)
+        self._timer.timeout.connect(self.submit)
+        _buses.add(self)
+
+    def attach(self, observer):
+        self.observers.append(observer)
+
+    def detach(self, observer):
+        self.observers.remove(observer)
+
+    def publish(self, table):
+        background = tuple(observer for observer in self.observers if getattr(observer, 'background', False))
+        for observer in self.observers:
+            if not getattr(observer, 'background', False):
+                observer._update(table)
+        if not background:
+            return
+        event = self.capture(table)
+        if self._queue and self._queue[-1][1] == background:
+            merged = coalesce_events(self._queue[-1][0], event)
+            if merged is not None:
+                self._queue[-1] = (merged, background)
+            else:
+                self._queue.append((event, background))
+        else:
+            self._queue.append((event, background))
+        # La pause est attendue à nouveau à chaque modification, dans la limite de max_delay
+        now = time.monotonic()
+        if self._since is None:
+            self._since = now
+        if (now - self._since) * 1000 < self.max_delay or not self._timer.isActive():
+            self._timer.start()
+
+    def capture(self, table):
+        event = TableEvent.capture(table)
+        modification = event.modification
+        if modification is None or modification.mtype != ModificationType.NEW_TABLE \
+                or getattr(modification, 'df', None) is None:
+            return event
+        # La table continue de modifier son DataFrame sur place pendant que l'agent le relit :
+        # l'agent reçoit une copie, et la copie précédente tient lieu de version de départ
+        copy = Modification(ModificationType.NEW_TABLE, modification.item_infos)
+        copy.df = modification.df.copy()
+        previous = getattr(modification, 'previous', None)
+        copy.previous = self._snapshot if previous is not None and previous is self._live else previous
+        copy.ops = getattr(modification, 'ops', None)
+        self._live, self._snapshot = modification.df, copy.df
+        event.modification = copy
+        return event
+
+    def submit(self):
+        self._timer.stop()
+        self._since = None
+        batch, self._queue = self._queue, []
+        if batch:
+            return _dispatcher.submit(dispatch, batch)
+        return None
+
+    @property
+    def pending(self):
+        return len(self._queue)
+
+    def flush(self):
+        # Toutes les tables : un agent partagé entre onglets peut avoir du travail venant des autres
+        for bus in list(_buses):
+            bus.submit()
+        _dispatcher.submit(lambda: None).result()
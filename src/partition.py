@@ -0,0 +1,84 @@
+import ast
+import numpy as np
+import pandas as pd
+
+# Au-delà de ce nombre de lignes, une fonction ligne à ligne est répartie sur plusieurs workers
+PARTITION_MIN_ROWS = 200000
+SAMPLE_ROWS = 4096
+
+# Méthodes qui combinent plusieurs lignes : leur résultat dépend du découpage
+CROSS_ROW_METHODS = {
+    'groupby', 'sum', 'mean', 'median', 'min', 'max', 'std', 'var', 'sem', 'prod', 'count', 'size',
+    'nunique', 'unique', 'value_counts', 'mode', 'quantile', 'describe', 'agg', 'aggregate',
+    'transform', 'corr', 'cov', 'idxmax', 'idxmin', 'nlargest', 'nsmallest', 'all', 'any',
+    'sort_values', 'sort_index', 'rank', 'shift', 'diff', 'pct_change', 'cumsum', 'cumprod',
+    'cummax', 'cummin', 'rolling', 'expanding', 'ewm', 'resample', 'interpolate', 'ffill', 'bfill',
+    'merge', 'join', 'concat', 'pivot', 'pivot_table', 'melt', 'stack', 'unstack', 'crosstab',
+    'drop_duplicates', 'duplicated', 'head', 'tail', 'sample', 'reset_index', 'iloc', 'iat', 'at',
+    'T', 'transpose', 'shape', 'plot', 'hist', 'to_excel', 'to_csv', 'iterrows', 'itertuples', 'items',
+}
+CROSS_ROW_BUILTINS = {'len', 'sum', 'min', 'max', 'sorted', 'list', 'set', 'tuple', 'dict', 'enumerate',
+                      'zip', 'print', 'open', 'exec', 'eval', 'globals', 'sheet'}
+
+
+def find_function(tree, function_name):
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name == function_name:
+            return node
+    return None
+
+
+def is_partition_safe(code, function_name):
+    """
+    Analyse statique : la fonction n'utilise que des opérations ligne à ligne
+    (arithmétique sur colonnes, filtres, accesseurs .str/.dt, apply(axis=1)...).
+    Dans le doute, on répond non et l'exécution reste sur un seul processus.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return False
+    func = find_function(tree, function_name)
+    if func is None or len(func.args.args) != 1:
+        return False
+    df_name = func.args.args[0].arg
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.For, ast.AsyncFor, ast.While, ast.comprehension, ast.Global,
+                             ast.Nonlocal, ast.Import, ast.ImportFrom, ast.Yield, ast.YieldFrom)):
+            return False
+        if isinstance(node, ast.Attribute) and node.attr in CROSS_ROW_METHODS:
+            return False
+        if isinstance(node, ast.Name) and node.id in CROSS_ROW_BUILTINS:
+            return False
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'apply':
+            # df.apply(f) travaille par colonne ; seul apply(axis=1) (ou Series.apply) est ligne à ligne
+            receiver = node.func.value
+            axis = [k.value for k in node.keywords if k.arg == 'axis']
+            if isinstance(receiver, ast.Name) and receiver.id == df_name \
+                    and not (axis and isinstance(axis[0], ast.Constant) and axis[0].value in (1, 'columns')):
+                return False
+        if isinstance(node, ast.Call) and any(k.arg == 'method' for k in node.keywords):
+            # fillna(method='ffill') et consorts
+            return False
+    # La fonction doit renvoyer quelque chose dérivé de df
+    returns = [node for node in ast.walk(func) if isinstance(node, ast.Return) and node.value is not None]
+    return len(returns) > 0
+
+
+def split_frame(df, parts):
+    bounds = np.linspace(0, len(df), parts + 1).astype(int)
+    return [df.iloc[bounds[i]:bounds[i + 1]] for i in range(parts) if bounds[i + 1] > bounds[i]]
+
+
+def combine_results(results):
+    """Recolle les résultats partiels ; None si ce ne sont pas des morceaux de tableau."""
+    if not results:
+        return None
+    if all(isinstance(r, pd.DataFrame) for r in results):
+        columns = list(results[0].columns)
+        if any(list(r.columns) != columns for r in results):
+            return None
+        return pd.concat(results)
+    if all(isinstance(r, pd.Series) for r in results):
+        return pd.concat(results)
+    return None
@@ -0,0 +1,201 @@
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from src.logger import logger
+
+# Libellés affichés dans le panneau de détail sous chaque réponse
+STAGE_LABELS = {
+    'llm': "Appel au modèle",
+    'display': "Affichage de la réponse",
+    'cache_lookup': "Recherche dans le cache",
+    'wrap_code': "Préparation du code",
+    'execution': "Exécution",
+    'queue': "Attente d'un worker",
+    'spawn': "Démarrage du worker",
+    'imports': "Imports du worker",
+    'apply_edits': "Synchronisation de la feuille",
+    'load_frame': "Chargement du DataFrame",
+    'user_code': "Code généré",
+    'encode_result': "Encodage du résultat",
+    'transfer': "Transfert",
+    'decode_result': "Décodage du résultat",
+    'receive_output': "Traitement du résultat",
+    'insert_result': "Affichage dans la table",
+    'render_table': "Remplissage de la table",
+    'notify': "Mise à jour des observateurs",
+    'excel_writeback': "Report dans le classeur Excel",
+    'plot': "Tracé du graphique",
+}
+
+
+class Span(object):
+    def __init__(self, name, start, end=None, thread=None, args=None):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.thread = thread if thread is not None else threading.get_ident()
+        self.args = args or {}
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+
+class TurnTrace(object):
+    """Mesure les étapes d'un tour de chat, de la question jusqu'à l'affichage du résultat."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, label=''):
+        self.id = next(self._ids)
+        self.label = label
+        self.origin = time.perf_counter()
+        self.wall = time.time()
+        self.spans = []
+        self._open = {}
+        self._lock = threading.Lock()
+        # État du panneau de détail dans le chat
+        self.expanded = False
+
+    def begin(self, name, **args):
+        with self._lock:
+            self._open[name] = Span(name, time.perf_counter(), args=args)
+
+    def end(self, name, **args):
+        with self._lock:
+            span = self._open.pop(name, None)
+            if span is None:
+                return None
+            span.end = time.perf_counter()
+            span.args.update(args)
+            self.spans.append(span)
+            return span
+
+    @contextmanager
+    def span(self, name, **args):
+        self.begin(name, **args)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def add(self, name, start, end, thread=None, **args):
+        # Étape mesurée ailleurs (thread d'exécution, worker) et recopiée ici
+        with self._lock:
+            self.spans.append(Span(name, start, end, thread, args))
+
+    def add_sequence(self, start, timings, thread=None, parent=None):
+        """Place bout à bout des durées (secondes) mesurées sans horloge commune, à partir de start."""
+        for name, seconds in timings:
+            args = {'parent': parent} if parent else {}
+            self.add(name, start, start + seconds, thread, **args)
+            start += seconds
+
+    def finished(self):
+        return [span for span in self.spans if span.end is not None]
+
+    def total(self):
+        spans = self.finished()
+        if not spans:
+            return 0.0
+        return max(span.end for span in spans) - self.origin
+
+    def stages(self):
+        return sorted(self.finished(), key=lambda span: span.start)
+
+    def to_dict(self):
+        return {
+            'turn': self.id,
+            'label': self.label,
+            'started_at': self.wall,
+            'total_ms': round(self.total() * 1000, 3),
+            'stages': [{'name': span.name,
+                        'start_ms': round((span.start - self.origin) * 1000, 3),
+                        'duration_ms': round(span.duration * 1000, 3),
+                        **span.args} for span in self.stages()],
+        }
+
+    def chrome_events(self, pid=None):
+        pid = os.getpid() if pid is None else pid
+        events = [{'name': 'tour {}'.format(self.id), 'ph': 'X', 'pid': pid, 'tid': 0, 'cat': 'turn',
+                   'ts': self.wall * 1e6, 'dur': self.total() * 1e6, 'args': {'label': self.label}}]
+        for span in self.stages():
+            events.append({'name': span.name, 'ph': 'X', 'pid': pid, 'tid': span.thread, 'cat': 'stage',
+                           'ts': (self.wall + span.start - self.origin) * 1e6,
+                           'dur': span.duration * 1e6, 'args': span.args})
+        return events
+
+    def summary_html(self, expanded=False):
+        # Tient dans un seul paragraphe (<br>) : le panneau se replie en remplaçant le bloc
+        title = "⏱ {:.2f} s".format(self.total())
+        if not expanded:
+            return "<a href='trace:{}'><small>▸ {}</small></a>".format(self.id, title)
+        lines = ["<a href='trace:{}'><small>▾ {}</small></a>".format(self.id, title)]
+        for span in self.stages():
+            indent = "&nbsp;&nbsp;&nbsp;&nbsp;" if span.args.get('parent') else "&nbsp;&nbsp;"
+            lines.append("<small>{}{} : {:.1f} ms</small>".format(
+                indent, STAGE_LABELS.get(span.name, span.name), span.duration * 1000))
+        return "<br>".join(lines)
+
+
+class TraceLog(object):
+    """Garde les derniers tours mesurés, les écrit dans le log et les exporte au format Chrome trace."""
+
+    def __init__(self, maxlen=500):
+        self.traces = deque(maxlen=maxlen)
+
+    def record(self, trace):
+        self.traces.append(trace)
+        # Une ligne JSON par tour : exploitable directement depuis DEBUG.log
+        logger.info("trace " + json.dumps(trace.to_dict(), ensure_ascii=False, default=str))
+
+    def find(self, trace_id):
+        for trace in self.traces:
+            if trace.id == trace_id:
+                return trace
+        return None
+
+    def export_chrome(self, path):
+        events = []
+        for trace in self.traces:
+            events.extend(trace.chrome_events())
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+
+
+# Tour en cours : les étapes mesurées dans d'autres modules (table, classeur) s'y rattachent
+_active = None
+
+
+def activate(trace):
+    global _active
+    _active = trace
+
+
+def current():
+    return _active
+
+
+def begin(name, **args):
+    if _active is not None:
+        _active.begin(name, **args)
+
+
+def end(name, **args):
+    if _active is not None:
+        return _active.end(name, **args)
+    return None
+
+
+@contextmanager
+def span(name, **args):
+    trace = _active
+    if trace is None:
+        yield
+        return
+    with trace.span(name, **args):
+        yield
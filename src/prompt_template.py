@@ -71,3 +71,10 @@ chart_prompt_fr = "Vous êtes un expert en visualisation de données. " \
                   "[\ndf.shape:\n{}\n df.head:\n{}\n df.dtypes:\n{}\n]\n" \
                   "Question : {}.\n" \
                   "Répondez sous la balise [CODE] pour la partie technique."
+
+# Ajouté au prompt système quand le classeur contient d'autres feuilles
+sheets_prompt = "Autres feuilles du classeur : {}. " \
+                "Dans le code, sheet('nom') renvoie le DataFrame d'une de ces feuilles.\n"
+
+sheets_prompt_en = "Other sheets in the workbook: {}. " \
+                   "In the code, sheet('name') returns the DataFrame of one of these sheets.\n"
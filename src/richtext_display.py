@@ -1,7 +1,7 @@
 import sys
 from PyQt5.QtWidgets import QApplication, QMainWindow, QTextEdit, QVBoxLayout, QWidget
 from PyQt5.QtGui import QSyntaxHighlighter, QTextCharFormat, QFont, QTextDocument, QColor
-from PyQt5.QtCore import Qt, QRegExp
+from PyQt5.QtCore import Qt, QRegExp, pyqtSignal
 
 
 class PythonHighlighter(QSyntaxHighlighter):
@@ -79,11 +79,20 @@ class PythonHighlighter(QSyntaxHighlighter):
 
 
 class CodeEditor(QTextEdit):
+    # (lien, position dans le document) : QTextEdit n'ouvre pas les liens tout seul
+    anchor_clicked = pyqtSignal(str, int)
+
     def __init__(self):
         super(CodeEditor, self).__init__()
 
         self.highlighter = PythonHighlighter(self.document())
 
+    def mouseReleaseEvent(self, event):
+        super(CodeEditor, self).mouseReleaseEvent(event)
+        anchor = self.anchorAt(event.pos())
+        if anchor:
+            self.anchor_clicked.emit(anchor, self.cursorForPosition(event.pos()).position())
+
 
 class CodeHighlighterExample(QMainWindow):
     def __init__(self):
@@ -0,0 +1,122 @@
+import secrets
+import threading
+import pandas as pd
+from src.memo import ModificationType
+from src.observer import Observer
+from src.transport import publish_frame, SESSION_PREFIX
+from src.cache import frame_fingerprint
+
+
+class SessionSync(object):
+    """Ce qu'il faut envoyer au worker pour qu'il ait la version `version` de la feuille."""
+
+    def __init__(self, session_id, base, version, ops, frame, valid):
+        self.session_id = session_id
+        self.base = base
+        self.version = version
+        self.ops = ops
+        self.frame = frame
+        self.valid = valid
+        self.handle = None
+
+    def request(self, known_version, full=False):
+        request = {'id': self.session_id, 'version': self.version}
+        if self.frame is not None:
+            request['shape'] = self.frame.shape
+            request['columns'] = list(self.frame.columns)
+        if not full and self.valid and self.base is not None and known_version == self.base:
+            # Le worker a déjà la version de base : seules les éditions voyagent
+            request['base'] = self.base
+            request['ops'] = self.ops
+        else:
+            self.handle = publish_frame(self.frame)
+            request['frame'] = self.handle
+        return request
+
+
+class FrameSession(Observer):
+    """
+    Suit les modifications de la table pour qu'un worker garde la feuille en mémoire.
+    Chaque exécution produit une nouvelle version ; le worker qui possède la version
+    précédente ne reçoit que les éditions faites depuis.
+    """
+
+    def __init__(self):
+        self.id = secrets.token_hex(4)
+        self.version = 0
+        self.base = None
+        self.frame = None
+        self.ops = []
+        self.valid = False
+        self.last_result = None
+        # Empreintes par colonne, invalidées au fil des éditions (cache de résultats)
+        self._digests = {}
+        self._digest_frame = None
+        self._lock = threading.Lock()
+
+    @property
+    def handle(self):
+        return SESSION_PREFIX + self.id
+
+    def _update(self, subject):
+        modification = subject.modification
+        if modification is None:
+            return
+        mtype = modification.mtype
+        with self._lock:
+            if mtype == ModificationType.NEW_TABLE:
+                df = modification.df
+                if df is not None and df is self.last_result:
+                    # Le résultat de l'IA est déjà dans le worker : il suffit de l'adopter
+                    self.ops.append(('adopt',))
+                elif getattr(modification, 'ops', None) is not None \
+                        and getattr(modification, 'previous', None) is self.frame:
+                    self.ops.extend(modification.ops)
+                else:
+                    self.valid = False
+                self.frame = df
+            elif mtype == ModificationType.UPDATE_INPLACE:
+                df = subject.dataframe
+                if df is not self.frame:
+                    self.valid = False
+                    self.frame = df
+                for item_info in modification.item_infos:
+                    if item_info is None:
+                        continue
+                    row, column = item_info.index
+                    self._digests.pop(column, None)
+                    df_row = row - subject.header_row_idx
+                    if self.valid and 0 <= df_row < len(df) and column < len(df.columns):
+                        self.ops.append(('set', df_row, column, df.iat[df_row, column]))
+                return
+            else:
+                self.valid = False
+            self._digests.clear()
+
+    def prepare(self, df):
+        # Appelé sur le thread GUI au moment de la question : fige l'état à envoyer
+        with self._lock:
+            if df is not self.frame:
+                self.valid = False
+                self.frame = df
+            self.version += 1
+            sync = SessionSync(self.id, self.base, self.version, self.ops, df, self.valid)
+            self.base = self.version
+            self.ops = []
+            self.valid = True
+            return sync
+
+    def fingerprint(self, df):
+        # Seules les colonnes modifiées depuis le dernier calcul sont hachées à nouveau
+        with self._lock:
+            if df is not self._digest_frame:
+                self._digests.clear()
+                self._digest_frame = df
+            try:
+                return frame_fingerprint(df, self._digests)
+            except TypeError:
+                # Valeurs non hachables (listes, dict...) : pas de mise en cache possible
+                return None
+
+    def receive_result(self, result):
+        self.last_result = result if isinstance(result, pd.DataFrame) else None
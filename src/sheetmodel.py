@@ -0,0 +1,519 @@
+from itertools import compress
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, pyqtSignal
+from PyQt5.QtGui import QFont, QColor, QBrush
+from src.logger import logger
+from src.utis import hex_to_rgb
+
+# Modèle de la feuille : les valeurs viennent du DataFrame, il n'existe aucun objet par cellule.
+# Seules les cellules hors DataFrame (préambule, en-tête) ou retouchées sont gardées à part.
+
+
+def display_text(value):
+    if value is None or value is pd.NaT:
+        return ""
+    if isinstance(value, float):
+        if value != value:
+            return ""
+        # Comme Excel : un nombre entier stocké en flottant (colonne avec des vides) s'affiche sans décimale
+        if value.is_integer() and abs(value) < 1e16:
+            return str(int(value))
+    return str(value)
+
+
+def excel_column_name(j):
+    name = ''
+    j += 1
+    while j:
+        j, rest = divmod(j - 1, 26)
+        name = chr(65 + rest) + name
+    return name
+
+
+class CellFormat(object):
+    """Police, couleur du texte et couleur de fond d'une cellule (None : valeur par défaut)."""
+    __slots__ = ('font', 'foreground', 'background')
+
+    def __init__(self, font=None, foreground=None, background=None):
+        self.font = font
+        self.foreground = foreground
+        self.background = background
+
+
+def cell_format(cell):
+    """Traduit le style openpyxl d'une cellule (ou un CellStyle) en objets Qt."""
+    cell_font = cell.font
+    font_size = cell_font.size or 11
+    font = QFont(cell_font.name, int(font_size))
+    foreground = background = None
+
+    font_color = cell_font.color.rgb if cell_font.color else None
+    if isinstance(font_color, str) and len(font_color) >= 6:
+        try:
+            # Gérer les formats ARGB (8 hex) ou RGB (6 hex)
+            foreground = QColor(*hex_to_rgb(font_color[-6:]))
+        except Exception as e:
+            logger.debug(f"Erreur couleur texte: {e}")
+
+    if cell.fill and hasattr(cell.fill, 'fgColor') and cell.fill.fgColor:
+        bg_color = cell.fill.fgColor.rgb
+        if isinstance(bg_color, str) and len(bg_color) >= 6:
+            try:
+                hex_val = bg_color[-6:]
+                # Éviter le blanc pur ou les couleurs invalides par défaut d'Excel
+                if hex_val.upper() != "000000" or bg_color.startswith("FF"):
+                    background = QColor(*hex_to_rgb(hex_val))
+            except Exception as e:
+                logger.debug(f"Erreur couleur fond: {e}")
+    return CellFormat(font, foreground, background)
+
+
+class SheetItem(object):
+    """
+    Vue d'une cellule du modèle avec l'interface de QTableWidgetItem utilisée par la table,
+    la mémoire des modifications et les observateurs. Rien n'est stocké dans l'objet lui-même.
+    """
+    __slots__ = ('model', '_row', '_column')
+
+    def __init__(self, model, row, column):
+        self.model = model
+        self._row = row
+        self._column = column
+
+    def row(self):
+        return self._row
+
+    def column(self):
+        return self._column
+
+    def text(self):
+        return self.model.text(self._row, self._column)
+
+    def setText(self, text):
+        self.model.set_text(self._row, self._column, text)
+
+    @property
+    def custom_dtype(self):
+        return self.model.dtype(self._row, self._column)
+
+    @custom_dtype.setter
+    def custom_dtype(self, dtype):
+        self.model.dtypes[(self._row, self._column)] = dtype
+
+    def font(self):
+        return QFont(self.model.font(self._row, self._column) or QFont())
+
+    def setFont(self, font):
+        self.model.set_format(self._row, self._column, font=QFont(font))
+
+    def foreground(self):
+        color = self.model.cell_format(self._row, self._column).foreground
+        return QBrush(color) if color is not None else QBrush()
+
+    def setForeground(self, brush):
+        self.model.set_format(self._row, self._column, foreground=QBrush(brush).color())
+
+    def background(self):
+        color = self.model.cell_format(self._row, self._column).background
+        return QBrush(color) if color is not None else QBrush()
+
+    def setBackground(self, brush):
+        self.model.set_format(self._row, self._column, background=QBrush(brush).color())
+
+    def data(self, role):
+        return self.model.data(self.model.index(self._row, self._column), role)
+
+    def setData(self, role, value):
+        if role == Qt.ForegroundRole:
+            self.setForeground(value)
+        elif role == Qt.BackgroundRole:
+            self.setBackground(value)
+        elif role == Qt.FontRole:
+            self.setFont(value)
+        else:
+            self.setText(value)
+
+
+class SheetModel(QAbstractTableModel):
+    """
+    Lignes à partir de frame_row : lignes du DataFrame. Avant (préambule, en-tête) et autour :
+    valeurs gardées dans cells. Les styles du classeur sont des numéros par ligne (tuples partagés
+    entre lignes identiques), traduits en objets Qt au moment de l'affichage.
+    """
+    # (ligne, colonne) juste avant et juste après une modification de cellule
+    cell_about_to_change = pyqtSignal(int, int)
+    cell_changed = pyqtSignal(int, int)
+
+    def __init__(self, parent=None):
+        super(SheetModel, self).__init__(parent)
+        self.rows = 0
+        self.cols = 0
+        self.frame = None
+        self.frame_row = 1
+        # Lignes lues en flux avant que le DataFrame n'existe
+        self.raw_rows = None
+        self.cells = {}
+        self.dtypes = {}
+        self.formats = {}
+        self.styles = []
+        self.style_table = None
+        # Numéro de style -> CellFormat : un classeur n'a que quelques dizaines de styles distincts
+        self._style_formats = {}
+        self.bold_row = None
+        self.labels = None
+        self.editable = True
+        self.center_numbers = False
+        self._interned = {}
+
+    # --- Contenu ---
+
+    def reset(self, rows, cols, frame=None, frame_row=1, cells=None, styles=None, style_table=None,
+              bold_row=None, raw_rows=None):
+        self.beginResetModel()
+        self.rows = rows
+        self.cols = cols
+        self.frame = frame
+        self.frame_row = frame_row
+        self.raw_rows = raw_rows
+        self.cells = cells if cells is not None else {}
+        self.dtypes = {}
+        self.formats = {}
+        self._interned = {}
+        self.styles = [self.intern(row_styles) for row_styles in styles] if styles else []
+        self.style_table = style_table
+        self._style_formats = {}
+        self.bold_row = bold_row
+        self.endResetModel()
+
+    def intern(self, row_styles):
+        row_styles = tuple(row_styles)
+        return self._interned.setdefault(row_styles, row_styles)
+
+    def append_styles(self, row_styles):
+        self.styles.append(self.intern(row_styles))
+
+    def copy_row_styles(self, source, first, last):
+        # Lignes first..last-1 : même tuple de styles que la ligne source (partagé, pas recopié)
+        row_styles = self.styles[source] if 0 <= source < len(self.styles) else ()
+        if len(self.styles) < last:
+            self.styles.extend([()] * (last - len(self.styles)))
+        self.styles[first:last] = [row_styles] * (last - first)
+        if last > first:
+            self.dataChanged.emit(self.index(first, 0), self.index(last - 1, max(self.cols - 1, 0)))
+
+    def set_frame(self, frame):
+        if frame is self.frame:
+            return
+        self.frame = frame
+        if frame is not None:
+            # Le DataFrame fait foi : les textes retouchés dans sa zone ne servent plus
+            for key in [key for key in self.cells if key[0] >= self.frame_row]:
+                del self.cells[key]
+                self.dtypes.pop(key, None)
+        self.raw_rows = None
+        self.refresh()
+
+    def refresh(self):
+        if self.rows and self.cols:
+            self.dataChanged.emit(self.index(0, 0), self.index(self.rows - 1, self.cols - 1))
+
+    def set_shape(self, rows, cols):
+        if cols != self.cols:
+            if cols > self.cols:
+                self.beginInsertColumns(QModelIndex(), self.cols, cols - 1)
+                self.cols = cols
+                self.endInsertColumns()
+            else:
+                self.beginRemoveColumns(QModelIndex(), cols, self.cols - 1)
+                self.cols = cols
+                self.endRemoveColumns()
+        if rows != self.rows:
+            if rows > self.rows:
+                self.beginInsertRows(QModelIndex(), self.rows, rows - 1)
+                self.rows = rows
+                self.endInsertRows()
+            else:
+                self.beginRemoveRows(QModelIndex(), rows, self.rows - 1)
+                self.rows = rows
+                del self.styles[rows:]
+                self.endRemoveRows()
+
+    def frame_value(self, row, column):
+        frame = self.frame
+        r = row - self.frame_row
+        if frame is None or r < 0 or r >= len(frame) or column >= frame.shape[1]:
+            return None, False
+        value = frame.iat[r, column]
+        if isinstance(value, np.generic):
+            value = value.item()
+        return value, True
+
+    def value(self, row, column):
+        key = (row, column)
+        if key in self.cells:
+            return self.cells[key]
+        value, found = self.frame_value(row, column)
+        if found:
+            return value
+        if self.raw_rows is not None and row < len(self.raw_rows):
+            values = self.raw_rows[row]
+            if column < len(values):
+                return values[column]
+        return None
+
+    def text(self, row, column):
+        return display_text(self.value(row, column))
+
+    def dtype(self, row, column):
+        dtype = self.dtypes.get((row, column))
+        if dtype is not None:
+            return dtype
+        value = self.value(row, column)
+        return str if value is None or value == "" else type(value)
+
+    def set_text(self, row, column, text):
+        key = (row, column)
+        self.cell_about_to_change.emit(row, column)
+        if key not in self.dtypes:
+            # Une saisie garde le type d'origine de la cellule, comme custom_dtype sur un item
+            self.dtypes[key] = self.dtype(row, column)
+        self.cells[key] = text
+        index = self.index(row, column)
+        self.dataChanged.emit(index, index)
+        self.cell_changed.emit(row, column)
+
+    # --- Styles ---
+
+    def style_format(self, row, column):
+        if self.style_table is None or row >= len(self.styles):
+            return None
+        row_styles = self.styles[row]
+        if column >= len(row_styles) or not row_styles[column]:
+            return None
+        style_id = row_styles[column]
+        try:
+            # Objets Qt partagés par toutes les cellules du même style (jamais modifiés sur place)
+            return self._style_formats[style_id]
+        except KeyError:
+            style = self.style_table.resolve(style_id)
+            shared = self._style_formats[style_id] = cell_format(style) if style is not None else None
+            return shared
+
+    def cell_format(self, row, column):
+        base = self.style_format(row, column)
+        explicit = self.formats.get((row, column))
+        if explicit is None:
+            return base or CellFormat()
+        if base is None:
+            return explicit
+        return CellFormat(explicit.font or base.font,
+                          explicit.foreground if explicit.foreground is not None else base.foreground,
+                          explicit.background if explicit.background is not None else base.background)
+
+    def font(self, row, column):
+        font = self.cell_format(row, column).font
+        if row == self.bold_row:
+            font = QFont(font) if font is not None else QFont()
+            font.setBold(True)
+        return font
+
+    def set_format(self, row, column, **values):
+        key = (row, column)
+        self.cell_about_to_change.emit(row, column)
+        current = self.formats.get(key) or CellFormat()
+        self.formats[key] = CellFormat(values.get('font', current.font),
+                                       values.get('foreground', current.foreground),
+                                       values.get('background', current.background))
+        index = self.index(row, column)
+        self.dataChanged.emit(index, index)
+        self.cell_changed.emit(row, column)
+
+    # --- Interface Qt ---
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.rows
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.cols
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, column = index.row(), index.column()
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return self.text(row, column)
+        if role == Qt.FontRole:
+            return self.font(row, column)
+        if role == Qt.ForegroundRole:
+            color = self.cell_format(row, column).foreground
+            return QBrush(color) if color is not None else None
+        if role == Qt.BackgroundRole:
+            color = self.cell_format(row, column).background
+            return QBrush(color) if color is not None else None
+        if role == Qt.TextAlignmentRole and self.center_numbers:
+            value = self.value(row, column)
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and value == value:
+                return Qt.AlignCenter
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role not in (Qt.EditRole, Qt.DisplayRole):
+            return False
+        self.set_text(index.row(), index.column(), str(value))
+        return True
+
+    def flags(self, index):
+        flags = Qt.ItemIsSelectable | Qt.ItemIsEnabled
+        if self.editable:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Vertical:
+            return str(section + 1)
+        if self.labels is not None and section < len(self.labels):
+            return self.labels[section]
+        return excel_column_name(section)
+
+    # --- Structure : les clés des cellules retouchées suivent les lignes et colonnes ---
+
+    def _shift(self, mapping, axis, position, delta):
+        shifted = {}
+        for key, value in mapping.items():
+            index = key[axis]
+            if delta < 0 and position <= index < position - delta:
+                continue
+            if index >= position:
+                key = (key[0] + delta, key[1]) if axis == 0 else (key[0], key[1] + delta)
+            shifted[key] = value
+        return shifted
+
+    def _shift_all(self, axis, position, delta):
+        self.cells = self._shift(self.cells, axis, position, delta)
+        self.dtypes = self._shift(self.dtypes, axis, position, delta)
+        self.formats = self._shift(self.formats, axis, position, delta)
+
+    def insertRows(self, row, count=1, parent=QModelIndex()):
+        self.beginInsertRows(parent, row, row + count - 1)
+        self._shift_all(0, row, count)
+        if row <= len(self.styles):
+            self.styles[row:row] = [()] * count
+        self.rows += count
+        self.endInsertRows()
+        return True
+
+    def removeRows(self, row, count=1, parent=QModelIndex()):
+        self.beginRemoveRows(parent, row, row + count - 1)
+        self._shift_all(0, row, -count)
+        del self.styles[row:row + count]
+        self.rows -= count
+        self.endRemoveRows()
+        return True
+
+    def insertColumns(self, column, count=1, parent=QModelIndex()):
+        self.beginInsertColumns(parent, column, column + count - 1)
+        self._shift_all(1, column, count)
+        self.styles = [self.intern(s[:column] + (0,) * count + s[column:]) if column < len(s) else s
+                       for s in self.styles]
+        if self.labels is not None:
+            self.labels[column:column] = [''] * count
+        self.cols += count
+        self.endInsertColumns()
+        return True
+
+    def removeColumns(self, column, count=1, parent=QModelIndex()):
+        self.beginRemoveColumns(parent, column, column + count - 1)
+        self._shift_all(1, column, -count)
+        self.styles = [self.intern(s[:column] + s[column + count:]) if column < len(s) else s
+                       for s in self.styles]
+        if self.labels is not None:
+            del self.labels[column:column + count]
+        self.cols -= count
+        self.endRemoveColumns()
+        return True
+
+    def remove_rows(self, positions):
+        """Supprime des lignes quelconques en une passe : un seul reset plutôt qu'un removeRows par ligne."""
+        positions = sorted(set(p for p in positions if 0 <= p < self.rows))
+        if not positions:
+            return
+        if len(positions) == positions[-1] - positions[0] + 1:
+            self.removeRows(positions[0], len(positions))
+            return
+        removed = np.zeros(self.rows, dtype=bool)
+        removed[positions] = True
+        # Nouvelle position de chaque ligne gardée : moins les lignes supprimées au-dessus d'elle
+        before = np.cumsum(removed)
+
+        def moved(mapping):
+            return {(row - int(before[row]), column): value for (row, column), value in mapping.items()
+                    if row < self.rows and not removed[row]}
+
+        self.beginResetModel()
+        self.cells = moved(self.cells)
+        self.dtypes = moved(self.dtypes)
+        self.formats = moved(self.formats)
+        kept = ~removed
+        self.styles = list(compress(self.styles, kept[:len(self.styles)]))
+        if self.raw_rows is not None:
+            self.raw_rows = list(compress(self.raw_rows, kept[:len(self.raw_rows)])) + self.raw_rows[self.rows:]
+        self.rows -= len(positions)
+        self.endResetModel()
+
+    def insert_rows_at(self, positions):
+        """Insère des lignes vides aux positions finales données, en une passe (pendant de remove_rows)."""
+        positions = sorted(set(positions))
+        if not positions:
+            return
+        if len(positions) == positions[-1] - positions[0] + 1:
+            self.insertRows(positions[0], len(positions))
+            if positions[0] > 0:
+                self.copy_row_styles(positions[0] - 1, positions[0], positions[-1] + 1)
+            return
+        total = self.rows + len(positions)
+        inserted = np.zeros(total, dtype=bool)
+        inserted[positions] = True
+        # Position finale de chaque ligne existante
+        moved_to = np.flatnonzero(~inserted)
+
+        def moved(mapping):
+            return {(int(moved_to[row]), column): value for (row, column), value in mapping.items()
+                    if row < self.rows}
+
+        self.beginResetModel()
+        self.cells = moved(self.cells)
+        self.dtypes = moved(self.dtypes)
+        self.formats = moved(self.formats)
+        # Lignes insérées : styles de la ligne au-dessus
+        old_styles = iter(self.styles)
+        styles = []
+        for row in range(min(total, len(self.styles) + len(positions))):
+            if inserted[row]:
+                styles.append(styles[-1] if styles else ())
+            else:
+                styles.append(next(old_styles, ()))
+        self.styles = styles
+        self.rows = total
+        self.endResetModel()
+
+    def remove_columns(self, positions):
+        # Peu de colonnes : suppression par blocs contigus, en partant de la droite
+        positions = sorted(set(p for p in positions if 0 <= p < self.cols))
+        runs = []
+        for position in positions:
+            if runs and runs[-1][0] + runs[-1][1] == position:
+                runs[-1][1] += 1
+            else:
+                runs.append([position, 1])
+        for start, count in reversed(runs):
+            self.removeColumns(start, count)
+
+    def drop_cells(self, first_row, last_row, first_column, last_column):
+        # Textes retouchés remplacés par le DataFrame (plage collée) : ils ne doivent plus le masquer
+        for key in [key for key in self.cells
+                    if first_row <= key[0] < last_row and first_column <= key[1] < last_column]:
+            del self.cells[key]
+            self.dtypes.pop(key, None)
@@ -1,71 +1,283 @@
-from PyQt5.QtWidgets import QTableWidget, QTableWidgetItem, \
+from PyQt5.QtWidgets import QApplication, QTableView, QAbstractItemView, \
     QMenu, QAction, QShortcut, \
     QColorDialog, QFontDialog, QFileDialog
-from PyQt5.QtCore import Qt, QPoint
-from src.memo import TableMemo, Modification, TableSnapShot, ModificationType, build_item_info
+from PyQt5.QtCore import Qt, QPoint, QTimer, QThread, pyqtSignal
+from src.memo import TableMemo, Modification, TableSnapShot, ModificationType, build_item_info, \
+    CellCommand, FrameCommand, ResultCommand, FrameChunks
 from src.utis import withoutconnect, hex_to_rgb
+from src.frameops import apply_op, inverse_op, coalesce_ops, set_cell, coerce_value
 import pandas as pd
 from src.logger import logger
+from src import profiler
 from PyQt5.QtGui import QKeySequence, QIcon, QFont, QColor
-from src.excelio import ExcelAgent
-from src.dfagent import DataFrameAgent
+from src.excelio import ExcelAgent, StyleTable, row_values, pad_values, frame_from_values, export_frame
+from openpyxl.worksheet.cell_range import CellRange
+from src.dfagent import DataFrameAgent, repair_merged_headers
+from src.flatfile import is_flat_file, read_flat_chunks, concat_chunks, export_flat
+from src.sheetmodel import SheetModel, SheetItem
+from src.observer import ObserverBus
+from contextlib import contextmanager
 import tempfile
 import shutil
-
-
-class ResultTable(QTableWidget):
+import time
+import os
+from array import array
+
+# Au-delà de cette taille, le classeur est lu en flux et les styles ne sont appliqués qu'aux lignes affichées
+LARGE_FILE_BYTES = 4 * 1024 ** 2
+FIRST_SCREEN_ROWS = 100
+STREAM_SLICE_SECONDS = 0.05
+# Onglets de feuilles gardés en mémoire ; au-delà, la feuille la moins récemment affichée est libérée
+MAX_RESIDENT_SHEETS = 3
+# Lignes examinées pour ajuster la largeur des colonnes
+RESIZE_SAMPLE_ROWS = 200
+
+
+def detect_header_row(rows):
+    # La ligne la plus remplie parmi les 10 premières est l'en-tête (1-based)
+    header_row_idx = 1
+    max_non_empty = 0
+    for i, values in enumerate(rows, 1):
+        non_empty_count = sum(1 for value in values if value is not None and value != "")
+        if non_empty_count > max_non_empty:
+            max_non_empty = non_empty_count
+            header_row_idx = i
+    return header_row_idx
+
+
+class QSaver(QThread):
+    progress = pyqtSignal(int, int)
+    # Message d'erreur, vide si l'enregistrement a réussi
+    res_signal = pyqtSignal(str)
+
+    def __init__(self, path, save):
+        super(QSaver, self).__init__()
+        self.path = path
+        self.save = save
+        self.error = ''
+
+    def run(self):
+        try:
+            self.save(self.progress.emit)
+        except Exception as e:
+            logger.info(f"Échec de l'enregistrement : {e}")
+            self.error = str(e) or type(e).__name__
+        self.res_signal.emit(self.error)
+
+
+class ResultTable(QTableView):
     def __init__(self, parent=None):
         super(ResultTable, self).__init__(parent)
         self.setAlternatingRowColors(True)
-        self.setStyleSheet("QTableWidget { alternate-background-color: #f2f2f2; background-color: white; }")
-        self.setEditTriggers(QTableWidget.NoEditTriggers) # Lecture seule pour les résultats
+        self.setStyleSheet("QTableView { alternate-background-color: #f2f2f2; background-color: white; }")
+        # Lecture seule pour les résultats ; les nombres sont centrés
+        self.result_model = SheetModel(self)
+        self.result_model.editable = False
+        self.result_model.center_numbers = True
+        self.setModel(self.result_model)
+        self.horizontalHeader().setResizeContentsPrecision(RESIZE_SAMPLE_ROWS)
 
     def _update(self, subject):
         modifications = subject.modification
         mtype = modifications.mtype
         if mtype not in [ModificationType.NEW_TABLE]:
             return
-        self.clear() # clear() au lieu de clearContents pour réinitialiser aussi les headers
         df = modifications.df
         if df is None:
+            self.result_model.reset(0, 0)
             return
-
-        self.setRowCount(len(df))
-        self.setColumnCount(len(df.columns))
-        self.setHorizontalHeaderLabels(list(df.columns))
-
-        for i in range(len(df)):
-            for j in range(len(df.columns)):
-                val = df.iloc[i, j]
-                display_val = "" if pd.isna(val) else str(val)
-                item = QTableWidgetItem(display_val)
-
-                # Alignement au centre pour les chiffres
-                if isinstance(val, (int, float)) and not pd.isna(val):
-                    item.setTextAlignment(Qt.AlignCenter)
-
-                self.setItem(i, j, item)
-
+        # Le modèle lit le DataFrame à l'affichage : aucune cellule n'est recopiée
+        self.result_model.reset(len(df), len(df.columns), frame=df, frame_row=0)
+        self.result_model.labels = [str(name) for name in df.columns]
         self.resizeColumnsToContents()
 
 
-class EnhancedTable(QTableWidget):
-    _observers = []
+class TableEdit(object):
+    """
+    Éditions de structure et plages collées d'un même geste (voir EnhancedTable.edit).
+    La vue suit chaque opération ; le DataFrame n'est modifié qu'à la fin, en une fois,
+    et les observateurs reçoivent une seule Modification décrivant le changement net.
+    """
+
+    def __init__(self, table, record=True):
+        self.table = table
+        # Faux pour les annulations et rétablissements, déjà dans l'historique
+        self.record = record
+        self.ops = []
+        self.touched = False
+        df = table.dataframe
+        # Forme du DataFrame une fois les opérations en attente appliquées
+        self.rows = len(df) if df is not None else 0
+        self.columns = list(df.columns) if df is not None else []
 
-    def __init__(self, fig_dir=None):
+    @property
+    def data_start(self):
+        return self.table.header_row_idx
+
+    def delete_rows(self, rows):
+        self.touched = True
+        self.table.sheet_model.remove_rows(rows)
+        positions = sorted(set(row - self.data_start for row in rows
+                               if 0 <= row - self.data_start < self.rows))
+        if positions:
+            self.ops.append(('delete_rows', positions))
+            self.rows -= len(positions)
+
+    def insert_rows(self, row, count=1):
+        self.touched = True
+        model = self.table.sheet_model
+        model.insertRows(row, count)
+        # Copie style du dessus
+        if row > 0:
+            model.copy_row_styles(row - 1, row, row + count)
+        if self.table.dataframe is not None:
+            self.ops.append(('insert_rows', row - self.data_start, count))
+            self.rows += count
+
+    def delete_columns(self, columns):
+        self.touched = True
+        columns = sorted(set(columns))
+        names = [self.table.get_column_name(column) for column in columns]
+        self.table.sheet_model.remove_columns(columns)
+        names = [name for name in names if name in self.columns]
+        if names:
+            self.ops.append(('delete_columns', names))
+            self.columns = [name for name in self.columns if name not in names]
+
+    def insert_columns(self, column, count=1):
+        self.touched = True
+        self.table.sheet_model.insertColumns(column, count)
+        for k in range(count):
+            new_name = f"NouvCol{self.table.columnCount() - count + k + 1}"
+            if self.table.dataframe is not None:
+                position = max(0, min(column + k, len(self.columns)))
+                self.ops.append(('insert_column', position, new_name))
+                self.columns.insert(position, new_name)
+
+    def paste(self, row, column, texts):
+        """texts : lignes de textes (presse-papiers), à partir de la cellule (row, column)."""
+        if not texts:
+            return
+        table = self.table
+        model = table.sheet_model
+        start = self.data_start if table.dataframe is not None else model.rows
+        # Préambule et en-tête (hors DataFrame) : saisies ordinaires, cellule par cellule
+        above = texts[:max(0, start - row)]
+        for i, line in enumerate(above):
+            for j, text in enumerate(line[:max(0, model.cols - column)]):
+                table.item(row + i, column + j).setText(text)
+        texts = texts[len(above):]
+        if not texts:
+            return
+        df_row = row + len(above) - start
+        # Une plage qui dépasse la fin du tableau l'allonge
+        missing = df_row + len(texts) - self.rows
+        if missing > 0:
+            self.insert_rows(start + self.rows, missing)
+        self.touched = True
+        width = max(len(line) for line in texts)
+        model.drop_cells(start + df_row, start + df_row + len(texts), column, column + width)
+        self.ops.append(('set_block', df_row, column, texts))
+
+    def apply(self, op):
+        """Rejoue une opération de frameops telle quelle (annulation, rétablissement) : la vue suit."""
+        self.touched = True
+        model = self.table.sheet_model
+        start = self.data_start
+        kind = op[0]
+        if kind in ('insert_row', 'insert_rows'):
+            count = op[2] if kind == 'insert_rows' else 1
+            position = min(max(op[1], 0), self.rows)
+            model.insertRows(start + position, count)
+            if start + position > 0:
+                model.copy_row_styles(start + position - 1, start + position, start + position + count)
+            self.rows += count
+        elif kind == 'delete_rows':
+            positions = sorted(set(p for p in op[1] if 0 <= p < self.rows))
+            model.remove_rows([start + p for p in positions])
+            self.rows -= len(positions)
+        elif kind == 'restore_rows':
+            model.insert_rows_at([start + p for p in op[1]])
+            self.rows += len(op[1])
+        elif kind == 'insert_column':
+            position = min(max(op[1], 0), len(self.columns))
+            model.insertColumns(position, 1)
+            self.columns.insert(position, op[2])
+        elif kind == 'delete_columns':
+            model.remove_columns([j for j, name in enumerate(self.columns) if name in op[1]])
+            self.columns = [name for name in self.columns if name not in op[1]]
+        elif kind == 'restore_columns':
+            for position, name, _ in op[1]:
+                model.insertColumns(position, 1)
+                if start > 0:
+                    model.cells[(start - 1, position)] = str(name)
+                self.columns.insert(position, name)
+        elif kind in ('set', 'set_block', 'set_values'):
+            height = len(op[3]) if kind != 'set' else 1
+            width = max((len(line) for line in op[3]), default=0) if kind != 'set' else 1
+            model.drop_cells(start + op[1], start + op[1] + height, op[2], op[2] + width)
+        self.ops.append(op)
+
+    def commit(self):
+        if not self.touched:
+            return
+        table = self.table
+        previous = table.dataframe
+        ops = coalesce_ops(self.ops) if previous is not None else []
+        dtypes = list(previous.dtypes) if previous is not None else None
+        df = previous
+        backward = []
+        for op in ops:
+            if self.record:
+                backward.insert(0, inverse_op(df, op))
+            df = apply_op(df, op)
+        table.dataframe = df
+        table.sheet_model.refresh()
+        table.notify_structure_change(previous, ops)
+        if backward:
+            # Les lignes vides insérées ont pu changer le type des colonnes
+            backward.append(('dtypes', dtypes))
+            table.recoder.record(FrameCommand(ops, backward))
+
+
+class EnhancedTable(QTableView):
+    # (lignes lues, lignes annoncées par le fichier ou 0) pendant une lecture en flux
+    loading_progress = pyqtSignal(int, int)
+    loading_finished = pyqtSignal()
+    # (étapes ou lignes écrites, total) puis (chemin, message d'erreur vide si réussi)
+    saving_progress = pyqtSignal(int, int)
+    saving_finished = pyqtSignal(str, str)
+    # Cellule modifiée (SheetItem), comme QTableWidget.itemChanged
+    itemChanged = pyqtSignal(object)
+
+    def __init__(self, fig_dir=None, workbook_cache=None, excel_agent=None, sheet_name=None):
         super(EnhancedTable, self).__init__()
+        # Modèle adossé au DataFrame : seules les cellules visibles sont lues, aucun objet par cellule
+        self.sheet_model = SheetModel(self)
+        self.setModel(self.sheet_model)
+        self.horizontalHeader().setResizeContentsPrecision(RESIZE_SAMPLE_ROWS)
+        self.sheet_model.cell_about_to_change.connect(self.capture_snapshot)
+        self.sheet_model.cell_changed.connect(self.emit_item_changed)
+        self._dataframe = None
+        # Observateurs propres à chaque table : une feuille ne notifie pas celles des autres onglets
+        self.bus = ObserverBus(self)
         self.itemChanged.connect(self.handle_item_changed)
         self.setContextMenuPolicy(Qt.CustomContextMenu)
         self.customContextMenuRequested.connect(self.show_context_menu)
-        self.setSelectionMode(QTableWidget.MultiSelection)
+        self.setSelectionMode(QAbstractItemView.MultiSelection)
         self.selectionModel().selectionChanged.connect(self.selection_changed)
-        self.cellClicked.connect(self.cell_clicked)
+        self.clicked.connect(self.index_clicked)
         self.selected_indexes = set()
-        self.dataframe = None
+        self._edit = None
+        self.register_shortcut()
         self.loaded = False
         self.init_table()
         self.snapshot = TableSnapShot()
-        self.excel_agent = ExcelAgent()
+        # Les onglets d'un même classeur partagent son ExcelAgent
+        self.excel_agent = excel_agent if excel_agent is not None else ExcelAgent()
+        self.sheet_name = sheet_name
+        # Modifiée depuis son chargement : la feuille ne peut plus être relue depuis le fichier
+        self.dirty = False
         self.df_agent = DataFrameAgent()
         self.attach(self.excel_agent)
         self.attach(self.df_agent)
@@ -73,6 +285,41 @@ class EnhancedTable(QTableWidget):
         self._modification = None
         self.fig_dir = fig_dir
         self.header_row_idx = 1 # Par défaut
+        # Lecture en flux des gros fichiers : valeurs d'abord, styles (numéros) appliqués à l'affichage
+        self._stream = None
+        self._stream_ws = None
+        self._stream_total = 0
+        self._stream_values = []
+        self._stream_cells = []
+        # Fichiers plats : blocs lus pendant la lecture
+        self._flat_chunks = None
+        self._edit_triggers = self.editTriggers()
+        self._stream_timer = QTimer(self)
+        self._stream_timer.timeout.connect(self.read_stream_chunk)
+        self._saver = None
+        # Cache des classeurs analysés (WorkbookCache) : réouverture sans relire l'Excel
+        self.workbook_cache = workbook_cache
+        self._cache_key = None
+
+    @property
+    def dataframe(self):
+        return self._dataframe
+
+    @dataframe.setter
+    def dataframe(self, df):
+        self._dataframe = df
+        self.sheet_model.set_frame(df)
+
+    @property
+    def header_row_idx(self):
+        # Ligne d'en-tête (1-based) : les lignes du DataFrame commencent juste en dessous
+        return self.sheet_model.frame_row
+
+    @header_row_idx.setter
+    def header_row_idx(self, row):
+        if row != self.sheet_model.frame_row:
+            self.sheet_model.frame_row = row
+            self.sheet_model.refresh()
 
     @property
     def modification(self):
@@ -125,101 +372,85 @@ class EnhancedTable(QTableWidget):
             delete_column_action = QAction('Supprimer la colonne', self)
             delete_column_action.triggered.connect(self.remove_selected_columns)
             edit_menu.addAction(delete_column_action)
+
+            edit_menu.addSeparator()
+
+            paste_action = QAction('Coller', self)
+            paste_action.triggered.connect(self.paste_clipboard)
+            edit_menu.addAction(paste_action)
             main_menu.addMenu(edit_menu)
 
             main_menu.exec_(self.mapToGlobal(QPoint(pos.x() + 100, pos.y())))
 
+    @contextmanager
+    def edit(self, record=True):
+        """
+        Regroupe des éditions : with table.edit() as edit: edit.delete_rows(...); edit.paste(...).
+        Le DataFrame est mis à jour et les observateurs notifiés une seule fois, à la sortie du bloc.
+        """
+        if self._edit is not None:
+            # Bloc imbriqué : il rejoint la transaction en cours
+            yield self._edit
+            return
+        self._edit = TableEdit(self, record)
+        try:
+            yield self._edit
+        finally:
+            edit, self._edit = self._edit, None
+            edit.commit()
+
     @withoutconnect
     def insert_new_row(self):
+        if self.is_streaming():
+            return
         current_row = self.currentRow()
         if current_row < 0: current_row = self.rowCount()
-
-        # 1. UI
-        self.insertRow(current_row)
-        for j in range(self.columnCount()):
-            self.setItem(current_row, j, QTableWidgetItem(""))
-            # Copie style du dessus
-            if current_row > 0:
-                prev = self.item(current_row - 1, j)
-                if prev: self.item(current_row, j).setBackground(prev.background())
-
-        # 2. DataFrame
-        df_idx = current_row - self.header_row_idx
-        if self.dataframe is not None:
-            new_row = pd.Series([None] * len(self.dataframe.columns), index=self.dataframe.columns)
-            if df_idx <= 0:
-                self.dataframe = pd.concat([pd.DataFrame([new_row]), self.dataframe]).reset_index(drop=True)
-            elif df_idx >= len(self.dataframe):
-                self.dataframe.loc[len(self.dataframe)] = None
-            else:
-                self.dataframe = pd.concat([self.dataframe.iloc[:df_idx], pd.DataFrame([new_row]), self.dataframe.iloc[df_idx:]]).reset_index(drop=True)
-
-        # 3. Notify
-        self.notify_structure_change()
+        with self.edit() as edit:
+            edit.insert_rows(current_row)
 
     @withoutconnect
     def insert_new_column(self):
+        if self.is_streaming():
+            return
         current_col = self.currentColumn()
         if current_col < 0: current_col = self.columnCount()
+        with self.edit() as edit:
+            edit.insert_columns(current_col)
 
-        # 1. UI
-        self.insertColumn(current_col)
-        new_name = f"NouvCol{self.columnCount()}"
-
-        # 2. DataFrame
-        if self.dataframe is not None:
-            self.dataframe.insert(max(0, current_col), new_name, None)
-
-        # 3. Notify
-        self.notify_structure_change()
-
-    def notify_structure_change(self):
+    def notify_structure_change(self, previous=None, ops=None):
         self.modification = Modification(ModificationType.NEW_TABLE, [])
         self.modification.df = self.dataframe
+        # Description exacte de l'édition, pour les observateurs qui savent la rejouer
+        self.modification.previous = previous
+        self.modification.ops = ops
         self.notify()
-        self.save_checkpoint()
 
     @withoutconnect
     def remove_selected_rows(self):
-        rows = sorted(set(index.row() for index in self.selectedIndexes()), reverse=True)
+        rows = set(index.row() for index in self.selectedIndexes())
         if not rows or self.dataframe is None:
             return
-
-        for row in rows:
-            # 1. Mise à jour de l'UI
-            self.removeRow(row)
-
-            # 2. Mise à jour du DataFrame (en tenant compte de l'offset)
-            df_row = row - self.header_row_idx
-            if 0 <= df_row < len(self.dataframe):
-                self.dataframe = self.dataframe.drop(self.dataframe.index[df_row]).reset_index(drop=True)
-
-        # 3. Notification CRUCIAL : On informe l'agent Excel qu'il doit réécrire le tableau
-        self.modification = Modification(ModificationType.NEW_TABLE, [])
-        self.modification.df = self.dataframe
-        self.notify()
-        self.save_checkpoint()
+        # Toutes les lignes sélectionnées d'un coup : une seule suppression dans le DataFrame et la feuille
+        with self.edit() as edit:
+            edit.delete_rows(rows)
 
     @withoutconnect
     def remove_selected_columns(self):
-        cols = sorted(set(index.column() for index in self.selectedIndexes()), reverse=True)
+        cols = set(index.column() for index in self.selectedIndexes())
         if not cols or self.dataframe is None:
             return
+        with self.edit() as edit:
+            edit.delete_columns(cols)
 
-        for col in cols:
-            col_name = self.get_column_name(col)
-            # 1. Mise à jour de l'UI
-            self.removeColumn(col)
-
-            # 2. Mise à jour du DataFrame
-            if col_name in self.dataframe.columns:
-                self.dataframe = self.dataframe.drop(columns=[col_name])
-
-        # 3. Notification
-        self.modification = Modification(ModificationType.NEW_TABLE, [])
-        self.modification.df = self.dataframe
-        self.notify()
-        self.save_checkpoint()
+    def paste_clipboard(self):
+        text = QApplication.clipboard().text()
+        row, column = self.currentRow(), self.currentColumn()
+        if not text or row < 0 or column < 0 or self.is_streaming():
+            return
+        # Format des tableurs : lignes séparées par des retours, cellules par des tabulations
+        texts = [line.split('\t') for line in text.replace('\r\n', '\n').rstrip('\n').split('\n')]
+        with self.edit() as edit:
+            edit.paste(row, column, texts)
 
     def clear_selection(self):
         self.clearSelection()
@@ -232,13 +463,14 @@ class EnhancedTable(QTableWidget):
             selected_cells = set((index.row(), index.column()) for index in selected_indexes)
             self.selected_indexes = self.selected_indexes | selected_cells
 
-    def cell_clicked(self, row, column):
-        table_widget = self.sender()
+    def index_clicked(self, index):
+        self.cell_clicked(index.row(), index.column())
 
-        table_widget.clearSelection()
+    def cell_clicked(self, row, column):
+        self.clearSelection()
         self.selected_indexes = {(row, column)}
 
-        table_widget.setCurrentCell(row, column)
+        self.setCurrentCell(row, column)
 
     @withoutconnect
     def config_font_style(self):
@@ -247,13 +479,12 @@ class EnhancedTable(QTableWidget):
             item_infos = []
             for index in self.selected_indexes:
                 row, column = index
-                old_item_info = self.snapshot.get(index)
+                old_item_info = self.cell_snapshot(row, column)
                 item_infos.append(old_item_info)
                 item = self.item(row, column)
                 item.setFont(font)
-            self.modification = Modification(ModificationType.UPDATE_INPLACE, item_infos)
+            self.record_cells(item_infos)
             self.clearSelection()
-            self.save_checkpoint()
 
     @withoutconnect
     def config_font_color(self):
@@ -262,12 +493,11 @@ class EnhancedTable(QTableWidget):
             item_infos = []
             for index in self.selected_indexes:
                 row, column = index
-                old_item_info = self.snapshot.get(index)
+                old_item_info = self.cell_snapshot(row, column)
                 item_infos.append(old_item_info)
                 item = self.item(row, column)
                 item.setData(Qt.TextColorRole, color)
-            self.modification = Modification(ModificationType.UPDATE_INPLACE, item_infos)
-            self.save_checkpoint()
+            self.record_cells(item_infos)
             self.clearSelection()
 
     @withoutconnect
@@ -277,25 +507,99 @@ class EnhancedTable(QTableWidget):
             item_infos = []
             for index in self.selected_indexes:
                 row, column = index
-                old_item_info = self.snapshot.get(index)
+                old_item_info = self.cell_snapshot(row, column)
                 item_infos.append(old_item_info)
                 item = self.item(row, column)
                 item.setBackground(color)
-            self.modification = Modification(ModificationType.UPDATE_INPLACE, item_infos)
-            self.save_checkpoint()
+            self.record_cells(item_infos)
             self.clearSelection()
 
     @withoutconnect
     def init_table(self):
-        self.setRowCount(20)
-        self.setColumnCount(20)
-        for row in range(20):
-            for col in range(20):
-                self.setItem(row, col, QTableWidgetItem(''))
+        self.sheet_model.reset(20, 20)
+
+    # --- Interface de QTableWidget, servie par le modèle ---
+
+    def item(self, row, column):
+        if 0 <= row < self.sheet_model.rows and 0 <= column < self.sheet_model.cols:
+            return SheetItem(self.sheet_model, row, column)
+        return None
+
+    def itemAt(self, pos):
+        index = self.indexAt(pos)
+        return self.item(index.row(), index.column()) if index.isValid() else None
+
+    def rowCount(self):
+        return self.sheet_model.rows
+
+    def columnCount(self):
+        return self.sheet_model.cols
+
+    def setRowCount(self, rows):
+        self.sheet_model.set_shape(rows, self.sheet_model.cols)
+
+    def setColumnCount(self, columns):
+        self.sheet_model.set_shape(self.sheet_model.rows, columns)
+
+    def insertRow(self, row):
+        self.sheet_model.insertRows(row, 1)
+
+    def removeRow(self, row):
+        self.sheet_model.removeRows(row, 1)
+
+    def insertColumn(self, column):
+        self.sheet_model.insertColumns(column, 1)
+
+    def removeColumn(self, column):
+        self.sheet_model.removeColumns(column, 1)
+
+    def currentRow(self):
+        return self.currentIndex().row()
+
+    def currentColumn(self):
+        return self.currentIndex().column()
+
+    def setCurrentCell(self, row, column):
+        self.setCurrentIndex(self.sheet_model.index(row, column))
+
+    def scrollToItem(self, item):
+        if item is not None:
+            self.scrollTo(self.sheet_model.index(item.row(), item.column()))
+
+    def emit_item_changed(self, row, column):
+        self.itemChanged.emit(SheetItem(self.sheet_model, row, column))
+
+    def capture_snapshot(self, row, column):
+        # Seules les saisies suivies (itemChanged connecté) ont besoin de leur état d'avant
+        if not self.signalsBlocked() and self.receivers(self.itemChanged) > 0:
+            self.cell_snapshot(row, column)
+
+    def cell_snapshot(self, row, column):
+        """État d'une cellule avant sa première modification, relevé à la demande."""
+        index = (row, column)
+        info = self.snapshot.get(index)
+        if info is None and row >= self.header_row_idx - 1:
+            self.snapshot.set(self.item(row, column), index, self.get_column_name(column))
+            info = self.snapshot.get(index)
+        return info
+
+    def show_cells(self, rows, cols, **content):
+        # Nouveau contenu : rien n'est créé par cellule, le modèle lit le DataFrame à l'affichage
+        self.clearSpans()
+        self.snapshot = TableSnapShot()
+        self.recoder = TableMemo(self)
+        self.sheet_model.reset(rows, cols, **content)
+
+    def show_spans(self, ranges):
+        for merged_range in ranges:
+            min_col, min_row, max_col, max_row = merged_range.bounds
+            # setSpan(row, column, rowSpan, columnSpan)
+            self.setSpan(min_row - 1, min_col - 1, max_row - min_row + 1, max_col - min_col + 1)
 
     @withoutconnect
     def open_excel(self):
-        filename, filetype = QFileDialog.getOpenFileName(self, "Sélectionner un fichier Excel", "", "*.xlsx;;*.xls;;All Files(*)")
+        filename, filetype = QFileDialog.getOpenFileName(self, "Sélectionner un fichier Excel", "",
+                                                            "*.xlsx;;*.xls;;*.csv;;*.parquet;;All Files(*)")
         if not filename:
             return
         ok = self.load_excel(filename)
@@ -305,114 +609,307 @@ class EnhancedTable(QTableWidget):
         return ok
 
     def load_excel(self, excel_file):
-        ok = self.excel_agent.load(excel_file)
+        if is_flat_file(excel_file):
+            return self.load_flat_file(excel_file)
+        # Le classeur en cours d'enregistrement ne doit pas être remplacé sous le thread
+        self.flush()
+        self.wait_for_save()
+        self.reset_streaming()
+        self._cache_key = self.workbook_cache.key(excel_file) if self.workbook_cache is not None else None
+        cached = self.workbook_cache.load(self._cache_key) if self._cache_key else None
+        if cached is not None:
+            return self.load_excel_cached(excel_file, *cached)
+        if os.path.getsize(excel_file) >= LARGE_FILE_BYTES:
+            ok = self.excel_agent.load_streaming(excel_file)
+        else:
+            ok = self.excel_agent.load(excel_file)
         if not ok:
             return ok
+        self.sheet_name = self.excel_agent.sheet
+        return self.show_sheet()
+
+    def load_sheet(self):
+        """Onglet d'une autre feuille du classeur déjà ouvert : lu à sa première activation."""
+        self.flush()
+        self.reset_streaming()
+        filename = self.excel_agent.filename
+        self._cache_key = self.workbook_cache.key(filename, self.sheet_name) if self.workbook_cache is not None else None
+        cached = self.workbook_cache.load(self._cache_key) if self._cache_key else None
+        if cached is not None:
+            ok = self.load_excel_cached(filename, *cached, open_book=False)
+        else:
+            self.excel_agent.select(self.sheet_name)
+            ok = self.show_sheet()
+        if ok and not self.is_streaming():
+            self.loaded = True
+        return ok
 
-        # --- DÉTECTION INTELLIGENTE DE L'EN-TÊTE (pour calculs seulement) ---
-        ws = self.excel_agent.ws
-        header_row_idx = 1
-        max_non_empty = 0
-        for i in range(1, min(11, ws.max_row + 1)):
-            non_empty_count = sum(1 for cell in ws[i] if cell.value is not None)
-            if non_empty_count > max_non_empty:
-                max_non_empty = non_empty_count
-                header_row_idx = i
-
-        self.header_row_idx = header_row_idx
-
-        # ON AFFICHE TOUT (dès la ligne 1)
-        self.setRowCount(self.excel_agent.num_rows)
-        self.setColumnCount(self.excel_agent.num_cols)
-
-        # Les en-têtes de colonnes Qt seront simplement A, B, C...
-        # car les vrais en-têtes sont dans le tableau
-        self.setHorizontalHeaderLabels([self.excel_agent.index_to_excel_index(0, j).split('1')[0] for j in range(self.excel_agent.num_cols)])
+    def show_sheet(self):
+        self.dirty = False
+        if self.excel_agent.streaming:
+            return self.load_excel_streaming()
+        return self.load_worksheet()
+
+    def unload(self):
+        # Feuille sortie des feuilles résidentes : cellules et DataFrame libérés jusqu'à la prochaine activation
+        self.flush()
+        self.reset_streaming()
+        self.show_cells(0, 0)
+        self.dataframe = None
+        self.df_agent.df = None
+        self.recoder = TableMemo(self)
+        self.excel_agent.track(None, self.sheet_name)
+        self.loaded = False
 
+    def load_worksheet(self):
+        # --- DÉTECTION INTELLIGENTE DE L'EN-TÊTE (pour calculs seulement) ---
+        ok = True
+        # Le classeur est partagé avec le thread des observateurs (éditions des autres onglets) : lecture sous verrou
+        with self.excel_agent.lock:
+            ws = self.excel_agent.worksheet(self.sheet_name)
+            header_row_idx = detect_header_row([cell.value for cell in ws[i]]
+                                               for i in range(1, min(11, ws.max_row + 1)))
+
+            # Une seule lecture des cellules : valeurs du préambule et de l'en-tête, numéros de style de toutes.
+            # Les lignes de données sont affichées depuis le DataFrame.
+            caching = self._cache_key is not None
+            cells, styles, top = [], [], {}
+            for i, row in enumerate(ws.iter_rows(min_row=1)):
+                values = [cell.value for cell in row]
+                if caching:
+                    cells.append(values)
+                if i < header_row_idx:
+                    top.update(((i, j), value) for j, value in enumerate(values) if value is not None)
+                styles.append(array('I', (cell.style_id for cell in row)))
+
+            # Synchronisation de Pandas : le DataFrame est construit depuis la feuille déjà chargée,
+            # en sautant les lignes avant l'en-tête. L'IA et l'interpréteur voient le même DataFrame réparé.
+            frame = self.df_agent.set_frame(self.excel_agent.read_frame(header=header_row_idx - 1, ws=ws))
+            max_row, max_column = ws.max_row, ws.max_column
+            merged = list(ws.merged_cells.ranges)
+        style_table = self.excel_agent.style_table()
+        self.show_cells(max_row, max_column, frame=frame, frame_row=header_row_idx, cells=top,
+                        styles=styles, style_table=style_table, bold_row=header_row_idx - 1)
         # --- GESTION DES CELLULES FUSIONNÉES (UI) ---
-        for merged_range in ws.merged_cells.ranges:
-            min_col, min_row, max_col, max_row = merged_range.bounds
-            # setSpan(row, column, rowSpan, columnSpan)
-            self.setSpan(min_row - 1, min_col - 1, max_row - min_row + 1, max_col - min_col + 1)
-
-        # Chargement de TOUTES les lignes
-        header_names = []
-        for row in ws.iter_rows(min_row=1):
-            for cell in row:
-                cell_value = cell.value if cell.value is not None else ""
-                i = cell.row - 1
-                j = cell.column - 1
-                item = QTableWidgetItem(str(cell_value))
-                item.custom_dtype = type(cell.value) if cell.value is not None else str
-                item = self.format_with_cell(cell, item)
-
-                # Si c'est la ligne d'en-tête détectée, on la met visuellement en évidence
-                if cell.row == header_row_idx:
-                    font = item.font()
-                    font.setBold(True)
-                    item.setFont(font)
-                    header_names.append(str(cell_value) if cell_value != "" else f"Col{cell.column}")
-
-                self.setItem(i, j, item)
-                # On ne snapshot pour l'IA que ce qui est au niveau ou en dessous de l'en-tête
-                if cell.row >= header_row_idx:
-                    col_name = header_names[j] if j < len(header_names) else f"Col{j+1}"
-                    self.snapshot.set(item, (i, j), col_name)
-
-        # Synchronisation de Pandas : on lui dit de sauter les lignes avant l'en-tête
-        self.df_agent.load(excel_file, header=header_row_idx - 1)
-        self.dataframe = pd.read_excel(excel_file, header=header_row_idx - 1)
+        self.show_spans(merged)
+        self.dataframe = frame
+        self.excel_agent.track(self.dataframe, self.sheet_name)
+        if caching:
+            self.store_in_cache(cells, styles, style_table, [merged_range.coord for merged_range in merged])
 
         self.resizeColumnsToContents()
         return ok
 
-    def format_with_cell(self, cell, item):
-        cell_font = cell.font
-        font_name = cell_font.name
-        font_size = cell_font.size
-        item_font = QFont(font_name, int(font_size))
-        item.setFont(item_font)
-
-        font_color = cell_font.color.rgb if cell_font.color else None
-        if isinstance(font_color, str) and len(font_color) >= 6:
-            try:
-                # Gérer les formats ARGB (8 hex) ou RGB (6 hex)
-                hex_val = font_color[-6:]
-                color = QColor(*hex_to_rgb(hex_val))
-                item.setData(Qt.TextColorRole, color)
-            except Exception as e:
-                logger.debug(f"Erreur couleur texte: {e}")
+    def store_in_cache(self, cells, styles, style_table, merged):
+        # Valeurs brutes affichées et numéros de style, sans les cellules vides de fin de ligne
+        for values, row_styles in zip(cells, styles):
+            while values and values[-1] is None and not row_styles[len(values) - 1]:
+                values.pop()
+            del row_styles[len(values):]
+        used = set()
+        for row_styles in styles:
+            used.update(row_styles)
+        sidecar = {
+            'sheet': self.sheet_name,
+            'sheets': list(self.excel_agent.sheets),
+            'header_row_idx': self.header_row_idx,
+            'num_cols': self.columnCount(),
+            'merged': merged,
+            'cells': cells,
+            'styles': styles,
+            'cell_styles': {style_id: style_table.resolve(style_id) for style_id in used},
+        }
+        self.workbook_cache.store(self._cache_key, self.dataframe, sidecar)
+
+    def load_excel_cached(self, excel_file, frame, sidecar, open_book=True):
+        """
+        Fichier inchangé depuis la dernière ouverture : affichage et DataFrame viennent du cache.
+        Le classeur n'est chargé qu'à l'enregistrement, comme pour la lecture en flux.
+        """
+        cells = sidecar['cells']
+        if open_book:
+            self.excel_agent.load_deferred(excel_file, len(cells), sidecar['num_cols'], sidecar['sheet'], sidecar['sheets'])
+        self.sheet_name = sidecar['sheet']
+        self.dirty = False
+        header_row_idx = sidecar['header_row_idx']
+        top = {(i, j): value for i, values in enumerate(cells[:header_row_idx])
+               for j, value in enumerate(values) if value is not None}
+        frame = self.df_agent.set_frame(frame)
+        self.show_cells(len(cells), sidecar['num_cols'], frame=frame, frame_row=header_row_idx, cells=top,
+                        styles=sidecar['styles'], style_table=StyleTable(None, sidecar['cell_styles']),
+                        bold_row=header_row_idx - 1)
+        self.show_spans(CellRange(coord) for coord in sidecar['merged'])
+        self.dataframe = frame
+        self.excel_agent.track(self.dataframe, self.sheet_name)
+        self.resizeColumnsToContents()
+        return True
+
+    def load_excel_streaming(self):
+        """
+        Gros fichier : lecture seule en flux. Le premier écran est lu tout de suite, la suite par
+        tranches sur la boucle d'événements (loading_progress), puis le DataFrame est construit.
+        """
+        ok = True
+        ws = self.excel_agent.worksheet(self.sheet_name)
+        self.dataframe = None
+        self._stream_ws = ws
+        self._stream_total = ws.max_row or 0
+        self._stream = ws.iter_rows()
+        # Jusqu'au DataFrame, le modèle affiche les valeurs lues au fil de l'eau
+        self.show_cells(max(self._stream_total, FIRST_SCREEN_ROWS), ws.max_column or 0, frame_row=1,
+                        style_table=self.excel_agent.style_table(), raw_rows=self._stream_values)
+        # Pas de saisie tant que le DataFrame n'existe pas : elle ne pourrait pas y être reportée
+        self._edit_triggers = self.editTriggers()
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+
+        done = self._read_rows(limit=FIRST_SCREEN_ROWS)
+        self.header_row_idx = detect_header_row(self._stream_values[:10])
+        self.sheet_model.bold_row = self.header_row_idx - 1
+        self.resizeColumnsToContents()
+        if done:
+            self.finish_streaming()
+        else:
+            self._stream_timer.start(0)
+        return ok
 
-        # Réactivation et fiabilisation de la couleur de fond
-        if cell.fill and hasattr(cell.fill, 'fgColor') and cell.fill.fgColor:
-            bg_color = cell.fill.fgColor.rgb
-            if isinstance(bg_color, str) and len(bg_color) >= 6:
-                try:
-                    hex_val = bg_color[-6:]
-                    # Éviter le blanc pur ou les couleurs invalides par défaut d'Excel
-                    if hex_val.upper() != "000000" or bg_color.startswith("FF"):
-                         color = QColor(*hex_to_rgb(hex_val))
-                         item.setBackground(color)
-                except Exception as e:
-                    logger.debug(f"Erreur couleur fond: {e}")
-        return item
-
-    def save(self):
-        return self.modification
-
-    def _update_inplace(self, item_infos):
-        item_info = item_infos[0]
-        text = item_info.text()
-        index = item_info.index
-        font = item_info.font
-        font_color = item_info.font_color
-        bg_color = item_info.bg_color
-        row, column = index
-        item = self.item(row, column)
-        item.setText(text)
-        item.setFont(font)
-        item.setData(Qt.TextColorRole, font_color)
-        item.setBackground(bg_color)
+    def load_flat_file(self, filename):
+        """
+        CSV ou Parquet : lu par blocs par pandas/pyarrow, sans openpyxl ni styles.
+        Le premier bloc est affiché tout de suite, la suite arrive sur la boucle d'événements.
+        """
+        self.flush()
+        self.wait_for_save()
+        self.reset_streaming()
+        try:
+            chunks, total = read_flat_chunks(filename)
+            first = next(chunks, None)
+        except Exception as e:
+            logger.info(f"Lecture impossible de {filename} : {e}")
+            return False
+        first = pd.DataFrame() if first is None else first
+        # Pas de classeur derrière la table : l'enregistrement exporte le DataFrame
+        self.excel_agent.close()
+        self._cache_key = None
+        self.sheet_name = os.path.splitext(os.path.basename(filename))[0]
+        self.dirty = False
+        self.dataframe = None
+        self._flat_chunks = [first]
+        self._stream = chunks
+        self._stream_total = total
+        header = {(0, j): name for j, name in enumerate(repair_merged_headers(first.columns))}
+        # Le premier bloc est affiché ; self.dataframe reste vide jusqu'à la fin de la lecture
+        self.show_cells(1 + max(total, len(first)), first.shape[1], frame=first, frame_row=1,
+                        cells=header, bold_row=0)
+        self._edit_triggers = self.editTriggers()
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.resizeColumnsToContents()
+        self._stream_timer.start(0)
+        return True
+
+    def read_flat_chunk(self):
+        deadline = time.perf_counter() + STREAM_SLICE_SECONDS
+        try:
+            while True:
+                chunk = next(self._stream, None)
+                if chunk is None:
+                    break
+                self._flat_chunks.append(chunk)
+                if time.perf_counter() >= deadline:
+                    self.loading_progress.emit(sum(len(c) for c in self._flat_chunks), self._stream_total)
+                    return
+        except Exception as e:
+            # Fichier mal formé en cours de route : mieux vaut ne rien charger qu'un extrait tronqué
+            logger.info(f"Lecture interrompue : {e}")
+            self.reset_streaming()
+            self.show_cells(0, 0)
+            self.loading_finished.emit()
+            return
+        self.finish_flat()
+
+    def finish_flat(self):
+        self._stream_timer.stop()
+        self._stream = None
+        chunks, self._flat_chunks = self._flat_chunks, None
+        self.dataframe = self.df_agent.set_frame(concat_chunks(chunks))
+        self.setRowCount(len(self.dataframe) + 1)
+        self.setEditTriggers(self._edit_triggers)
+        self.loaded = True
+        self.loading_finished.emit()
+
+    def is_streaming(self):
+        return self._stream is not None
+
+    def reset_streaming(self):
+        self._stream_timer.stop()
+        if self._stream is not None:
+            self.setEditTriggers(self._edit_triggers)
+        self._stream = None
+        self._stream_ws = None
+        self._flat_chunks = None
+        self._stream_values = []
+        self._stream_cells = []
+
+    def _read_rows(self, limit=None, deadline=None):
+        # Renvoie True quand toute la feuille a été lue
+        read = 0
+        model = self.sheet_model
+        for row in self._stream:
+            i = len(self._stream_values)
+            if i >= model.rows:
+                self.setRowCount(i + FIRST_SCREEN_ROWS)
+            if len(row) > model.cols:
+                self.setColumnCount(len(row))
+            if self._cache_key is not None:
+                self._stream_cells.append([cell.value for cell in row])
+            self._stream_values.append(row_values(row))
+            model.append_styles(getattr(cell, '_style_id', 0) for cell in row)
+            read += 1
+            if limit is not None and read >= limit:
+                return False
+            if deadline is not None and read % 64 == 0 and time.perf_counter() >= deadline:
+                return False
+        return True
+
+    def read_stream_chunk(self):
+        if self._stream is None:
+            self._stream_timer.stop()
+            return
+        if self._flat_chunks is not None:
+            return self.read_flat_chunk()
+        first_row = len(self._stream_values)
+        done = self._read_rows(deadline=time.perf_counter() + STREAM_SLICE_SECONDS)
+        if len(self._stream_values) > first_row:
+            model = self.sheet_model
+            model.dataChanged.emit(model.index(first_row, 0),
+                                   model.index(len(self._stream_values) - 1, max(model.cols - 1, 0)))
+        self.loading_progress.emit(len(self._stream_values), self._stream_total)
+        if done:
+            self.finish_streaming()
+
+    def finish_streaming(self):
+        self._stream_timer.stop()
+        self._stream = None
+        self.setRowCount(len(self._stream_values))
+        merged = self.excel_agent.merged_ranges(self._stream_ws)
+        self.show_spans(merged)
+
+        data, self._stream_values = pad_values(self._stream_values), []
+        header = self.header_row_idx
+        self.sheet_model.cells.update(((i, j), value) for i, values in enumerate(data[:header])
+                                      for j, value in enumerate(values) if value != "")
+        self.dataframe = self.df_agent.set_frame(frame_from_values(data, header=header - 1))
+        self.excel_agent.track(self.dataframe, self.sheet_name)
+        if self._cache_key is not None:
+            cells, self._stream_cells = self._stream_cells, []
+            self.store_in_cache(cells, [array('I', styles) for styles in self.sheet_model.styles],
+                                self.sheet_model.style_table, [merged_range.coord for merged_range in merged])
+        self._stream_ws = None
+        # Les styles sont déjà en mémoire : l'archive peut être fermée, sauf si d'autres feuilles restent à lire
+        if len(self.excel_agent.sheets) == 1:
+            self.excel_agent.close_archive()
+        self.setEditTriggers(self._edit_triggers)
+        self.loaded = True
+        self.loading_finished.emit()
 
     def _insert_scalar(self, item_infos):
         item_info = item_infos[0]
@@ -426,18 +923,65 @@ class EnhancedTable(QTableWidget):
         row, col = item_info.index
         self.item(row, col).setText('')
 
-    def restore(self, modifications):
-        if modifications is None:
-            return
-        if len(modifications.item_infos) == 0:
-            return
-        mtype = modifications.mtype
-        if mtype != ModificationType.UPDATE_INPLACE:
-            return
-        self._update_inplace(modifications.item_infos)
-        self.modification = modifications
+    def record_cells(self, before):
+        # Mise en forme de cellules : état d'avant (relevé) et d'après, pour annuler et rétablir
+        after = [build_item_info(self.item(*info.index), info.index, info.column_name)
+                 for info in before if info is not None]
+        before = [info for info in before if info is not None]
+        if before:
+            self.recoder.record(CellCommand(before, after))
+
+    def restore_cells(self, item_infos):
+        """Remet des cellules dans l'état relevé (texte, type, police, couleurs) et le répercute."""
+        item_infos = [info for info in item_infos if info is not None]
+        model = self.sheet_model
+        df = self.dataframe
+        for info in item_infos:
+            row, column = info.index
+            if not (0 <= row < model.rows and 0 <= column < model.cols):
+                continue
+            model.set_text(row, column, info.text)
+            model.dtypes[info.index] = info.dtype
+            # Couleur invalide : pas de couleur propre, celle du style du classeur s'applique
+            model.set_format(row, column,
+                             font=QFont(info.font) if info.font is not None else None,
+                             foreground=info.font_color if info.font_color is not None and info.font_color.isValid() else None,
+                             background=info.bg_color if info.bg_color is not None and info.bg_color.isValid() else None)
+            df_row = row - self.header_row_idx
+            if df is not None and 0 <= df_row < len(df) and column < len(df.columns):
+                set_cell(df, df_row, column, coerce_value(info.text, info.dtype))
+            self.snapshot.set(self.item(row, column), info.index, info.column_name)
+        self.modification = Modification(ModificationType.UPDATE_INPLACE, item_infos)
+        self.notify()
+
+    def replay_ops(self, ops):
+        with self.edit(record=False) as edit:
+            for op in ops:
+                edit.apply(op)
+
+    def view_state(self):
+        # Ce que insert_result change dans la vue : taille et textes de la ligne d'en-tête
+        header_row = self.header_row_idx - 1
+        header = {key: text for key, text in self.sheet_model.cells.items() if key[0] == header_row}
+        return self.sheet_model.rows, self.sheet_model.cols, header
+
+    def replace_frame(self, chunks, view):
+        """Remet un tableau complet gardé par l'historique (résultat de l'IA ou tableau d'avant)."""
+        rows, cols, header = view
+        model = self.sheet_model
+        header_row = self.header_row_idx - 1
+        old_rows = model.rows
+        model.set_shape(rows, cols)
+        if rows > old_rows:
+            model.copy_row_styles(header_row, old_rows, rows)
+        for key in [key for key in model.cells if key[0] == header_row]:
+            del model.cells[key]
+        model.cells.update(header)
+        self.dataframe = chunks.frame() if chunks is not None else None
+        model.refresh()
+        self.modification = Modification(ModificationType.NEW_TABLE, [])
+        self.modification.df = self.dataframe
         self.notify()
-        self.modification = None
 
     @withoutconnect
     def insert_result(self, res):
@@ -448,60 +992,47 @@ class EnhancedTable(QTableWidget):
             # L'offset de l'en-tête (1-based Excel -> 0-based index)
             header_row_idx = self.header_row_idx - 1
             data_start_row = self.header_row_idx
-
-            # 1. Mise à jour des noms de colonnes (UNIQUEMENT si l'IA a donné des noms explicites et non génériques)
-            for j in range(min(stdout.shape[1], self.columnCount())):
-                new_col_name = str(stdout.columns[j])
-                # On ne touche pas à l'en-tête si c'est un nom générique Pandas ou si la cellule est fusionnée (item est None)
-                if "Unnamed" not in new_col_name and not self.isColumnHidden(j):
-                    item = self.item(header_row_idx, j)
-                    if item:
-                        item.setText(new_col_name)
-
-            # 2. Préparation de la taille (on ne réduit jamais la taille existante)
-            new_data_rows = stdout.shape[0]
-            total_required_rows = data_start_row + new_data_rows
-            if total_required_rows > self.rowCount():
-                self.setRowCount(total_required_rows)
-
-            # 3. Insertion chirurgicale des données (préserve styles et fusions)
-            new_item_infos = []
-            for i in range(stdout.shape[0]):
-                for j in range(stdout.shape[1]):
-                    value = stdout.iloc[i, j]
-                    display_value = "" if pd.isna(value) else str(value)
-                    target_row = i + data_start_row
-
-                    item = self.item(target_row, j)
-                    if not item:
-                        item = QTableWidgetItem(display_value)
-                        # Copie du style de la ligne d'en-tête pour les nouvelles cellules
-                        sample = self.item(header_row_idx, j)
-                        if sample:
-                            item.setFont(sample.font())
-                            item.setBackground(sample.background())
-                        self.setItem(target_row, j, item)
-                    else:
-                        item.setText(display_value)
-
-                    index = (target_row, j)
-                    column_header_item = self.item(header_row_idx, j)
-                    current_col_name = column_header_item.text() if column_header_item else f"Col{j+1}"
-
-                    item.custom_dtype = type(value)
-                    new_item_infos.append(build_item_info(item, index, current_col_name))
-
-            # On ne fait plus de self.setRowCount(total_rows) pour ne pas supprimer la suite du fichier
-            self.dataframe = stdout
-            self.modification = Modification(ModificationType.NEW_TABLE, new_item_infos)
-            self.modification.df = stdout
-
-            self.resizeColumnsToContents()
-
-            # Défilement automatique vers la zone mise à jour
-            self.scrollToItem(self.item(data_start_row, 0))
-
-            self.notify()
+            with profiler.span('render_table', parent='insert_result'):
+                model = self.sheet_model
+                # Le tableau d'avant est remplacé, pas modifié : compressé sans copie (sauf s'il est rendu tel quel)
+                before = (FrameChunks(self.dataframe, copy=self.dataframe is stdout)
+                          if self.dataframe is not None else None,
+                          self.view_state())
+                # Mise à jour en bloc : ni objet ni signal par cellule, un seul rafraîchissement à la fin
+                self.setUpdatesEnabled(False)
+                try:
+                    # 1. Taille (on ne réduit jamais la taille existante, pour ne pas supprimer la suite du fichier)
+                    total_required_rows = data_start_row + stdout.shape[0]
+                    old_rows = model.rows
+                    model.set_shape(max(old_rows, total_required_rows), max(model.cols, stdout.shape[1]))
+                    if total_required_rows > old_rows:
+                        # Nouvelles lignes : style de la ligne d'en-tête, partagé plutôt que copié par cellule
+                        model.copy_row_styles(header_row_idx, old_rows, total_required_rows)
+
+                    # 2. Mise à jour des noms de colonnes (UNIQUEMENT si l'IA a donné des noms explicites et non génériques)
+                    for j, name in enumerate(stdout.columns):
+                        new_col_name = str(name)
+                        if "Unnamed" not in new_col_name and not self.isColumnHidden(j):
+                            model.cells[(header_row_idx, j)] = new_col_name
+
+                    # 3. Données : le modèle lit le DataFrame à l'affichage (préserve styles et fusions)
+                    self.dataframe = stdout
+                    model.refresh()
+                    self.resizeColumnsToContents()
+                finally:
+                    self.setUpdatesEnabled(True)
+
+                # Les observateurs relisent modification.df : aucun TableItemInfo par cellule
+                self.modification = Modification(ModificationType.NEW_TABLE, [])
+                self.modification.df = stdout
+
+                # Défilement automatique vers la zone mise à jour
+                self.scrollToItem(self.item(data_start_row, 0))
+
+            with profiler.span('notify', parent='insert_result'):
+                self.notify()
+            # Les deux versions du tableau sont gardées compressées pour annuler et rétablir
+            self.recoder.record(ResultCommand(before, (FrameChunks(stdout), self.view_state())))
             return True
         else:
             # Pour les résultats simples (chiffres, textes), on laisse l'onglet IA ou le chat l'afficher
@@ -511,8 +1042,9 @@ class EnhancedTable(QTableWidget):
     def undo_modification(self):
         self.recoder.undo()
 
-    def save_checkpoint(self):
-        self.recoder.backup()
+    @withoutconnect
+    def redo_modification(self):
+        self.recoder.redo()
 
     def get_column_name(self, column):
         # On va chercher le nom dans la ligne d'en-tête détectée (header_row_idx est 1-based)
@@ -524,39 +1056,105 @@ class EnhancedTable(QTableWidget):
     def handle_item_changed(self, item):
         if self.dataframe is None:
             return
-        item_info = self.snapshot.get(item)
         row = item.row()
         column = item.column()
         index = (row, column)
         column_name = self.get_column_name(column)
-        if item_info is None:
-            mtype = ModificationType.INSERT_SCALAR
-            item_info = build_item_info(item, index, column_name)
-        else:
-            mtype = ModificationType.UPDATE_INPLACE
-        modification = Modification(mtype, item_info)
-        self.modification = modification
-        self.save_checkpoint()
+        if not hasattr(item, 'custom_dtype'):
+            item.custom_dtype = str
+        old_item_info = self.snapshot.get(index)
+
+        # La saisie est répercutée dans le DataFrame (les lignes du préambule n'y figurent pas)
+        df_row = row - self.header_row_idx
+        if 0 <= df_row < len(self.dataframe) and column < len(self.dataframe.columns):
+            set_cell(self.dataframe, df_row, column, coerce_value(item.text(), item.custom_dtype))
+
+        new_item_info = build_item_info(item, index, column_name)
+        self.modification = Modification(ModificationType.UPDATE_INPLACE, [new_item_info])
+        self.notify()
+        if old_item_info is not None:
+            self.recoder.record(CellCommand([old_item_info], [new_item_info]))
         self.snapshot.set(item, index, column_name)
 
     def register_shortcut(self):
-        self.shortcut = QShortcut(QKeySequence(Qt.CTRL + Qt.Key_Z), self)
-        self.shortcut.activated.connect(self.undo_modification)
+        # Raccourcis propres à la table : actifs seulement quand elle a le focus
+        for sequence, slot in ((QKeySequence.Undo, self.undo_modification),
+                               (QKeySequence.Redo, self.redo_modification),
+                               (QKeySequence.Paste, self.paste_clipboard)):
+            shortcut = QShortcut(QKeySequence(sequence), self)
+            shortcut.setContext(Qt.WidgetShortcut)
+            shortcut.activated.connect(slot)
 
     def file_save(self):
-        file_filter = "*.xlsx;;*.xls;;All Files(*)"
+        file_filter = "*.xlsx;;*.xls;;*.csv;;*.parquet;;All Files(*)"
         path, _ = QFileDialog.getSaveFileName(self, "Enregistrer le fichier Excel", "", file_filter)
 
         if not path:
             return
-        self.excel_agent.save(path, self.fig_dir)
+        self.save_to(path)
+
+    def save_to(self, path):
+        """
+        Enregistre dans un thread : la fenêtre reste utilisable et le fichier reflète l'état
+        au moment de la demande (les éditions suivantes sont appliquées une fois l'écriture finie).
+        """
+        if self.is_streaming() or self.is_saving():
+            return None
+        # Le fichier enregistré contient toutes les éditions faites avant la demande
+        self.flush()
+        if is_flat_file(path):
+            # CSV ou Parquet : seules les valeurs comptent, le classeur n'est pas relu
+            if self.dataframe is None:
+                return None
+            frame = self.dataframe.copy()
+            save = lambda progress: export_flat(frame, path, progress)
+        elif self.excel_agent.is_opened():
+            self.excel_agent.begin_save()
+            agent, fig_dir = self.excel_agent, self.fig_dir
+            save = lambda progress: agent.save(path, fig_dir, progress)
+        elif self.dataframe is not None:
+            # Résultat IA ou nouvelle feuille : pas de modèle à préserver, export write_only
+            frame, fig_dir = self.dataframe.copy(), self.fig_dir
+            save = lambda progress: export_frame(frame, path, fig_dir, progress)
+        else:
+            return None
+        saver = QSaver(path, save)
+        saver.progress.connect(self.saving_progress)
+        saver.res_signal.connect(lambda error: self.finish_save(saver))
+        self._saver = saver
+        saver.start()
+        return saver
+
+    def finish_save(self, saver):
+        # Appelé une seule fois par enregistrement (signal du thread ou wait_for_save)
+        if saver is not self._saver:
+            return
+        self._saver = None
+        if self.excel_agent.saving:
+            # Les éditions mises de côté sont rejouées ici : le thread des observateurs doit être au repos
+            self.flush()
+            self.excel_agent.end_save()
+        self.saving_finished.emit(saver.path, saver.error)
+
+    def is_saving(self):
+        return self._saver is not None
+
+    def wait_for_save(self):
+        saver = self._saver
+        if saver is not None:
+            saver.wait()
+            self.finish_save(saver)
 
     def attach(self, observer):
-        self._observers.append(observer)
+        self.bus.attach(observer)
 
     def detach(self, observer):
-        self._observers.remove(observer)
+        self.bus.detach(observer)
 
     def notify(self):
-        for observer in self._observers:
-            observer._update(self)
+        self.dirty = True
+        self.bus.publish(self)
+
+    def flush(self):
+        # Barrière : les agents ont reçu toutes les modifications faites jusqu'ici
+        self.bus.flush()
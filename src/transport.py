@@ -0,0 +1,169 @@
+import atexit
+import pickle
+import re
+import secrets
+import struct
+import sys
+import threading
+from multiprocessing import shared_memory
+
+# Disposition d'un segment :
+# [nb buffers, taille de l'en-tête pickle][taille de chaque buffer][en-tête pickle][buffers alignés]
+LAYOUT = struct.Struct('!QQ')
+LENGTH = struct.Struct('!Q')
+ALIGNMENT = 64
+FRAME_PATTERN = re.compile(r"load_frame\('(xc_[0-9a-f]+)'\)")
+SESSION_PREFIX = 'xs_'
+
+_published = {}
+_lock = threading.Lock()
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _keep_in_band(buffer):
+    # Seuls les buffers contigus peuvent être copiés tels quels dans le segment
+    try:
+        buffer.raw()
+    except BufferError:
+        return True
+    return False
+
+
+def dumps(obj):
+    """Sérialise obj en protocole 5 : renvoie l'en-tête pickle et la liste des buffers hors bande."""
+    buffers = []
+    header = pickle.dumps(obj, protocol=5, buffer_callback=lambda b: _keep_in_band(b) or buffers.append(b))
+    return header, [b.raw() for b in buffers]
+
+
+def layout_size(header, raws):
+    offset = LAYOUT.size + LENGTH.size * len(raws) + len(header)
+    for raw in raws:
+        offset = _align(offset) + raw.nbytes
+    return max(offset, 1)
+
+
+def write_layout(buf, header, raws):
+    LAYOUT.pack_into(buf, 0, len(raws), len(header))
+    offset = LAYOUT.size
+    for raw in raws:
+        LENGTH.pack_into(buf, offset, raw.nbytes)
+        offset += LENGTH.size
+    buf[offset:offset + len(header)] = header
+    offset += len(header)
+    for raw in raws:
+        offset = _align(offset)
+        buf[offset:offset + raw.nbytes] = raw.cast('B')
+        offset += raw.nbytes
+
+
+def read_layout(buf):
+    count, header_size = LAYOUT.unpack_from(buf, 0)
+    offset = LAYOUT.size
+    sizes = []
+    for _ in range(count):
+        sizes.append(LENGTH.unpack_from(buf, offset)[0])
+        offset += LENGTH.size
+    header = bytes(buf[offset:offset + header_size])
+    offset += header_size
+    buffers = []
+    for size in sizes:
+        offset = _align(offset)
+        buffers.append(buf[offset:offset + size])
+        offset += size
+    # Les buffers pointent directement dans le segment : aucune copie à la désérialisation
+    return pickle.loads(header, buffers=buffers)
+
+
+def publish_frame(df):
+    """Copie df dans un segment de mémoire partagée et renvoie le handle à passer au worker."""
+    header, raws = dumps(df)
+    name = 'xc_' + secrets.token_hex(6)
+    shm = shared_memory.SharedMemory(name=name, create=True, size=layout_size(header, raws))
+    try:
+        write_layout(shm.buf, header, raws)
+    except Exception:
+        shm.close()
+        shm.unlink()
+        raise
+    with _lock:
+        _published[name] = shm
+    return name
+
+
+def release_frame(handle):
+    with _lock:
+        shm = _published.pop(handle, None)
+    if shm is None:
+        return
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def frame_handles(code):
+    return FRAME_PATTERN.findall(code)
+
+
+def release_frames(code):
+    for handle in frame_handles(code):
+        release_frame(handle)
+
+
+@atexit.register
+def _release_all():
+    for handle in list(_published):
+        release_frame(handle)
+
+
+def attach(handle):
+    # Côté worker : le segment appartient au processus principal, c'est lui qui le supprime
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=handle, track=False)
+    shm = shared_memory.SharedMemory(name=handle)
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
+    return shm
+
+
+def private_copy(frame):
+    if frame is None:
+        return None
+    import pandas as pd
+    # Avec le copy-on-write (pandas >= 3), une copie superficielle protège déjà la version résidente
+    deep = int(pd.__version__.split('.')[0]) < 3
+    return frame.copy(deep=deep)
+
+
+class FrameLoader(object):
+    """Fournit load_frame au code généré et garde les segments ouverts le temps de la tâche."""
+
+    def __init__(self, sessions=None):
+        self.segments = []
+        self.sessions = sessions if sessions is not None else {}
+
+    def __call__(self, handle):
+        if handle.startswith(SESSION_PREFIX):
+            # Feuille résidente : chaque tâche travaille sur sa propre copie
+            return private_copy(self.sessions[handle[len(SESSION_PREFIX):]]['frame'])
+        shm = attach(handle)
+        self.segments.append(shm)
+        return read_layout(shm.buf)
+
+    def close(self):
+        lingering = []
+        for shm in self.segments:
+            try:
+                shm.close()
+            except BufferError:
+                # Un objet vit encore sur le segment : on réessaiera à la prochaine tâche
+                lingering.append(shm)
+        self.segments = lingering
@@ -4,6 +4,7 @@ import ast
 import re
 import sys
 import os
+from src.transport import publish_frame
 
 
 def withoutconnect(func):
@@ -30,6 +31,36 @@ def withoutconnect(func):
     return wrapper
 
 
+# Début de la partie technique d'une réponse de l'IA, dans l'ordre où translate_to_conversational les cherche
+CODE_MARKERS = ("[CODE]", "def process_data")
+CODE_END = "[/CODE]"
+
+
+def is_code_answer(s):
+    # Détection plus stricte : contient [CODE] ou des mots clés Python typiques du projet
+    return "[CODE]" in s or ("def process_data" in s) or ("df[" in s and "=" in s)
+
+
+def conversation_end(text, final=False):
+    """
+    Longueur du début de la réponse qui peut déjà être affiché pendant sa réception :
+    la conversation s'arrête au premier marqueur de code. Tant que la réponse n'est pas
+    complète, une fin qui pourrait être le début d'un marqueur coupé entre deux morceaux attend.
+    """
+    positions = [text.find(marker) for marker in CODE_MARKERS if marker in text]
+    if positions:
+        return min(positions)
+    if final:
+        return len(text)
+    held = 0
+    for marker in CODE_MARKERS:
+        for k in range(len(marker) - 1, held, -1):
+            if text.endswith(marker[:k]):
+                held = k
+                break
+    return len(text) - held
+
+
 def translate_to_conversational(full_response):
     """Extrait l'explication conversationnelle de la réponse de l'IA."""
     try:
@@ -62,7 +93,8 @@ def translate_to_conversational(full_response):
     except:
         return "Analyse en cours...", ""
 
-def wrap_code(full_response, df):
+def extract_code(full_response):
+    """Renvoie (code de la fonction, nom de la fonction) extraits de la réponse de l'IA."""
     # On extrait uniquement la partie technique entre [CODE] et [/CODE]
     if "[CODE]" in full_response:
         code = full_response.split("[CODE]")[1]
@@ -96,7 +128,7 @@ def wrap_code(full_response, df):
             clean_lines.append(line)
 
     code = "\n".join(clean_lines).strip()
-    if not code: return ""
+    if not code: return "", None
 
     # S'assurer que la fonction est bien définie
     if re.match(r"^[a-zA-Z_]\w*\(df\):", code):
@@ -111,10 +143,41 @@ def wrap_code(full_response, df):
         code = f"def {function_name}(df):\n{indented_code}"
     else:
         function_name = match.group(1)
+    return code, function_name
+
 
-    import_line = 'import pandas as pd\nimport numpy as np\nimport pickle\nimport matplotlib.pyplot as plt\n\n'
-    data_pickle = pickle.dumps(df)
-    code_to_run = f"{import_line}\n{code}\n\ndf = pickle.loads({data_pickle!r})\nresult = {function_name}(df)\nprint(pickle.dumps(result))"
+def wrap_code(full_response, df, sheets=None):
+    code, function_name = extract_code(full_response)
+    if not code: return ""
+    return build_script(code, function_name, df, sheets)
+
+
+def sheet_helper(sheets):
+    """
+    Fonction sheet(nom) donnant accès aux autres feuilles du classeur. Chaque source est soit
+    un handle (feuille modifiée, publiée en mémoire partagée), soit (fichier, ligne d'en-tête) :
+    la feuille n'est alors lue dans le fichier que si le code la demande.
+    """
+    entries = []
+    for name, source in sheets.items():
+        if isinstance(source, str):
+            expr = f"load_frame({source!r})"
+        else:
+            path, header = source
+            expr = f"pd.read_excel({path!r}, sheet_name={name!r}, header={header!r})"
+        entries.append(f"    {name!r}: lambda: {expr},\n")
+    return "_sheets = {\n" + "".join(entries) + "}\n\ndef sheet(name):\n    return _sheets[name]()\n"
+
+
+def build_script(code, function_name, df, sheets=None):
+    import_line = 'import pandas as pd\nimport numpy as np\nimport matplotlib.pyplot as plt\n\n'
+    # Le DataFrame passe par la mémoire partagée : le code ne transporte qu'un handle.
+    # Le résultat revient par le canal binaire du worker (send_result), stdout reste aux print de l'utilisateur.
+    # Un handle déjà fourni (session résidente) est utilisé tel quel.
+    handle = df if isinstance(df, str) else publish_frame(df)
+    if sheets:
+        import_line += sheet_helper(sheets) + '\n'
+    code_to_run = f"{import_line}\n{code}\n\ndf = load_frame({handle!r})\nresult = {function_name}(df)\nsend_result(result)"
 
     return code_to_run
 
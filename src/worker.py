@@ -0,0 +1,256 @@
+import builtins
+import io
+import os
+import pickle
+import struct
+import sys
+import time
+import traceback
+from contextlib import redirect_stdout, redirect_stderr
+from src.transport import FrameLoader, dumps, private_copy
+from src.frameops import apply_op
+
+# Chaque message est précédé de sa longueur (8 octets, big-endian)
+HEADER = struct.Struct('!Q')
+
+
+def read_exact(stream, size):
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def write_message(stream, message):
+    payload = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    stream.write(HEADER.pack(len(payload)))
+    stream.write(payload)
+    stream.flush()
+
+
+def read_message(stream):
+    header = read_exact(stream, HEADER.size)
+    if header is None:
+        return None
+    size, = HEADER.unpack(header)
+    payload = read_exact(stream, size)
+    if payload is None:
+        return None
+    return pickle.loads(payload)
+
+
+def write_buffers(stream, buffers):
+    for buffer in buffers:
+        stream.write(buffer)
+    stream.flush()
+
+
+def read_buffers(stream, sizes):
+    # Chaque buffer est lu directement dans sa destination finale
+    buffers = []
+    for size in sizes:
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            n = stream.readinto(view[received:])
+            if not n:
+                return None
+            received += n
+        buffers.append(buffer)
+    return buffers
+
+
+def preload():
+    # Les imports lourds sont faits une seule fois, au démarrage du worker
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot
+    import numpy
+    import pandas
+
+
+def cleanup():
+    plt = sys.modules.get('matplotlib.pyplot')
+    if plt is not None:
+        plt.close('all')
+
+
+def current_memory():
+    # Mémoire virtuelle du worker ; seul Linux l'expose simplement
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def limit_memory(budget):
+    """Plafonne la mémoire de la tâche (RLIMIT_AS) ; renvoie la limite précédente à restaurer."""
+    if not budget:
+        return None
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = current_memory()
+    if usage is None:
+        return None
+    previous = resource.getrlimit(resource.RLIMIT_AS)
+    limit = usage + budget
+    if previous[1] != resource.RLIM_INFINITY:
+        limit = min(limit, previous[1])
+    resource.setrlimit(resource.RLIMIT_AS, (limit, previous[1]))
+    return previous
+
+
+def restore_memory(previous):
+    if previous is not None:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, previous)
+
+
+class ResultSlot(object):
+    """send_result : le résultat quitte le worker par le canal binaire, jamais par stdout."""
+
+    def __init__(self):
+        self.value = None
+        self.filled = False
+
+    def __call__(self, value):
+        self.value = value
+        self.filled = True
+
+
+def sync_session(sessions, loader, request):
+    """Amène la feuille résidente à la version demandée ; False si le worker n'a pas la bonne base."""
+    session_id = request['id']
+    state = sessions.pop(session_id, None)
+    try:
+        if 'frame' in request:
+            # Copie hors du segment partagé : la version résidente survit à la tâche
+            frame = private_copy(loader(request['frame']))
+        else:
+            if state is None or state['version'] != request['base']:
+                return False
+            frame = state['frame']
+            for op in request['ops']:
+                if op[0] == 'adopt':
+                    if state['last_result'] is None:
+                        return False
+                    frame = state['last_result']
+                else:
+                    frame = apply_op(frame, op)
+    except Exception:
+        return False
+    if frame is not None and (frame.shape != tuple(request['shape'])
+                              or list(frame.columns) != list(request['columns'])):
+        return False
+    sessions[session_id] = {'version': request['version'], 'frame': frame, 'last_result': None}
+    return True
+
+
+def timed(function, timings, name):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+    return wrapper
+
+
+def run_job(code, loader, state=None, memory_limit=None, timings=None):
+    # Un espace de noms neuf par tâche : rien ne fuit d'une question à l'autre
+    timings = {} if timings is None else timings
+    slot = ResultSlot()
+    namespace = {'__name__': '__main__', '__builtins__': builtins,
+                 'load_frame': timed(loader, timings, 'load_frame'), 'send_result': slot}
+    stdout, stderr = io.StringIO(), io.StringIO()
+    header, raws = None, []
+    status = 'ok'
+    with redirect_stdout(stdout), redirect_stderr(stderr):
+        previous_limit = limit_memory(memory_limit)
+        start = time.perf_counter()
+        try:
+            exec(compile(code, '<stdin>', 'exec'), namespace)
+        except SystemExit:
+            pass
+        except MemoryError:
+            # Budget mémoire dépassé : le résultat partiel est abandonné
+            status = 'memory'
+            slot.value, slot.filled = None, False
+        except BaseException:
+            etype, value, tb = sys.exc_info()
+            # On retire la frame du worker pour garder la même trace qu'un `python -` classique
+            traceback.print_exception(etype, value, tb.tb_next)
+        finally:
+            restore_memory(previous_limit)
+            # Le chargement du DataFrame se fait pendant exec : on ne garde que le code lui-même
+            timings['user_code'] = time.perf_counter() - start - timings.get('load_frame', 0.0)
+        if slot.filled:
+            start = time.perf_counter()
+            try:
+                header, raws = dumps(slot.value)
+            except Exception:
+                traceback.print_exc()
+            timings['encode_result'] = time.perf_counter() - start
+        if state is not None:
+            # Gardé pour que la table puisse l'adopter sans le renvoyer
+            import pandas as pd
+            state['last_result'] = slot.value if isinstance(slot.value, pd.DataFrame) else None
+        namespace.clear()
+        slot.value = None
+        cleanup()
+    response = {'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(), 'status': status,
+                'result': header, 'buffers': [raw.nbytes for raw in raws], 'timings': timings}
+    return response, raws
+
+
+def main():
+    # Canal privé : le code utilisateur ne peut ni lire nos requêtes ni corrompre nos réponses
+    channel_in = os.fdopen(os.dup(0), 'rb')
+    channel_out = os.fdopen(os.dup(1), 'wb')
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    os.dup2(2, 1)
+    sys.stdin = io.StringIO()
+
+    preload()
+    ready = time.time()
+    sessions = {}
+    loader = FrameLoader(sessions)
+    while True:
+        message = read_message(channel_in)
+        if message is None or message.get('op') == 'exit':
+            break
+        if message.get('op') == 'exec':
+            timings = {}
+            if ready is not None:
+                # Temps pendant lequel la requête a attendu la fin des imports (0 si le worker était prêt)
+                timings['imports'] = max(0.0, ready - message.get('sent', ready))
+                ready = None
+            state = None
+            if message.get('session') is not None:
+                start = time.perf_counter()
+                if not sync_session(sessions, loader, message['session']):
+                    loader.close()
+                    write_message(channel_out, {'stale': True})
+                    continue
+                state = sessions[message['session']['id']]
+                timings['apply_edits'] = time.perf_counter() - start
+            response, raws = run_job(message['code'], loader, state, message.get('memory_limit'), timings)
+            write_message(channel_out, response)
+            write_buffers(channel_out, raws)
+            del raws
+            loader.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+from openpyxl import load_workbook
+from bench.run import run, compare, STAGES
+from bench.workbooks import workbook_for, COLUMNS
+
+
+def test_synthetic_workbook(tmp_path):
+    path = workbook_for(1000, str(tmp_path))
+    ws = load_workbook(path).active
+    assert len(ws.merged_cells.ranges) == 5
+    assert [cell.value for cell in ws[4]] == COLUMNS
+    assert ws.max_row == 4 + 100
+
+
+def test_bench_pipeline(tmp_path):
+    report = run([1000], workbook_dir=str(tmp_path))
+    stages = report['results']['1000']
+    assert sorted(stages) == sorted(STAGES)
+    assert all(values['seconds'] >= 0 for values in stages.values())
+
+    slower = {'results': {'1000': {stage: {'seconds': values['seconds'] * 2 + 1, 'peak_bytes': values['peak_bytes']}
+                                   for stage, values in stages.items()}}}
+    assert compare(report, report, 0.25) == []
+    assert len(compare(slower, report, 0.25)) == len(STAGES)
@@ -0,0 +1,54 @@
+from src.cache import DiskCache, ResultCache, frame_fingerprint
+from src.session import FrameSession
+from src.memo import Modification, ModificationType, TableItemInfo
+from src.frameops import set_cell
+import pandas as pd
+import os
+import time
+
+
+def test_disk_cache_lru(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=250)
+    for key in ['a', 'b', 'c']:
+        cache.put(key, b'x' * 100)
+        time.sleep(0.01)
+    # 'a' était la plus ancienne : elle a été évincée pour respecter la taille maximale
+    assert cache.get('a') is None
+    assert cache.get('b') is not None and cache.get('c') is not None
+    assert sum(os.path.getsize(p) for p in tmp_path.iterdir()) <= 250
+
+
+def test_result_cache_key(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    df = pd.DataFrame({'A': [1, 2, 3]})
+    fingerprint = frame_fingerprint(df)
+    key = cache.key("def process_data(df):\n    return df.sum()", fingerprint)
+    # Les commentaires et la mise en forme ne changent pas la clé
+    assert key == cache.key("def process_data(df):  # somme\n\n    return df.sum( )", fingerprint)
+    assert key != cache.key("def process_data(df):\n    return df.sum()", frame_fingerprint(df * 2))
+    assert cache.key("def process_data(df):\n    return np.random.rand()", fingerprint) is None
+    # Écritures de fichiers et figures : le code doit être exécuté à chaque fois
+    for call in ("df.to_excel('sortie.xlsx')", "df.to_csv('sortie.csv')", "df.to_parquet('sortie.parquet')",
+                 "plt.plot(df['A'])", "plt.savefig('figure.png')"):
+        assert cache.key(f"def process_data(df):\n    {call}\n    return df", fingerprint) is None
+
+    cache.store(key, {'total': 6})
+    assert cache.load(key) == {'total': 6}
+
+
+def test_session_fingerprint_incremental():
+    class Table(object):
+        header_row_idx = 1
+        modification = None
+
+    table = Table()
+    table.dataframe = pd.DataFrame({'A': [1, 2, 3], 'B': ['x', 'y', 'z']})
+    session = FrameSession()
+    before = session.fingerprint(table.dataframe)
+    set_cell(table.dataframe, 1, 1, 'w')
+    table.modification = Modification(ModificationType.UPDATE_INPLACE,
+                                      [TableItemInfo((2, 1), str, 'w', 'B', None, 0, None, None)])
+    session._update(table)
+    after = session.fingerprint(table.dataframe)
+    assert before != after
+    assert after == frame_fingerprint(table.dataframe)
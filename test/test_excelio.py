@@ -0,0 +1,99 @@
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Font
+from src.excelio import ExcelAgent
+from src.dfagent import repair_merged_headers
+from src.memo import Modification, ModificationType
+from src.frameops import insert_empty_row
+
+
+def test_read_frame_matches_read_excel(tmp_path):
+    path = str(tmp_path / 'classeur.xlsx')
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['Rapport'])
+    ws.append(['nom', 'ventes', None, 'date'])
+    ws.merge_cells('B2:C2')
+    ws.append(['a', 1, 2.5, pd.Timestamp('2024-01-02').to_pydatetime()])
+    ws.append([])
+    ws.append(['b', '=B3*2', 4.0, None])
+    ws.append(['c', 3, 'NA', None])
+    wb.save(path)
+
+    agent = ExcelAgent()
+    assert agent.load(path)
+    frame = agent.read_frame(header=1)
+    pd.testing.assert_frame_equal(frame, pd.read_excel(path, header=1))
+    # La ligne vide reste dans le DataFrame : les lignes suivent celles de la feuille
+    assert frame['nom'].isna().tolist() == [False, True, False, False]
+
+
+def test_repair_merged_headers():
+    assert repair_merged_headers(['Unnamed: 0', 'ventes', 'Unnamed: 2', 'Unnamed: 3', 'date']) == \
+        ['Unnamed: 0', 'ventes', 'ventes.1', 'ventes.2', 'date']
+
+
+def test_new_table_writes_only_the_difference(tmp_path):
+    path = str(tmp_path / 'diff.xlsx')
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['nom', 'ventes'])
+    for i in range(5):
+        ws.append(['n{}'.format(i), i])
+    ws.append([])
+    ws.append(['Total', '=SUM(B2:B6)'])
+    wb.save(path)
+
+    agent = ExcelAgent()
+    assert agent.load(path)
+    frame = agent.read_frame(header=0).iloc[:5].reset_index(drop=True)
+    agent.track(frame)
+    writes = []
+    write_cell = agent.write_cell
+    agent.write_cell = lambda row, column, value: writes.append((row, column)) or write_cell(row, column, value)
+
+    def notify(df, previous=None, ops=None):
+        modification = Modification(ModificationType.NEW_TABLE, [])
+        modification.df, modification.previous, modification.ops = df, previous, ops
+        agent.apply_modification(modification, 1)
+
+    edited = frame.copy()
+    edited.iat[2, 1] = 42
+    notify(edited)
+    assert writes == [(4, 2)] and agent.ws['B4'].value == 42
+
+    # Ligne supprimée sans description : le décalage est détecté, le pied de tableau remonte
+    del writes[:]
+    notify(edited.drop(1).reset_index(drop=True))
+    assert writes == [] and agent.ws['A3'].value == 'n2' and agent.ws['A7'].value == 'Total'
+
+    # Ligne insérée décrite par la table : rejouée avec insert_rows
+    previous = agent.frame
+    inserted = insert_empty_row(previous, 1)
+    notify(inserted, previous, [('insert_row', 1)])
+    assert writes == [] and agent.ws['A3'].value is None and agent.ws['A4'].value == 'n2'
+    assert agent.ws['A8'].value == 'Total'
+
+
+def test_styles_are_interned(tmp_path):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['nom', 'ventes'])
+    ws.append(['a', 1])
+    ws['A2'].font = Font(bold=True)
+    agent = ExcelAgent()
+    agent.wb, agent.ws = wb, ws
+    style = ('Arial', 12, 'FFFF0000', 'FFFFFF00')
+    agent.apply_style(ws, 'B1', style)
+    fonts = len(wb._fonts)
+    for index in ('B2', 'C2', 'C1'):
+        agent.apply_style(ws, index, style)
+    assert len(wb._fonts) == fonts
+    assert ws['B2']._style.fontId == ws['B1']._style.fontId and ws['B2'].font.color.rgb == 'FFFF0000'
+
+    # Lignes ajoutées : style de la dernière ligne existante
+    agent.track(pd.DataFrame({'nom': ['a'], 'ventes': [1]}))
+    modification = Modification(ModificationType.NEW_TABLE, [])
+    modification.df = pd.DataFrame({'nom': ['a', 'b', 'c'], 'ventes': [1, 2, 3]})
+    agent.apply_modification(modification, 1)
+    assert ws['A4'].value == 'c' and ws['A4'].font.b and ws['A4']._style is not ws['A3']._style
@@ -1,4 +1,4 @@
-from src.interpreter import PythonInterpreter, wrap_in_try_except
+from src.interpreter import PythonInterpreter, InterpreterPool, wrap_in_try_except
 from src.utis import decodestdoutput
 import pandas as pd
 
@@ -15,3 +15,148 @@ def test_interpreter():
         data = decodestdoutput(stdout)
         assert isinstance(data, pd.DataFrame)
         assert data.shape == (2, 2)
+
+
+def test_interpreter_pool_isolation_and_recycle():
+    pool = InterpreterPool(size=1, max_jobs=2)
+    try:
+        stdout, stderr = pool.execute("a = 1\nimport os\nprint(os.getpid())")
+        first_pid = int(stdout)
+        stdout, stderr = pool.execute("print(a)")
+        assert 'NameError' in stderr
+        # max_jobs atteint : le worker suivant est un nouveau processus
+        stdout, stderr = pool.execute("import os\nprint(os.getpid())")
+        assert int(stdout) != first_pid
+    finally:
+        pool.shutdown()
+
+
+def test_interpreter_pool_crash():
+    pool = InterpreterPool(size=1)
+    try:
+        stdout, stderr = pool.execute("import os\nos._exit(3)")
+        assert stdout == ''
+        assert '3' in stderr
+        stdout, stderr = pool.execute("print(1 + 1)")
+        assert stdout.strip() == '2'
+    finally:
+        pool.shutdown()
+
+
+def test_shared_memory_frame():
+    from src.utis import wrap_code
+    from src.transport import frame_handles, _published
+    df = pd.DataFrame({'A': range(1000), 'B': ['x'] * 1000, 'C': [0.5] * 1000})
+    code = wrap_code("[CODE]\ndef process_data(df):\n    return df[df['A'] > 10]\n[/CODE]", df)
+    handles = frame_handles(code)
+    # Le code ne contient plus le DataFrame sérialisé, seulement son handle
+    assert len(handles) == 1 and len(code) < 500
+    data = PythonInterpreter().run(code).result
+    assert data.shape == (989, 3)
+    assert handles[0] not in _published
+
+
+def test_binary_result_channel():
+    from src.utis import wrap_code
+    df = pd.DataFrame({'A': range(100000)})
+    code = wrap_code("[CODE]\ndef process_data(df):\n    print('calcul en cours')\n    return df * 2\n[/CODE]", df)
+    result = PythonInterpreter().run(code)
+    assert result.has_result
+    assert result.stdout.strip() == 'calcul en cours'
+    assert (result.result['A'] == df['A'] * 2).all()
+
+
+def test_resident_session(monkeypatch):
+    import src.session
+    from src.session import FrameSession
+    from src.memo import Modification, ModificationType, TableItemInfo
+    from src.frameops import set_cell, delete_rows
+    from src.utis import wrap_code
+
+    published = []
+    publish = src.session.publish_frame
+    monkeypatch.setattr(src.session, 'publish_frame', lambda df: published.append(1) or publish(df))
+
+    class Table(object):
+        header_row_idx = 1
+        modification = None
+        dataframe = None
+
+    table = Table()
+    table.dataframe = pd.DataFrame({'A': [1, 2, 3], 'B': [4.0, 5.0, 6.0]})
+    session = FrameSession()
+    pool = InterpreterPool(size=1)
+    code = wrap_code("[CODE]\ndef process_data(df):\n    return df.sum()\n[/CODE]", session.handle)
+    try:
+        result = pool.run(code, session.prepare(table.dataframe))
+        assert result.result['A'] == 6 and len(published) == 1
+
+        # Édition d'une cellule puis suppression d'une ligne : seules les éditions sont envoyées
+        set_cell(table.dataframe, 0, 0, 10)
+        info = TableItemInfo((1, 0), int, '10', 'A', None, 0, None, None)
+        table.modification = Modification(ModificationType.UPDATE_INPLACE, [info])
+        session._update(table)
+        previous = table.dataframe
+        table.dataframe = delete_rows(table.dataframe, [2])
+        table.modification = Modification(ModificationType.NEW_TABLE, [])
+        table.modification.df, table.modification.previous = table.dataframe, previous
+        table.modification.ops = [('delete_rows', [2])]
+        session._update(table)
+
+        result = pool.run(code, session.prepare(table.dataframe))
+        assert result.result['A'] == 12 and result.result['B'] == 9.0
+        assert len(published) == 1
+    finally:
+        pool.shutdown()
+
+
+def test_execution_budgets():
+    import sys
+    import threading
+    from src.interpreter import ExecutionStatus
+    interpreter = PythonInterpreter(timeout=1, memory_limit=256 * 1024 ** 2)
+    try:
+        result = interpreter.run("while True:\n    pass")
+        assert result.status == ExecutionStatus.TIMEOUT and result.budget_exceeded
+        assert 'Budget' in result.stderr
+
+        if sys.platform.startswith('linux'):
+            result = interpreter.run("data = bytearray(2 * 1024 ** 3)")
+            assert result.status == ExecutionStatus.MEMORY
+
+        interpreter.timeout = None
+        threading.Timer(0.5, interpreter.cancel).start()
+        result = interpreter.run("import time\ntime.sleep(30)")
+        assert result.status == ExecutionStatus.CANCELLED and not result.budget_exceeded
+
+        stdout, stderr = interpreter.execute("print('ok')")
+        assert stdout.strip() == 'ok'
+    finally:
+        interpreter.stop()
+
+
+def test_partitioned_execution():
+    from src.partition import is_partition_safe
+    rowwise = "def process_data(df):\n" \
+              "    df['C'] = df['A'] * 2 + df['B']\n" \
+              "    return df[df['C'] % 3 != 0]"
+    aggregate = "def process_data(df):\n" \
+                "    return df['A'] - df['A'].mean()"
+    assert is_partition_safe(rowwise, 'process_data')
+    assert not is_partition_safe(aggregate, 'process_data')
+
+    pool = InterpreterPool(size=1, max_size=3)
+    try:
+        df = pd.DataFrame({'A': list(range(1000)), 'B': list(range(1000, 0, -1))})
+        response = pool.run_partitioned(rowwise, 'process_data', df, parts=3)
+        expected = df.copy()
+        expected['C'] = expected['A'] * 2 + expected['B']
+        expected = expected[expected['C'] % 3 != 0]
+        assert response is not None and not response.in_worker
+        assert response.result.equals(expected)
+        # Fonction non découpable : l'appelant doit repasser en exécution normale
+        assert pool.run_partitioned(aggregate, 'process_data', df, parts=3) is None
+        # Les workers ajoutés pour la répartition ne sont pas gardés
+        assert len(pool._idle) + len(pool._busy) <= pool.size
+    finally:
+        pool.shutdown()
@@ -0,0 +1,43 @@
+import json
+from src.interpreter import PythonInterpreter
+from src.profiler import TurnTrace, TraceLog
+from src import profiler
+
+
+def test_turn_trace(tmp_path):
+    trace = TurnTrace('question')
+    profiler.activate(trace)
+    try:
+        with profiler.span('receive_output'):
+            profiler.begin('insert_result', parent='receive_output')
+            profiler.end('insert_result')
+        trace.add_sequence(trace.origin - 1.0, [('load_frame', 0.001), ('user_code', 0.002)], parent='execution')
+    finally:
+        profiler.activate(None)
+    # Sans tour actif, les mesures sont ignorées
+    with profiler.span('ignored'):
+        pass
+
+    stages = trace.to_dict()['stages']
+    assert [stage['name'] for stage in stages] == ['load_frame', 'user_code', 'receive_output', 'insert_result']
+    assert stages[1]['start_ms'] == -999.0 and stages[3]['parent'] == 'receive_output'
+    assert 'Code généré' in trace.summary_html(expanded=True)
+
+    log = TraceLog()
+    log.record(trace)
+    path = tmp_path / 'trace.json'
+    log.export_chrome(str(path))
+    events = json.loads(path.read_text(encoding='utf-8'))['traceEvents']
+    assert len(events) == 5 and all(event['ph'] == 'X' for event in events)
+
+
+def test_worker_timings():
+    python_interp = PythonInterpreter()
+    try:
+        result = python_interp.run("import pandas as pd\nsend_result(pd.DataFrame({'A': [1, 2]}))")
+        names = [name for name, _ in result.timings]
+        assert names[0] == 'spawn'
+        assert 'user_code' in names and 'encode_result' in names and 'decode_result' in names
+        assert all(seconds >= 0 for _, seconds in result.timings)
+    finally:
+        python_interp.stop()
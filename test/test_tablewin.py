@@ -0,0 +1,366 @@
+import os
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import threading
+import pandas as pd
+import pytest
+from PyQt5.QtWidgets import QApplication
+from src import tablewin, flatfile, profiler
+from src.profiler import TurnTrace
+from src.tablewin import EnhancedTable
+from src.cache import WorkbookCache
+from src.dfagent import DataFrameAgent
+from bench.workbooks import workbook_for
+
+app = QApplication.instance() or QApplication([])
+
+
+def test_streaming_load(tmp_path, monkeypatch):
+    path = workbook_for(3000, str(tmp_path))
+    table = EnhancedTable(str(tmp_path))
+    assert table.load_excel(path)
+    expected = table.dataframe.copy()
+    header_row_idx = table.header_row_idx
+
+    monkeypatch.setattr(tablewin, 'LARGE_FILE_BYTES', 0)
+    monkeypatch.setattr(tablewin, 'FIRST_SCREEN_ROWS', 50)
+    progress = []
+    table.loading_progress.connect(lambda rows, total: progress.append(rows))
+    table.load_excel(path)
+    # Le premier écran est affiché avant la fin de la lecture
+    assert table.is_streaming() and table.dataframe is None
+    assert table.item(3, 0).text() == 'id'
+    while table.is_streaming():
+        table.read_stream_chunk()
+
+    assert progress and progress[-1] == 304
+    assert table.header_row_idx == header_row_idx
+    pd.testing.assert_frame_equal(table.dataframe, expected)
+    assert table.columnSpan(0, 0) == 10 and table.columnSpan(2, 0) == 3
+    # Styles gardés en numéros par ligne, résolus à l'affichage ; les lignes identiques partagent leur tuple
+    assert table.item(3, 0).font().bold()
+    assert table.sheet_model.styles[250] is table.sheet_model.styles[251]
+    # Objets Qt construits une fois par numéro de style
+    shared = table.sheet_model.style_format(250, 6)
+    assert shared is not None and shared is table.sheet_model.style_format(251, 6)
+    assert table.snapshot.get((250, 0)) is None
+    assert table.cell_snapshot(250, 0) is not None
+
+    # Les éditions sont rejouées sur le classeur complet à l'enregistrement
+    table.item(10, 1).setText('Client modifié')
+    target = str(tmp_path / 'sortie.xlsx')
+    table.flush()
+    table.excel_agent.save(target)
+    saved = pd.read_excel(target, header=header_row_idx - 1)
+    assert saved.loc[10 - header_row_idx, 'nom'] == 'Client modifié'
+
+
+def test_snapshot_is_recorded_on_edit(tmp_path):
+    path = workbook_for(3000, str(tmp_path))
+    table = EnhancedTable(str(tmp_path))
+    assert table.load_excel(path)
+    # Rien n'est relevé au chargement
+    assert len(table.snapshot) == 0
+    before = table.item(10, 1).text()
+    table.item(10, 1).setText('Client modifié')
+    table.item(11, 1).setText('Autre client')
+    info = table.snapshot.get((10, 1))
+    assert info.text == 'Client modifié' and info.column_name == 'nom'
+    # Cellules de même style : un seul jeu de police et couleurs dans le relevé
+    assert len(table.snapshot) == 2 and len(table.snapshot._styles) == 1
+    assert table.recoder._undo[-2].before[0].text == before
+
+
+def test_insert_large_result(tmp_path):
+    path = workbook_for(3000, str(tmp_path))
+    table = EnhancedTable(str(tmp_path))
+    assert table.load_excel(path)
+    header_row_idx = table.header_row_idx
+    result = table.dataframe.head(0).reindex(range(20000))
+    result['id'] = range(20000)
+    result['remise'] = 0.5
+    assert table.insert_result(res=(result, ''))
+    assert table.rowCount() == header_row_idx + 20000 and table.columnCount() == 11
+    assert table.item(header_row_idx - 1, 10).text() == 'remise'
+    assert table.item(header_row_idx + 19999, 0).text() == '19999'
+    assert table.modification.df is result and table.modification.item_infos == []
+    # Préambule et fusions conservés
+    assert table.item(0, 0).text() == 'Rapport de ventes synthétique' and table.columnSpan(0, 0) == 10
+
+
+class Recorder(object):
+    def __init__(self):
+        self.modifications = []
+
+    def _update(self, subject):
+        self.modifications.append(subject.modification)
+
+
+def test_batch_edits(tmp_path):
+    path = workbook_for(3000, str(tmp_path))
+    table = EnhancedTable(str(tmp_path))
+    assert table.load_excel(path)
+    recorder = Recorder()
+    table.attach(recorder)
+    start = table.header_row_idx
+    frame = table.dataframe
+    expected = frame.drop(index=range(0, len(frame), 2)).reset_index(drop=True)
+
+    with table.edit() as edit:
+        edit.delete_rows([start + i for i in range(0, 100, 2)])
+        # Positions relevées après la première suppression : ramenées à celles d'avant
+        edit.delete_rows([start + i for i in range(50, len(frame) - 50, 2)])
+    assert len(recorder.modifications) == 1
+    assert recorder.modifications[0].ops == [('delete_rows', list(range(0, len(frame), 2)))]
+    pd.testing.assert_frame_equal(table.dataframe, expected)
+    assert table.rowCount() == start + len(expected)
+    assert table.item(start + 1, 1).text() == expected.loc[1, 'nom']
+
+    with table.edit() as edit:
+        edit.insert_rows(start)
+        edit.insert_rows(start + 1)
+        edit.paste(start, 1, [['Nouveau', 'Bureau', '7'], ['Autre', 'Textile', 'x']])
+        edit.delete_columns([9])
+    ops = recorder.modifications[-1].ops
+    assert len(recorder.modifications) == 2 and ops[0] == ('insert_rows', 0, 2)
+    assert list(table.dataframe.loc[0, ['nom', 'catégorie', 'quantité']]) == ['Nouveau', 'Bureau', 7]
+    assert table.dataframe.loc[1, 'quantité'] == 'x' and 'commentaire' not in table.dataframe
+    assert table.item(start, 3).text() == '7'
+
+    target = str(tmp_path / 'lot.xlsx')
+    table.flush()
+    table.excel_agent.save(target)
+    saved = pd.read_excel(target, header=start - 1)
+    assert len(saved) == len(table.dataframe) and list(saved.columns) == list(table.dataframe.columns)
+    assert saved.loc[0, 'nom'] == 'Nouveau' and saved.loc[2, 'id'] == table.dataframe.loc[2, 'id']
+
+
+def test_undo_redo(tmp_path):
+    path = workbook_for(3000, str(tmp_path))
+    table = EnhancedTable(str(tmp_path))
+    assert table.load_excel(path)
+    start = table.header_row_idx
+    original = table.dataframe.copy()
+    name = table.item(start + 2, 1).text()
+
+    table.item(start + 2, 1).setText('Client modifié')
+    with table.edit() as edit:
+        edit.delete_rows([start + i for i in range(0, 200, 3)])
+        edit.insert_rows(start + 5, 2)
+        edit.paste(start, 3, [['1', '2'], ['3', '4']])
+        edit.delete_columns([8])
+    result = table.dataframe.head(40).copy()
+    result['remise'] = 0.1
+    table.insert_result(res=(result, ''))
+    assert table.dataframe is result and table.columnCount() == 10
+
+    table.undo_modification()
+    assert 'remise' not in table.dataframe and len(table.dataframe) == len(original) - 67 + 2
+    table.undo_modification()
+    assert table.item(start + 2, 1).text() == 'Client modifié'
+    table.undo_modification()
+    pd.testing.assert_frame_equal(table.dataframe, original)
+    assert table.item(start + 2, 1).text() == name and table.item(start + 5, 8).text() != ''
+    # Le classeur suit : il retrouve son contenu d'origine
+    target = str(tmp_path / 'annule.xlsx')
+    table.flush()
+    table.excel_agent.save(target)
+    saved = pd.read_excel(target, header=start - 1)
+    assert len(saved) == len(original) and saved.loc[2, 'nom'] == name
+    assert list(saved['id']) == list(original['id'])
+
+    table.redo_modification()
+    table.redo_modification()
+    assert len(table.dataframe) == len(original) - 67 + 2 and 'note' not in table.dataframe
+    table.redo_modification()
+    pd.testing.assert_frame_equal(table.dataframe, result)
+    assert not table.recoder.can_redo()
+
+    # Historique borné : les entrées les plus anciennes sont oubliées
+    table.recoder.max_bytes = table.recoder._undo[-1].size
+    table.item(start, 1).setText('Dernière saisie')
+    assert len(table.recoder._undo) == 1 and table.recoder.size <= table.recoder.max_bytes
+
+
+def test_background_save(tmp_path):
+    path = workbook_for(3000, str(tmp_path))
+    fig_dir = tmp_path / 'figures'
+    fig_dir.mkdir()
+    table = EnhancedTable(str(fig_dir))
+    assert table.load_excel(path)
+    header_row_idx = table.header_row_idx
+    before = table.item(10, 1).text()
+    finished = []
+    table.saving_finished.connect(lambda target, error: finished.append((target, error)))
+
+    target = str(tmp_path / 'arriere_plan.xlsx')
+    assert table.save_to(target) is not None and table.is_saving()
+    # Édition pendant l'écriture : absente du fichier, appliquée au classeur ensuite
+    table.item(10, 1).setText('Client modifié')
+    table.wait_for_save()
+    assert finished == [(target, '')]
+    saved = pd.read_excel(target, header=header_row_idx - 1)
+    assert saved.loc[10 - header_row_idx, 'nom'] == before
+    assert table.excel_agent.ws.cell(row=11, column=2).value == 'Client modifié'
+
+    # Sans classeur d'origine (nouvelle feuille) : export write_only du DataFrame
+    table = EnhancedTable(str(fig_dir))
+    frame = pd.DataFrame({'a': [1, 2, None], 'b': ['x', None, 'z']})
+    table.insert_result(res=(frame, ''))
+    target = str(tmp_path / 'nouvelle.xlsx')
+    table.save_to(target)
+    table.wait_for_save()
+    pd.testing.assert_frame_equal(pd.read_excel(target), frame)
+
+
+class BackgroundRecorder(Recorder):
+    background = True
+
+    def _update(self, subject):
+        Recorder._update(self, subject)
+        self.thread = threading.get_ident()
+
+
+def test_observer_bus(tmp_path):
+    path = workbook_for(3000, str(tmp_path))
+    table = EnhancedTable(str(tmp_path))
+    assert table.load_excel(path)
+    start = table.header_row_idx
+    recorder = BackgroundRecorder()
+    table.attach(recorder)
+
+    # Saisies et éditions de structure en file : le classeur n'est pas touché pendant la frappe
+    table.item(start, 1).setText('Premier essai')
+    table.item(start + 1, 1).setText('Autre client')
+    table.item(start, 1).setText('Client modifié')
+    with table.edit() as edit:
+        edit.delete_rows([start + 4])
+    with table.edit() as edit:
+        edit.insert_rows(start + 2, 2)
+    assert not recorder.modifications and table.bus.pending == 2
+    assert table.excel_agent.ws.cell(row=start + 1, column=2).value != 'Client modifié'
+
+    # Fusionnées : une écriture par cellule, puis les opérations des deux éditions enchaînées
+    table.flush()
+    assert recorder.thread != threading.get_ident() and table.bus.pending == 0
+    cells, structure = recorder.modifications
+    assert [(info.index, info.text) for info in cells.item_infos] == \
+        [((start + 1, 1), 'Autre client'), ((start, 1), 'Client modifié')]
+    assert structure.ops == [('delete_rows', [4]), ('insert_rows', 2, 2)]
+    # L'agent relit une copie : la table peut continuer à modifier son DataFrame sur place
+    assert structure.df is not table.dataframe and structure.df.equals(table.dataframe)
+    assert table.excel_agent.ws.cell(row=start + 1, column=2).value == 'Client modifié'
+    assert table.df_agent.df is table.dataframe
+
+    # Le report dans le classeur est compté dans le tour de la modification, même fini avant l'envoi
+    trace = TurnTrace('saisie')
+    profiler.activate(trace)
+    table.item(start + 3, 1).setText('Pendant le tour')
+    profiler.activate(TurnTrace('tour suivant'))
+    table.flush()
+    profiler.activate(None)
+    assert [span.args.get('parent') for span in trace.spans if span.name == 'excel_writeback'] == ['notify']
+
+
+def test_workbook_cache(tmp_path):
+    path = workbook_for(3000, str(tmp_path))
+    cache = WorkbookCache(str(tmp_path / 'cache'))
+    first = EnhancedTable(str(tmp_path), cache)
+    assert first.load_excel(path)
+
+    # Fichier inchangé : rien n'est relu dans l'Excel
+    table = EnhancedTable(str(tmp_path), cache)
+    assert table.load_excel(path)
+    assert table.excel_agent.wb is None and table.excel_agent.is_opened()
+    assert table.header_row_idx == first.header_row_idx
+    pd.testing.assert_frame_equal(table.dataframe, first.dataframe)
+    assert table.item(3, 0).text() == first.item(3, 0).text() and table.item(3, 0).font().bold()
+    assert table.columnSpan(0, 0) == first.columnSpan(0, 0)
+
+    # Le classeur est chargé à l'enregistrement pour y appliquer les éditions
+    table.item(10, 1).setText('Client modifié')
+    target = str(tmp_path / 'depuis_cache.xlsx')
+    table.flush()
+    table.excel_agent.save(target)
+    saved = pd.read_excel(target, header=table.header_row_idx - 1)
+    assert saved.loc[10 - table.header_row_idx, 'nom'] == 'Client modifié'
+
+    # Fichier modifié : nouvelle clé, donc nouvelle lecture
+    os.utime(path, ns=(0, 0))
+    assert cache.load(cache.key(path)) is None
+
+
+def test_sheet_tabs_share_the_workbook(tmp_path):
+    path = str(tmp_path / 'deux_feuilles.xlsx')
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame({'a': [1, 2, 3]}).to_excel(writer, sheet_name='Ventes', index=False)
+        pd.DataFrame({'client': ['x', 'y'], 'ville': ['Lyon', 'Nice']}).to_excel(writer, sheet_name='Clients', index=False)
+    book = EnhancedTable(str(tmp_path))
+    assert book.load_excel(path)
+    assert book.sheet_name == 'Ventes' and book.excel_agent.sheets == ['Ventes', 'Clients']
+
+    # Deuxième onglet : rien n'est lu avant son activation
+    clients = EnhancedTable(str(tmp_path), excel_agent=book.excel_agent, sheet_name='Clients')
+    assert clients.dataframe is None
+    assert clients.load_sheet() and clients.loaded
+    assert list(clients.dataframe['ville']) == ['Lyon', 'Nice']
+
+    # Chaque onglet écrit dans sa feuille
+    clients.item(2, 1).setText('Paris')
+    book.item(1, 0).setText('10')
+    assert clients.dirty and book.dirty
+    target = str(tmp_path / 'resultat.xlsx')
+    book.flush()
+    book.excel_agent.save(target)
+    assert list(pd.read_excel(target, sheet_name='Clients')['ville']) == ['Lyon', 'Paris']
+    assert list(pd.read_excel(target, sheet_name='Ventes')['a']) == [10, 2, 3]
+
+    clients.unload()
+    assert clients.dataframe is None and not clients.loaded
+
+
+def test_flat_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(flatfile, 'FLAT_CHUNK_ROWS', 100)
+    expected = pd.DataFrame({'ville': ['Orléans', 'Besançon'] * 125, 'ventes': range(250),
+                             'prix': [1.5, None] * 125})
+    path = str(tmp_path / 'export_excel.csv')
+    # Export Excel français : point-virgule et cp1252
+    expected.to_csv(path, sep=';', encoding='cp1252', index=False)
+
+    table = EnhancedTable(str(tmp_path))
+    assert table.load_excel(path)
+    assert table.is_streaming() and table.dataframe is None
+    assert table.item(0, 0).text() == 'ville' and table.item(0, 0).font().bold()
+    assert table.item(2, 0).text() == 'Besançon'
+    while table.is_streaming():
+        table.read_stream_chunk()
+    pd.testing.assert_frame_equal(table.dataframe, expected)
+    assert table.rowCount() == 251 and not table.excel_agent.is_opened()
+    # Valeurs lues dans le DataFrame à l'affichage : aucune cellule n'est recopiée
+    assert (200, 1) not in table.sheet_model.cells
+    assert table.item(200, 1).text() == '199'
+
+    table.item(200, 1).setText('1000')
+    assert table.dataframe.loc[199, 'ventes'] == 1000
+    target = str(tmp_path / 'resultat.csv')
+    table.save_to(target)
+    table.wait_for_save()
+    saved = pd.read_csv(target, encoding='utf-8-sig')
+    assert saved.loc[199, 'ventes'] == 1000 and saved.loc[0, 'ville'] == 'Orléans'
+
+    agent = DataFrameAgent()
+    agent.load(target)
+    pd.testing.assert_frame_equal(agent.df, saved)
+
+
+def test_parquet_round_trip(tmp_path):
+    pytest.importorskip('pyarrow')
+    frame = pd.DataFrame({'a': [1, 2, 3], 'b': ['x', 2, None]})
+    path = str(tmp_path / 'table.parquet')
+    flatfile.export_flat(frame, path, chunk_rows=2)
+    table = EnhancedTable(str(tmp_path))
+    assert table.load_excel(path)
+    while table.is_streaming():
+        table.read_stream_chunk()
+    assert list(table.dataframe['a']) == [1, 2, 3]
+    assert list(table.dataframe['b'][:2]) == ['x', '2']
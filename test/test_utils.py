@@ -35,4 +35,15 @@ def test_extract_func_info():
     assert (func_args[0][1] == df['temperature']).all()
     assert func_names[0] == 'plot'
     assert 'color' in list(func_kwargs[0].keys())
-    assert func_kwargs[0].get('color') == 'r'
\ No newline at end of file
+    assert func_kwargs[0].get('color') == 'r'
+
+
+def test_conversation_end():
+    answer = "Voici le total par client.\n[CODE]\ndef process_data(df):\n    return df\n[/CODE]\nFin."
+    # Morceau par morceau : la conversation s'affiche, le marqueur coupé attend la suite
+    assert conversation_end("Voici le total") == len("Voici le total")
+    assert conversation_end("Voici le total par client.\n[CO") == len("Voici le total par client.\n")
+    assert conversation_end("Voici le total par client.\n[CO", final=True) == len("Voici le total par client.\n[CO")
+    assert conversation_end(answer) == answer.index("[CODE]")
+    assert conversation_end("Réponse :\ndef process") == len("Réponse :\n")
+    assert is_code_answer(answer) and not is_code_answer("Bonjour")